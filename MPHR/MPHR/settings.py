@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'health_records.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +83,57 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Dùng chung giữa các process trên cùng máy (runserver, các worker gunicorn, lệnh manage.py).
+    # LocMemCache chỉ sống trong một process nên không dùng được cho alias này.
+    # Chạy trên nhiều máy: đổi sang Redis, ví dụ
+    #   'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'
+    'health': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'mphr_health_cache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# Cache số liệu trang chủ, bộ đếm hit/miss, tiến độ và cờ huỷ của tác vụ import
+# (alias trong CACHES, phải là backend dùng chung giữa các worker; thời gian sống tính bằng giây)
+HEALTH_STATS_CACHE_ALIAS = 'health'
+HEALTH_STATS_CACHE_TIMEOUT = 3600
+
+# Số dòng mỗi lần ghi khi import hàng loạt (bulk_create / bulk_update)
+HEALTH_IMPORT_CHUNK_SIZE = 500
+
+# Số dòng đọc mỗi lần từ DB khi xuất file (queryset.iterator)
+HEALTH_EXPORT_CHUNK_SIZE = 2000
+
+# Tác vụ import chạy nền (health_records/jobs.py): số luồng xử lý, False = chạy ngay trong request
+HEALTH_IMPORT_WORKERS = 2
+HEALTH_IMPORT_JOBS_ASYNC = True
+
+# Dữ liệu tạm import (health_records/staging.py): batch bỏ dở bị xoá sau TTL (giây),
+# preview tự dọn tối đa một lần mỗi PURGE_INTERVAL giây
+HEALTH_STAGING_TTL = 86400
+HEALTH_STAGING_PURGE_INTERVAL = 600
+# Nơi lưu batch preview: 'table' (HealthRecordTemp/EmployeeTemp) hoặc 'parquet'
+# (mỗi batch một file trong HEALTH_STAGING_DIR, mặc định thư mục tạm hệ thống; cần pyarrow)
+HEALTH_STAGING_BACKEND = 'table'
+HEALTH_STAGING_DIR = None
+# /metrics (Prometheus): đặt chuỗi bí mật để yêu cầu header "Authorization: Bearer <token>".
+# Khi None, /metrics chỉ mở lúc DEBUG = True; ngoài ra trả 404
+HEALTH_METRICS_TOKEN = None
+# Ghi log request chậm hơn ngưỡng này (ms) kèm các câu SQL chậm nhất; None = tắt
+HEALTH_SLOW_REQUEST_MS = None
+# Ngưỡng khởi động lạnh (django.setup() + URLconf) cho lệnh check_startup;
+# đo khoảng 400 ms khi không nạp pandas (khoảng 900 ms nếu nạp)
+HEALTH_STARTUP_BUDGET_MS = 600
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
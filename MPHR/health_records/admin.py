@@ -1,4 +1,6 @@
 from django.contrib import admin
+
+from . import search
 from .models import (
     Department,
     ExaminationType,
@@ -6,6 +8,7 @@ from .models import (
     Employee,
     HealthRecord,
     HealthRecordTemp,
+    ImportJob,
 )
 
 
@@ -31,9 +34,13 @@ class HealthClassificationAdmin(admin.ModelAdmin):
 class EmployeeAdmin(admin.ModelAdmin):
     list_display = ("code", "full_name", "gender", "department", "job_title", "position")
     list_filter = ("department", "gender")
+    # cần cho autocomplete; tìm thực tế qua chỉ mục bỏ dấu (search.py)
     search_fields = ("full_name", "code")
     ordering = ("full_name",)
 
+    def get_search_results(self, request, queryset, search_term):
+        return search.filter_employees(queryset, search_term), False
+
 
 @admin.register(HealthRecord)
 class HealthRecordAdmin(admin.ModelAdmin):
@@ -54,12 +61,19 @@ class HealthRecordAdmin(admin.ModelAdmin):
         "health_classification",
         "employee__department",
     )
-    search_fields = ("employee__full_name", "vaccine_name", "clinic_name")
+    # mã / tên nhân viên tìm qua chỉ mục bỏ dấu, xem get_search_results
+    search_fields = ("vaccine_name", "clinic_name")
     autocomplete_fields = ("employee",)
     date_hierarchy = "exam_date"
     ordering = ("-year", "employee__full_name")
     readonly_fields = ("created_at", "updated_at")
 
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search.tokenize(search_term):
+            results |= search.filter_employees(queryset, search_term, prefix="employee__")
+        return results, may_have_duplicates
+
     fieldsets = (
         ("Thông tin cơ bản", {
             "fields": ("employee", "year", "exam_date", "examination_type", "clinic_name")
@@ -82,4 +96,12 @@ class HealthRecordAdmin(admin.ModelAdmin):
 class HealthRecordTempAdmin(admin.ModelAdmin):
     list_display = ('batch_id','employee_code','employee_name','year','is_valid','created_at')
     search_fields = ('batch_id','employee_code','employee_name')
-    readonly_fields = ('created_at',)
\ No newline at end of file
+    readonly_fields = ('created_at',)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "batch_id", "status", "processed_rows", "total_rows", "created_at", "finished_at")
+    list_filter = ("kind", "status")
+    search_fields = ("batch_id",)
+    readonly_fields = ("created_at", "updated_at", "finished_at")
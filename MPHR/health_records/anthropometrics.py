@@ -0,0 +1,144 @@
+# health_records/anthropometrics.py
+"""
+Báo cáo phân bố BMI và huyết áp tâm thu theo khoa/phòng và năm.
+
+Dữ liệu được nạp bằng một truy vấn `values_list` rồi chuyển thành mảng NumPy;
+histogram, phân vị và số người theo nhóm BMI đều tính trên cả mảng (không lặp
+theo từng hồ sơ). Module này nạp numpy nên chỉ được import bên trong view.
+"""
+import numpy as np
+
+from .models import HealthRecord
+
+# Phân loại BMI cho người trưởng thành châu Á (ngưỡng dưới của mỗi nhóm)
+BMI_CATEGORIES = (
+    ("Thiếu cân", 0),
+    ("Bình thường", 18.5),
+    ("Thừa cân", 23),
+    ("Béo phì", 25),
+)
+# mép các khoảng histogram; giá trị ngoài khoảng được dồn vào khoảng đầu / cuối
+BMI_BIN_EDGES = tuple(range(14, 42, 2))
+SYSTOLIC_BIN_EDGES = tuple(range(80, 210, 10))
+PERCENTILES = (10, 25, 50, 75, 90)
+HYPERTENSION_SYSTOLIC = 140
+NO_DEPARTMENT_LABEL = "Chưa có khoa/phòng"
+
+
+def load_arrays(queryset):
+    """(department, year, bmi, systolic) dạng mảng NumPy từ một truy vấn; ô trống -> NaN."""
+    rows = list(queryset.values_list("employee__department__name", "year", "bmi", "systolic_bp").order_by())
+    if not rows:
+        return np.array([], dtype=object), np.array([], dtype=int), np.array([]), np.array([])
+    departments, years, bmi, systolic = zip(*rows)
+    return (
+        np.array([name or NO_DEPARTMENT_LABEL for name in departments], dtype=object),
+        np.array(years, dtype=int),
+        np.array(bmi, dtype=float),
+        np.array(systolic, dtype=float),
+    )
+
+
+def grouped_histograms(group, values, edges, n_groups):
+    """Ma trận (n_groups, số khoảng): mỗi dòng là histogram của một nhóm (bỏ qua NaN)."""
+    n_bins = len(edges) - 1
+    ok = ~np.isnan(values)
+    bins = np.clip(np.searchsorted(edges, values[ok], side="right") - 1, 0, n_bins - 1)
+    counts = np.bincount(group[ok] * n_bins + bins, minlength=n_groups * n_bins)
+    return counts.reshape(n_groups, n_bins)
+
+
+def grouped_percentiles(group, values, n_groups):
+    """Ma trận (n_groups, len(PERCENTILES)); nhóm không có giá trị -> NaN."""
+    result = np.full((n_groups, len(PERCENTILES)), np.nan)
+    ok = ~np.isnan(values)
+    order = np.lexsort((values[ok], group[ok]))
+    sorted_group, sorted_values = group[ok][order], values[ok][order]
+    bounds = np.searchsorted(sorted_group, np.arange(n_groups + 1))
+    for g in range(n_groups):
+        chunk = sorted_values[bounds[g]:bounds[g + 1]]
+        if len(chunk):
+            result[g] = np.percentile(chunk, PERCENTILES)
+    return result
+
+
+def _summary(bmi_hist, bmi_pct, categories, n_bmi, sys_hist, sys_pct, n_sys, hypertension):
+    def pct(row):
+        return {f"p{p}": (None if np.isnan(v) else round(float(v), 1)) for p, v in zip(PERCENTILES, row)}
+
+    return {
+        "bmi": {
+            "count": int(n_bmi),
+            "histogram": bmi_hist.tolist(),
+            "percentiles": pct(bmi_pct),
+            "categories": dict(zip((label for label, _ in BMI_CATEGORIES), categories.tolist())),
+        },
+        "systolic": {
+            "count": int(n_sys),
+            "histogram": sys_hist.tolist(),
+            "percentiles": pct(sys_pct),
+            "hypertension": int(hypertension),
+        },
+    }
+
+
+def distribution_report(departments, years, bmi, systolic):
+    """Phân bố theo từng (khoa/phòng, năm) và tổng theo năm, từ các mảng của `load_arrays`."""
+    report = {
+        "bmi_bin_edges": list(BMI_BIN_EDGES),
+        "systolic_bin_edges": list(SYSTOLIC_BIN_EDGES),
+        "percentiles": list(PERCENTILES),
+        "years": [],
+        "departments": [],
+    }
+    if not len(years):
+        return report
+
+    bmi_thresholds = np.array([low for _, low in BMI_CATEGORIES[1:]])
+    bmi_category = np.searchsorted(bmi_thresholds, bmi, side="right")
+    n_categories = len(BMI_CATEGORIES)
+
+    def summarize(group, n_groups):
+        has_bmi, has_sys = ~np.isnan(bmi), ~np.isnan(systolic)
+        categories = np.bincount(
+            group[has_bmi] * n_categories + bmi_category[has_bmi], minlength=n_groups * n_categories,
+        ).reshape(n_groups, n_categories)
+        bmi_hist = grouped_histograms(group, bmi, BMI_BIN_EDGES, n_groups)
+        sys_hist = grouped_histograms(group, systolic, SYSTOLIC_BIN_EDGES, n_groups)
+        bmi_pct = grouped_percentiles(group, bmi, n_groups)
+        sys_pct = grouped_percentiles(group, systolic, n_groups)
+        n_bmi = np.bincount(group[has_bmi], minlength=n_groups)
+        n_sys = np.bincount(group[has_sys], minlength=n_groups)
+        hypertension = np.bincount(group[has_sys & (systolic >= HYPERTENSION_SYSTOLIC)], minlength=n_groups)
+        return [
+            _summary(bmi_hist[g], bmi_pct[g], categories[g], n_bmi[g], sys_hist[g], sys_pct[g], n_sys[g],
+                     hypertension[g])
+            for g in range(n_groups)
+        ]
+
+    # tổng theo năm
+    year_values, year_group = np.unique(years, return_inverse=True)
+    totals = np.bincount(year_group, minlength=len(year_values))
+    for year, total, summary in zip(year_values, totals, summarize(year_group, len(year_values))):
+        report["years"].append({"year": int(year), "records": int(total), **summary})
+
+    # theo (khoa/phòng, năm)
+    dept_values, dept_index = np.unique(departments, return_inverse=True)
+    keys, group = np.unique(dept_index * len(year_values) + year_group, return_inverse=True)
+    totals = np.bincount(group, minlength=len(keys))
+    for key, total, summary in zip(keys, totals, summarize(group, len(keys))):
+        report["departments"].append({
+            "department": dept_values[key // len(year_values)],
+            "year": int(year_values[key % len(year_values)]),
+            "records": int(total),
+            **summary,
+        })
+    return report
+
+
+def build_report(year=None):
+    """Báo cáo cho một năm (hoặc mọi năm nếu `year` là None)."""
+    queryset = HealthRecord.objects.all()
+    if year is not None:
+        queryset = queryset.filter(year=year)
+    return distribution_report(*load_arrays(queryset))
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db import connections
+from django.db.models.signals import post_migrate
 
 
 class HealthRecordsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'health_records'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (đăng ký signal)
+        from .jobs import check_shared_cache
+
+        checks.register(check_shared_cache)
+
+        post_migrate.connect(install_search_index, sender=self, dispatch_uid="health_records_search_index")
+
+
+def install_search_index(sender, using="default", **kwargs):
+    # migration "dựng lại bảng" của SQLite làm mất trigger đồng bộ chỉ mục tìm kiếm
+    from . import search
+
+    search.install_index(connections[using])
@@ -0,0 +1,172 @@
+# health_records/exporters.py
+"""
+Xuất hồ sơ sức khỏe theo kiểu streaming: đọc queryset theo từng khối bằng
+`.iterator()` + `values()` và ghi thẳng ra file tạm, nên bộ nhớ không tăng
+theo số hồ sơ.
+"""
+import csv
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+PARQUET_CONTENT_TYPE = 'application/vnd.apache.parquet'
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'parquet')
+
+
+def _text(value):
+    return value or ''
+
+
+# (tiêu đề cột, key trong values(), hàm định dạng)
+EXPORT_COLUMNS = [
+    ('Mã nhân viên', 'employee__code', None),
+    ('Họ và tên', 'employee__full_name', None),
+    ('Khoa/Phòng', 'employee__department__name', _text),
+    ('Năm khám', 'year', None),
+    ('Ngày khám', 'exam_date', None),
+    ('Loại khám', 'examination_type__name', _text),
+    ('Cơ sở khám', 'clinic_name', _text),
+    ('Chiều cao (cm)', 'height_cm', None),
+    ('Cân nặng (kg)', 'weight_kg', None),
+    ('Huyết áp (mmHg)', 'blood_pressure', None),
+    ('Phân loại sức khỏe', 'health_classification__name', _text),
+    ('Kết luận', 'conclusion', None),
+    ('Đã tiêm vắc-xin', 'vaccinated', lambda v: 'Có' if v else 'Không'),
+    ('Tên vắc-xin', 'vaccine_name', _text),
+    ('Ngày tiêm', 'vaccination_date', None),
+    ('Trạng thái', 'status', None),
+    ('Ghi chú', 'note', _text),
+]
+
+EXPORT_HEADERS = [header for header, _, _ in EXPORT_COLUMNS]
+
+
+def get_chunk_size():
+    return getattr(settings, 'HEALTH_EXPORT_CHUNK_SIZE', 2000)
+
+
+def export_values(queryset, chunk_size=None, formatted=True):
+    """
+    Sinh từng dòng dữ liệu (list, cùng thứ tự EXPORT_COLUMNS) mà không nạp hết queryset.
+    `formatted=False` giữ nguyên kiểu dữ liệu gốc (dùng cho Parquet).
+    """
+    rows = (
+        queryset
+        .order_by('-year', 'employee__full_name')
+        .values_list(*(key for _, key, _ in EXPORT_COLUMNS))
+        .iterator(chunk_size=chunk_size or get_chunk_size())
+    )
+    if not formatted:
+        yield from (list(row) for row in rows)
+        return
+    formatters = [fmt for _, _, fmt in EXPORT_COLUMNS]
+    for row in rows:
+        yield [fmt(value) if fmt else value for fmt, value in zip(formatters, row)]
+
+
+def write_xlsx(queryset, fileobj):
+    """Ghi file Excel bằng workbook write-only của openpyxl (dòng được ghi ra đĩa ngay)."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('HealthRecords')
+    ws.append(EXPORT_HEADERS)
+    for row in export_values(queryset):
+        ws.append(row)
+    wb.save(fileobj)
+
+
+def export_filename(extension):
+    return f"health_records_{timezone.localdate().isoformat()}.{extension}"
+
+
+def xlsx_response(queryset):
+    output = tempfile.TemporaryFile()
+    write_xlsx(queryset, output)
+    output.seek(0)
+    # FileResponse đọc file tạm theo từng khối và đóng (xoá) file khi gửi xong
+    return FileResponse(
+        output, as_attachment=True, filename=export_filename('xlsx'), content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+class Echo:
+    """Đối tượng giả file cho csv.writer: trả lại chuỗi thay vì ghi vào buffer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADERS)
+    for row in export_values(queryset):
+        yield writer.writerow(row)
+
+
+def csv_response(queryset):
+    response = StreamingHttpResponse(csv_rows(queryset), content_type=CSV_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{export_filename("csv")}"'
+    return response
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    text = pa.string()
+    types = {
+        'year': pa.int32(),
+        'exam_date': pa.date32(),
+        'vaccination_date': pa.date32(),
+        'height_cm': pa.decimal128(6, 2),
+        'weight_kg': pa.decimal128(6, 2),
+        'vaccinated': pa.bool_(),
+    }
+    return pa.schema([(header, types.get(key, text)) for header, key, _ in EXPORT_COLUMNS])
+
+
+def write_parquet(queryset, fileobj, chunk_size=None):
+    """Ghi Parquet theo từng row group (mỗi khối `chunk_size` dòng), cột có kiểu rõ ràng."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    chunk_size = chunk_size or get_chunk_size()
+    schema = parquet_schema()
+
+    def flush(batch, writer):
+        columns = list(zip(*batch))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema,
+        ))
+
+    with pq.ParquetWriter(fileobj, schema, compression='snappy') as writer:
+        batch = []
+        for row in export_values(queryset, chunk_size=chunk_size, formatted=False):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                flush(batch, writer)
+                batch = []
+        if batch:
+            flush(batch, writer)
+
+
+def parquet_response(queryset):
+    output = tempfile.TemporaryFile()
+    write_parquet(queryset, output)
+    output.seek(0)
+    return FileResponse(
+        output, as_attachment=True, filename=export_filename('parquet'), content_type=PARQUET_CONTENT_TYPE,
+    )
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -1,7 +1,36 @@
 from django import forms
+from django.urls import reverse_lazy
 from .models import HealthRecord, Employee, Department, ExaminationType, HealthClassification
 
 
+class EmployeeAutocompleteWidget(forms.Select):
+    """
+    Ô chọn nhân viên tìm qua AJAX (view employee_autocomplete): chỉ render option của
+    nhân viên đang chọn thay vì toàn bộ danh sách. Script trong healthrecord_form.html
+    thêm ô tìm kiếm cho các select có `data-autocomplete-url`.
+    """
+
+    def __init__(self, attrs=None):
+        super().__init__(attrs={
+            "class": "form-select", "data-autocomplete-url": reverse_lazy("employee_autocomplete"), **(attrs or {}),
+        })
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [v for v in value if v.isdigit()]
+        choices = [("", "---------")]
+        if selected:
+            field = self.choices.field
+            choices += [
+                (field.prepare_value(obj), field.label_from_instance(obj))
+                for obj in self.choices.queryset.filter(pk__in=selected)
+            ]
+        return [
+            (None, [self.create_option(name, option_value, label, str(option_value) in value, index, attrs=attrs)],
+             index)
+            for index, (option_value, label) in enumerate(choices)
+        ]
+
+
 class HealthRecordForm(forms.ModelForm):
     class Meta:
         model = HealthRecord
@@ -13,7 +42,7 @@ class HealthRecordForm(forms.ModelForm):
             "result_file", "note", "status"
         ]
         widgets = {
-            "employee": forms.Select(attrs={"class": "form-select"}),
+            "employee": EmployeeAutocompleteWidget(),
             "year": forms.NumberInput(attrs={"class": "form-control", "placeholder": "VD: 2025"}),
             "exam_date": forms.DateInput(attrs={"type": "date", "class": "form-control"}),
             "examination_type": forms.Select(attrs={"class": "form-select"}),
@@ -0,0 +1,732 @@
+# health_records/importers.py
+"""
+Tiện ích dùng chung cho các luồng import Excel: tra cứu danh mục / nhân viên
+theo lô (vài truy vấn cho cả file) thay vì truy vấn theo từng dòng.
+"""
+import re
+import traceback
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from . import rollup, staging, stats
+from .jobs import JobCancelled, raise_if_cancelled, report_progress
+from .readers import estimate_rows, get_chunk_size, iter_row_chunks
+from .models import (
+    BLOOD_PRESSURE_PATTERN, BLOOD_PRESSURE_RANGE, Department, Employee, EmployeeTemp, ExaminationType,
+    HealthClassification, HealthRecord, HealthRecordTemp, compute_bmi,
+)
+
+
+def normalize_key(value):
+    """Khoá so khớp cho giá trị đọc từ file: bỏ khoảng trắng thừa, không phân biệt hoa thường."""
+    if value is None:
+        return ""
+    return str(value).strip().upper()
+
+
+def stored_key(value):
+    """Khoá cho giá trị trong DB: không strip, giống so khớp `__iexact`."""
+    return str(value).upper()
+
+
+def build_name_map(queryset, field="name"):
+    """
+    Nạp cả danh mục (bảng nhỏ) thành dict {tên chuẩn hoá: object}.
+    Giữ object đầu tiên theo ordering của model, giống `.filter(...).first()`.
+    """
+    result = {}
+    for obj in queryset:
+        result.setdefault(stored_key(getattr(obj, field)), obj)
+    return result
+
+
+def build_employee_map(codes=None):
+    """
+    Tra cứu nhân viên cho tất cả mã trong file bằng một truy vấn.
+    Trả về {mã chuẩn hoá: row} với row có các thuộc tính id, code, full_name.
+    `codes=None`: nạp cả bảng nhân viên (khi đọc file theo khối, chưa biết hết các mã).
+    """
+    keys = None if codes is None else {normalize_key(c) for c in codes if normalize_key(c)}
+    if keys is not None and not keys:
+        return {}
+    rows = Employee.objects.order_by("id")
+    if keys is not None and len(keys) <= connection.features.max_query_params:
+        rows = rows.annotate(code_key=Upper("code")).filter(code_key__in=keys)
+    # file lớn hơn giới hạn tham số của DB: đọc cả bảng nhân viên (vẫn 1 truy vấn)
+    result = {}
+    for row in rows.values_list("id", "code", "full_name", named=True):
+        key = stored_key(row.code)
+        if keys is None or key in keys:
+            result.setdefault(key, row)
+    return result
+
+
+def chunked(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Các field được ghi khi import (giống `defaults` của update_or_create trước đây)
+HEALTHRECORD_IMPORT_FIELDS = [
+    "exam_date", "examination_type", "clinic_name", "height_cm", "weight_kg", "bmi", "blood_pressure",
+    "systolic_bp", "diastolic_bp", "health_classification", "conclusion_text", "conclusion", "vaccinated", "vaccine_name", "vaccination_date",
+    "note",
+]
+
+
+def temp_record_year(temp):
+    return temp.year or (temp.exam_date.year if temp.exam_date else timezone.now().year)
+
+
+def upsert_health_records(temps, chunk_size=None, progress=None):
+    """
+    Ghi HealthRecord từ các dòng HealthRecordTemp theo lô.
+
+    Khoá ngoại được tra cứu một lần cho cả batch, các dòng được chia thành
+    thêm mới / cập nhật theo khoá (employee, year) rồi ghi bằng bulk_create
+    (ON CONFLICT DO UPDATE nếu DB hỗ trợ) hoặc bulk_update, mỗi lần `chunk_size` dòng.
+    `progress(số dòng đã ghi)` (nếu có) được gọi sau mỗi khối.
+    Trả về {'created': ..., 'updated': ..., 'skipped': ...}.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    temps = list(temps)
+    employee_map = build_employee_map(t.employee_code for t in temps)
+    exam_type_map = build_name_map(ExaminationType.objects.all())
+    hc_map = build_name_map(HealthClassification.objects.all())
+
+    # dòng sau ghi đè dòng trước nếu trùng (employee, year), như khi lặp update_or_create
+    records = {}
+    skipped = 0
+    for t in temps:
+        emp = employee_map.get(normalize_key(t.employee_code))
+        if emp is None:
+            skipped += 1
+            continue
+        year = temp_record_year(t)
+        records[(emp.id, year)] = HealthRecord(
+            employee_id=emp.id,
+            year=year,
+            exam_date=t.exam_date,
+            examination_type=exam_type_map.get(normalize_key(t.examination_type_name)),
+            clinic_name=t.clinic_name,
+            height_cm=t.height_cm,
+            weight_kg=t.weight_kg,
+            bmi=compute_bmi(t.height_cm, t.weight_kg),
+            blood_pressure=t.blood_pressure,
+            systolic_bp=t.systolic_bp,
+            diastolic_bp=t.diastolic_bp,
+            health_classification=hc_map.get(normalize_key(t.health_classification_name)),
+            conclusion_text=t.conclusion_text,
+            vaccinated=t.vaccinated,
+            vaccine_name=t.vaccine_name if t.vaccinated else None,
+            vaccination_date=t.vaccination_date,
+            note=t.note,
+        )
+
+    existing = {}
+    years = {year for _, year in records}
+    for emp_ids in chunked({emp_id for emp_id, _ in records}, chunk_size):
+        rows = HealthRecord.objects.filter(employee_id__in=emp_ids, year__in=years)
+        for pk, emp_id, year in rows.values_list("id", "employee_id", "year"):
+            existing[(emp_id, year)] = pk
+
+    to_create = [rec for key, rec in records.items() if key not in existing]
+    to_update = [rec for key, rec in records.items() if key in existing]
+
+    if connection.features.supports_update_conflicts_with_target:
+        batches = [("upsert", chunk) for chunk in chunked(records.values(), chunk_size)]
+    else:
+        now = timezone.now()
+        for rec in to_update:
+            rec.pk = existing[(rec.employee_id, rec.year)]
+            rec.updated_at = now
+        batches = [("create", chunk) for chunk in chunked(to_create, chunk_size)]
+        batches += [("update", chunk) for chunk in chunked(to_update, chunk_size)]
+
+    written = 0
+    for mode, chunk in batches:
+        if mode == "upsert":
+            HealthRecord.objects.bulk_create(
+                chunk,
+                update_conflicts=True,
+                unique_fields=["employee", "year"],
+                update_fields=HEALTHRECORD_IMPORT_FIELDS + ["updated_at"],
+            )
+        elif mode == "create":
+            HealthRecord.objects.bulk_create(chunk)
+        else:
+            HealthRecord.objects.bulk_update(chunk, HEALTHRECORD_IMPORT_FIELDS + ["updated_at"])
+        written += len(chunk)
+        if progress:
+            progress(written)
+
+    return {"created": len(to_create), "updated": len(to_update), "skipped": skipped}
+
+
+# ========== ĐỌC FILE EXCEL ==========
+def parse_date_cell(raw):
+    """Trả về datetime.date hoặc None. Hỗ trợ pd.Timestamp, Excel serial, và nhiều format string."""
+    if raw is None or (isinstance(raw, float) and pd.isna(raw)):
+        return None
+    if isinstance(raw, (pd.Timestamp, datetime)):
+        try:
+            return raw.date()
+        except:
+            pass
+    try:
+        ts = pd.to_datetime(raw, errors='coerce', dayfirst=True)
+        if pd.notna(ts):
+            return ts.date()
+    except:
+        pass
+    s = str(raw).strip()
+    # remove surrounding quotes
+    if (s.startswith('"') and s.endswith('"')) or (s.startswith("'") and s.endswith("'")):
+        s = s[1:-1].strip()
+    # normalize separators
+    s2 = re.sub(r'[.\-]', '/', s)
+    for fmt in ("%d/%m/%Y", "%d/%m/%y", "%Y/%m/%d", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(s2, fmt).date()
+        except:
+            pass
+    return None
+
+# ------------------------------
+# Parse file import hồ sơ theo cột (vectorized)
+# ------------------------------
+# Tên cột trong file mẫu; cột đầu tiên có trong file được dùng
+HEALTHRECORD_COLUMNS = {
+    'code': ('Mã nhân viên', 'Mã NV', 'Ma nhan vien'),
+    'full_name': ('Họ và tên', 'Ho va ten'),
+    'year': ('Năm khám',),
+    'exam_date': ('Ngày khám',),
+    'exam_type': ('Loại khám',),
+    'clinic': ('Cơ sở khám',),
+    'height': ('Chiều cao (cm)',),
+    'weight': ('Cân nặng (kg)',),
+    'blood_pressure': ('Huyết áp (mmHg)',),
+    'health_class': ('Phân loại sức khoẻ',),
+    'conclusion': ('Kết luận (nếu muốn nhập tay)',),
+    'vaccine': ('Đã tiêm vắc-xin',),
+    'vaccination_date': ('Ngày tiêm chủng',),
+    'note': ('Ghi chú',),
+}
+
+# Định dạng ngày phổ biến được parse theo cả cột; ô còn lại dùng parse_date_cell
+VECTOR_DATE_FORMATS = ("%d/%m/%Y",)
+
+
+def _column(df, key):
+    """Cột tương ứng trong file (index 0..n-1, kiểu object) hoặc cột rỗng nếu thiếu."""
+    for name in HEALTHRECORD_COLUMNS[key]:
+        if name in df.columns:
+            return df[name].astype(object).where(df[name].notna(), None)
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def _truthy(col):
+    """Mặt nạ các ô có giá trị (tương đương `if value:` với ô không rỗng)."""
+    return col.notna() & ~col.isin(["", 0])
+
+
+def _text(col):
+    """`str(value).strip() if value else None` cho cả cột."""
+    return col.where(_truthy(col)).astype(str).str.strip().where(_truthy(col), None)
+
+
+def _nullable(col):
+    """Chuyển NaN / NA thành None (giá trị Python thuần khi tạo object)."""
+    return col.astype(object).where(col.notna(), None)
+
+
+def _not_blank(col):
+    return col.notna() & (col.astype(str).str.strip() != "")
+
+
+def parse_date_column(col):
+    """Parse cả cột ngày; trả về Series datetime.date / None."""
+    result = pd.Series([None] * len(col), index=col.index, dtype=object)
+    pending = _not_blank(col)
+
+    is_ts = col.map(lambda v: isinstance(v, (pd.Timestamp, datetime)))
+    if is_ts.any():
+        result[is_ts] = pd.to_datetime(col[is_ts]).dt.date
+        pending &= ~is_ts
+
+    is_str = pending & col.map(lambda v: isinstance(v, str))
+    for fmt in VECTOR_DATE_FORMATS:
+        if not is_str.any():
+            break
+        parsed = pd.to_datetime(col[is_str], format=fmt, errors='coerce')
+        ok = parsed.notna()
+        ok_index = ok[ok].index
+        result[ok_index] = parsed[ok_index].dt.date
+        pending[ok_index] = False
+        is_str[ok_index] = False
+
+    # phần còn lại (Excel serial, định dạng lạ...) parse như trước, mỗi giá trị khác nhau một lần
+    if pending.any():
+        leftover = col[pending]
+        parsed = {value: parse_date_cell(value) for value in leftover.unique()}
+        result[pending] = leftover.map(parsed.__getitem__)
+    return result
+
+
+def parse_number_column(col, unit):
+    """`float(str(v).replace(',', '.').replace(unit, '').strip())` cho cả cột; lỗi -> NaN."""
+    cleaned = col.astype(str).str.replace(',', '.', regex=False).str.replace(unit, '', regex=False).str.strip()
+    return pd.to_numeric(cleaned.where(_not_blank(col)), errors='coerce')
+
+
+def parse_blood_pressure_column(col):
+    """`models.parse_blood_pressure` cho cả cột: (tâm thu, tâm trương) kiểu Int64, NA nếu không đọc được."""
+    parts = col.where(_truthy(col)).astype(str).str.extract(BLOOD_PRESSURE_PATTERN)
+    systolic = pd.to_numeric(parts[0]).astype('Int64')
+    diastolic = pd.to_numeric(parts[1]).astype('Int64')
+    low, high = BLOOD_PRESSURE_RANGE
+    ok = (systolic.between(low, high) & diastolic.between(low, high)).fillna(False).astype(bool)
+    return systolic.where(ok), diastolic.where(ok)
+
+
+def parse_vaccine_column(col):
+    """Tách ô vắc-xin theo ';' hoặc ',' và nối lại bằng '; ' (None nếu rỗng)."""
+    names = (
+        col.where(_truthy(col)).astype(str).str.strip()
+        .str.replace(r'\s*[;,][\s;,]*', '; ', regex=True)
+        .str.strip('; ')
+    )
+    return names.where(_truthy(col) & (names != ''), None)
+
+
+def _accumulate_errors(checks, index):
+    """Nối các thông báo lỗi (theo thứ tự `checks`) của từng dòng bằng '; '."""
+    message = pd.Series("", index=index, dtype=object)
+    for mask, text in checks:
+        message = message + np.where(mask, text + "; ", "")
+    message = message.str.rstrip("; ")
+    return message.where(message != "", None)
+
+
+def parse_healthrecord_frame(df, batch_id, employee_map, hc_map):
+    """
+    Parse DataFrame đọc từ file import hồ sơ thành danh sách HealthRecordTemp.
+    Mọi bước chuẩn hoá / kiểm tra chạy trên cả cột; chỉ bước tạo object là theo dòng.
+    """
+    df = df.reset_index(drop=True)
+
+    code = _text(_column(df, 'code'))
+    has_code = code.notna() & (code != "")
+    code_keys = code.where(has_code, "").str.upper()
+    emp_found = has_code & code_keys.isin(list(employee_map))
+    emp_names = code_keys.where(emp_found).map(lambda k: employee_map[k].full_name, na_action='ignore')
+
+    raw_exam_date = _column(df, 'exam_date')
+    exam_date = parse_date_column(raw_exam_date)
+    raw_vac_date = _column(df, 'vaccination_date')
+    vac_date = parse_date_column(raw_vac_date)
+
+    height_raw, weight_raw = _column(df, 'height'), _column(df, 'weight')
+    height = parse_number_column(height_raw, 'cm')
+    weight = parse_number_column(weight_raw, 'kg')
+    bp_raw = _column(df, 'blood_pressure')
+    systolic, diastolic = parse_blood_pressure_column(bp_raw)
+
+    health_class = _text(_column(df, 'health_class'))
+    hc_missing = health_class.notna() & ~health_class.str.upper().isin(list(hc_map))
+
+    vaccine_names = parse_vaccine_column(_column(df, 'vaccine'))
+    vaccinated = vaccine_names.notna() | (_truthy(raw_vac_date) & vac_date.notna())
+
+    # năm: lấy từ cột "Năm khám" nếu là số nguyên, ngược lại lấy theo ngày khám
+    year_raw = _column(df, 'year')
+    year_str = year_raw.astype(str).str.strip()
+    year_ok = year_raw.notna() & year_str.str.isdigit()
+    exam_year = exam_date.map(lambda d: d.year, na_action='ignore')
+    year = pd.to_numeric(year_str.where(year_ok), errors='coerce').where(year_ok, exam_year).astype('Int64')
+
+    blocking = [
+        (~has_code, "Thiếu Mã nhân viên"),
+        (has_code & ~emp_found, "Mã nhân viên không tồn tại"),
+        (_not_blank(raw_exam_date) & exam_date.isna(), "Ngày khám không hợp lệ"),
+        (_not_blank(raw_vac_date) & vac_date.isna(), "Ngày tiêm không hợp lệ"),
+        (_not_blank(height_raw) & height.isna(), "Chiều cao không đúng định dạng"),
+        (_not_blank(weight_raw) & weight.isna(), "Cân nặng không đúng định dạng"),
+    ]
+    is_valid = ~np.logical_or.reduce([mask.to_numpy(dtype=bool) for mask, _ in blocking])
+    # phân loại chưa có trong danh mục / huyết áp không đọc được chỉ là cảnh báo (không chặn lưu)
+    warnings = [
+        (hc_missing, "Phân loại sức khoẻ chưa có trong danh mục"),
+        (_not_blank(bp_raw) & systolic.isna(), "Huyết áp không đúng định dạng tâm thu/tâm trương"),
+    ]
+    error_message = _accumulate_errors(blocking + warnings, df.index)
+
+    columns = {
+        'employee_code': code.where(code.notna(), ""),
+        'employee_name': emp_names.where(emp_found, _text(_column(df, 'full_name'))),
+        'year': _nullable(year),
+        'exam_date': exam_date,
+        'examination_type_name': _text(_column(df, 'exam_type')),
+        'clinic_name': _text(_column(df, 'clinic')),
+        'height_cm': _nullable(height),
+        'weight_kg': _nullable(weight),
+        'blood_pressure': _text(bp_raw),
+        'systolic_bp': _nullable(systolic),
+        'diastolic_bp': _nullable(diastolic),
+        'health_classification_name': health_class,
+        'conclusion_text': _text(_column(df, 'conclusion')),
+        'vaccinated': vaccinated,
+        'vaccine_name': vaccine_names.where(vaccinated, None),
+        'vaccination_date': vac_date,
+        'note': _text(_column(df, 'note')),
+        'is_valid': pd.Series(is_valid, index=df.index),
+        'error_message': error_message,
+    }
+    names = list(columns)
+    rows = zip(*(columns[name].tolist() for name in names))
+    return [HealthRecordTemp(batch_id=batch_id, **dict(zip(names, row))) for row in rows]
+
+
+# ========== NHÂN VIÊN ==========
+# Tên cột trong file mẫu nhân viên (tên đầu tiên là tên chuẩn)
+EMPLOYEE_COLUMNS = {
+    'code': ('Mã nhân viên', 'Mã NV', 'Ma nhan vien'),
+    'full_name': ('Họ và tên', 'Ho va ten'),
+    'department': ('Khoa/Phòng',),
+    'gender': ('Giới tính',),
+    'job_title': ('Chức danh nghề nghiệp',),
+    'position': ('Chức vụ',),
+    'birth_year': ('Năm sinh',),
+}
+
+
+def parse_employee_frame(df, batch_id, department_map, create_departments=False):
+    """
+    Kiểm tra từng dòng file nhân viên, trả về list EmployeeTemp (chưa lưu).
+    Với `create_departments`, Khoa/Phòng chưa có chỉ là cảnh báo (được tạo khi lưu).
+    """
+    temp_objects = []
+    for _, row in df.iterrows():
+        code = row.get('Mã nhân viên')
+        full_name = row.get('Họ và tên')
+        dept_name = row.get('Khoa/Phòng')
+        gender = row.get('Giới tính')
+        job_title = row.get('Chức danh nghề nghiệp')
+        position = row.get('Chức vụ')
+        birth_year = row.get('Năm sinh')
+
+        if pd.isna(code): code = None
+        if pd.isna(full_name): full_name = None
+        if pd.isna(dept_name): dept_name = None
+        if pd.isna(gender): gender = None
+        if pd.isna(job_title): job_title = None
+        if pd.isna(position): position = None
+        if pd.isna(birth_year): birth_year = None
+
+        is_valid = True
+        error_message = None
+
+        if not code or not full_name:
+            is_valid = False
+            error_message = "Thiếu mã nhân viên hoặc họ tên"
+        elif dept_name and normalize_key(dept_name) not in department_map:
+            if create_departments:
+                error_message = f"Khoa/Phòng '{dept_name}' sẽ được tạo mới"
+            else:
+                is_valid = False
+                error_message = f"Khoa/Phòng '{dept_name}' chưa tồn tại"
+
+        temp_objects.append(EmployeeTemp(
+            batch_id=batch_id,
+            code=str(code).strip() if code else None,
+            full_name=str(full_name).strip() if full_name else None,
+            birth_year=int(birth_year) if birth_year else None,
+            gender=str(gender).capitalize() if gender else None,
+            job_title=job_title,
+            position=position,
+            department_name=dept_name,
+            is_valid=is_valid,
+            error_message=error_message,
+        ))
+    return temp_objects
+
+
+# Các field được ghi khi import nhân viên (khoá: code)
+EMPLOYEE_IMPORT_FIELDS = ["full_name", "birth_year", "gender", "job_title", "position", "department_id"]
+
+
+def _blank_to_none(value):
+    # NULL và "" trong các cột chữ (chức danh, chức vụ, giới tính) coi là như nhau
+    return None if value == "" else value
+
+
+def create_missing_departments(names, department_map):
+    """Tạo (một câu INSERT) các Khoa/Phòng chưa có trong `department_map`, trả về map mới."""
+    missing = {}
+    for name in names:
+        name = (name or "").strip()
+        if name and normalize_key(name) not in department_map:
+            missing.setdefault(normalize_key(name), name)
+    if not missing:
+        return department_map
+    Department.objects.bulk_create([Department(name=name) for name in missing.values()], ignore_conflicts=True)
+    return build_name_map(Department.objects.all())
+
+
+def upsert_employees(temps, chunk_size=None, progress=None, create_departments=True):
+    """
+    Ghi Employee từ các dòng EmployeeTemp theo lô, khoá theo `code`.
+
+    Khoa/Phòng được tra một lần (thiếu thì tạo nếu `create_departments`), nhân viên
+    hiện có được đọc theo từng khối để chia thành thêm mới / cập nhật / không đổi;
+    chỉ dòng thêm mới và cập nhật được ghi (ON CONFLICT DO UPDATE nếu DB hỗ trợ).
+    `progress(số dòng đã xử lý)` được gọi sau mỗi khối.
+    Trả về {'created': ..., 'updated': ..., 'unchanged': ...}.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    department_map = build_name_map(Department.objects.all())
+    if create_departments:
+        department_map = create_missing_departments((t.department_name for t in temps), department_map)
+
+    # dòng sau ghi đè dòng trước nếu trùng mã, như khi lặp update_or_create
+    employees = {}
+    for t in temps:
+        dept_name = (t.department_name or "").strip()
+        dept = department_map.get(normalize_key(dept_name)) if dept_name else None
+        code = str(t.code).strip()
+        employees[code] = Employee(
+            code=code,
+            full_name=(t.full_name or "").strip(),
+            birth_year=t.birth_year or None,
+            gender=t.gender or None,
+            job_title=t.job_title or "",
+            position=t.position or "",
+            department_id=dept.id if dept else None,
+        )
+
+    upsert = connection.features.supports_update_conflicts_with_target
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    done = 0
+    for chunk in chunked(employees.values(), chunk_size):
+        existing = {
+            row[1]: row
+            for row in Employee.objects.filter(code__in=[e.code for e in chunk])
+            .values_list("id", "code", *EMPLOYEE_IMPORT_FIELDS)
+        }
+        to_create, to_update = [], []
+        # nhân viên đổi khoa / giới tính: các hồ sơ của họ đổi nhóm trong bảng rollup
+        regrouped = []
+        for emp in chunk:
+            row = existing.get(emp.code)
+            if row is None:
+                to_create.append(emp)
+                continue
+            old = dict(zip(EMPLOYEE_IMPORT_FIELDS, row[2:]))
+            if all(_blank_to_none(old[f]) == _blank_to_none(getattr(emp, f)) for f in EMPLOYEE_IMPORT_FIELDS):
+                continue
+            to_update.append(emp)
+            if (old["department_id"], old["gender"]) != (emp.department_id, emp.gender):
+                regrouped.append(row[0])
+            if not upsert:
+                emp.pk = row[0]
+        counts["created"] += len(to_create)
+        counts["updated"] += len(to_update)
+        counts["unchanged"] += len(chunk) - len(to_create) - len(to_update)
+
+        regrouped_records = HealthRecord.objects.filter(employee_id__in=regrouped)
+        before = rollup.snapshot(regrouped_records) if regrouped else None
+        if upsert:
+            if to_create or to_update:
+                Employee.objects.bulk_create(
+                    to_create + to_update,
+                    update_conflicts=True,
+                    unique_fields=["code"],
+                    # search_key do Employee.objects.bulk_create tính lại
+                    update_fields=EMPLOYEE_IMPORT_FIELDS + ["search_key"],
+                )
+        else:
+            Employee.objects.bulk_create(to_create)
+            Employee.objects.bulk_update(to_update, EMPLOYEE_IMPORT_FIELDS)
+        if before is not None:
+            rollup.apply_snapshot(before, regrouped_records)
+
+        done += len(chunk)
+        if progress:
+            progress(done)
+    return counts
+
+
+# ========== TÁC VỤ IMPORT CHẠY NỀN (xem jobs.py) ==========
+def preview_counts(temp_model, batch_id):
+    """Tổng / hợp lệ / lỗi của batch (bảng tạm: một truy vấn aggregate)."""
+    return staging.get_store().counts(temp_model, batch_id)
+
+
+def _stage_chunks(job, path, spec, parse, temp_model, batch_id):
+    """
+    Đọc file theo khối, `parse(df)` -> list object tạm, lưu ngay từng khối vào nơi
+    lưu tạm (lỗi của các dòng đầu hiện ra trước khi đọc hết file) và báo tiến độ.
+    """
+    report_progress(job, 0, total=estimate_rows(path))
+    done = 0
+    with staging.get_store().writer(temp_model, batch_id) as write:
+        for df in iter_row_chunks(path, spec):
+            temps = parse(df)
+            if temps:
+                write(temps)
+            done += len(df)
+            report_progress(job, done)
+    report_progress(job, done, total=done)
+
+
+def preview_healthrecords(job, path, batch_id):
+    """
+    Đọc file hồ sơ sức khỏe đã lưu tạm ở `path` và ghi các dòng vào HealthRecordTemp.
+    File do tác vụ xoá (`jobs.submit(..., cleanup=[path])`).
+    """
+    staging.maybe_purge()
+    try:
+        # file đọc theo khối nên chưa biết trước các mã: nạp cả danh sách nhân viên (1 truy vấn)
+        employee_map = build_employee_map()
+        hc_map = build_name_map(HealthClassification.objects.all())
+        _stage_chunks(job, path, HEALTHRECORD_COLUMNS,
+                      lambda df: parse_healthrecord_frame(df, batch_id, employee_map, hc_map),
+                      HealthRecordTemp, batch_id)
+    except JobCancelled:
+        staging.get_store().delete(HealthRecordTemp, batch_id)
+        raise
+    return preview_counts(HealthRecordTemp, batch_id)
+
+
+def commit_healthrecords(job, batch_id):
+    """Lưu các dòng hợp lệ của batch vào HealthRecord (cả batch trong một transaction)."""
+    store = staging.get_store()
+    temps = store.valid_rows(HealthRecordTemp, batch_id)
+    try:
+        report_progress(job, 0, total=len(temps))
+        with transaction.atomic():
+            # cập nhật bảng rollup một lần cho cả batch thay vì theo từng dòng
+            years = {temp_record_year(t) for t in temps}
+            with rollup.bulk_refresh(HealthRecord.objects.filter(year__in=years)):
+                result = upsert_health_records(temps, progress=lambda done: report_progress(job, done))
+            raise_if_cancelled(job)
+    except JobCancelled:
+        # transaction đã rollback; huỷ = bỏ luôn batch tạm
+        store.delete(HealthRecordTemp, batch_id)
+        raise
+    store.delete(HealthRecordTemp, batch_id)
+    stats.invalidate()
+    return {'created': result['created'], 'updated': result['updated']}
+
+
+def preview_employees(job, path, batch_id, create_departments=False):
+    """
+    Đọc file nhân viên đã lưu tạm ở `path` và ghi các dòng vào EmployeeTemp.
+    File do tác vụ xoá (`jobs.submit(..., cleanup=[path])`).
+    """
+    staging.maybe_purge()
+    try:
+        department_map = build_name_map(Department.objects.all())
+        _stage_chunks(job, path, EMPLOYEE_COLUMNS,
+                      lambda df: parse_employee_frame(df, batch_id, department_map, create_departments),
+                      EmployeeTemp, batch_id)
+    except JobCancelled:
+        staging.get_store().delete(EmployeeTemp, batch_id)
+        raise
+    # lựa chọn lúc xem trước được lưu trong ImportJob.result để bước lưu dùng lại
+    return {**preview_counts(EmployeeTemp, batch_id), 'create_departments': create_departments}
+
+
+def commit_employees(job, batch_id, create_departments=False):
+    """
+    Lưu các dòng hợp lệ của batch vào Employee (cả batch trong một transaction).
+    `create_departments` phải giống lựa chọn lúc xem trước.
+    """
+    store = staging.get_store()
+    temps = store.valid_rows(EmployeeTemp, batch_id)
+    try:
+        report_progress(job, 0, total=len(temps))
+        with transaction.atomic():
+            result = upsert_employees(temps, progress=lambda done: report_progress(job, done),
+                                      create_departments=create_departments)
+            raise_if_cancelled(job)
+    except JobCancelled:
+        # transaction đã rollback; huỷ = bỏ luôn batch tạm
+        store.delete(EmployeeTemp, batch_id)
+        raise
+    # Dọn batch tạm sau khi lưu xong
+    store.delete(EmployeeTemp, batch_id)
+    # đã commit: không kiểm tra cờ huỷ nữa
+    job.processed_rows = len(temps)
+    stats.invalidate()
+    return result
+
+
+# ========== IMPORT TRỰC TIẾP (form không dùng AJAX) ==========
+def import_healthrecord_file(path):
+    """
+    Đọc file hồ sơ ở `path` theo khối và ghi thẳng từng dòng (update_or_create).
+    Trả về (số hồ sơ tạo mới, danh sách mã nhân viên không tồn tại / lỗi).
+    """
+    missing_employees = []
+    created_count = 0
+    row_offset = 0
+    for df in iter_row_chunks(path, HEALTHRECORD_COLUMNS):
+        for idx, row in df.iterrows():
+            emp_code = str(row.get('Mã nhân viên') or '').strip()
+            if not emp_code:
+                missing_employees.append(f'(dòng {row_offset+idx+2}: thiếu mã)')
+                continue
+            try:
+                employee = Employee.objects.get(code=emp_code)
+            except Employee.DoesNotExist:
+                missing_employees.append(emp_code)
+                continue
+
+            examination_type = ExaminationType.objects.filter(name=row.get('Loại khám')).first()
+            classification = HealthClassification.objects.filter(name=row.get('Phân loại sức khoẻ')).first()
+
+            # parse boolean vaccinated
+            vaccinated_raw = row.get('Đã tiêm vắc-xin')
+            vaccinated = False
+            if pd.notna(vaccinated_raw):
+                if str(vaccinated_raw).strip().lower() in ['x','có','co','yes','1','true']:
+                    vaccinated = True
+
+            # parse dates safely
+            exam_date = row.get('Ngày khám')
+            vac_date = row.get('Ngày tiêm chủng') or row.get('vaccination_date') or None
+
+            try:
+                rec, created = HealthRecord.objects.update_or_create(
+                    employee=employee,
+                    year=int(row.get('Năm khám')),
+                    defaults={
+                        'exam_date': exam_date if not pd.isna(exam_date) else None,
+                        'examination_type': examination_type,
+                        'clinic_name': row.get('Cơ sở khám'),
+                        'height_cm': row.get('Chiều cao (cm)') if not pd.isna(row.get('Chiều cao (cm)')) else None,
+                        'weight_kg': row.get('Cân nặng (kg)') if not pd.isna(row.get('Cân nặng (kg)')) else None,
+                        'blood_pressure': row.get('Huyết áp (mmHg)'),
+                        'health_classification': classification,
+                        'conclusion_text': row.get('Kết luận (nếu muốn nhập tay)'),
+                        'vaccinated': vaccinated,
+                        'vaccine_name': row.get('Tên vắc-xin'),
+                        'vaccination_date': vac_date if (pd.notna(vac_date) if pd.notna(vac_date) else False) else None,
+                        'note': row.get('Ghi chú'),
+                    }
+                )
+                if created:
+                    created_count += 1
+            except Exception as e:
+                # log but continue
+                traceback.print_exc()
+                missing_employees.append(f"{emp_code} (lỗi: {e})")
+        row_offset += len(df)
+    return created_count, missing_employees
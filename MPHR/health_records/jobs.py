@@ -0,0 +1,183 @@
+# health_records/jobs.py
+"""
+Chạy các tác vụ import (đọc file, lưu batch) trong thread pool của tiến trình
+web thay vì trong request, để file lớn không bị proxy cắt timeout.
+
+Trạng thái, tổng số dòng, lỗi và kết quả được lưu trong bảng ImportJob.
+Tiến độ tức thời và cờ huỷ đi qua cache (cùng alias với stats.py) vì lúc lưu
+batch, tác vụ giữ một transaction dài: ghi vào bảng ImportJob khi đó sẽ không
+hiện ra với request khác, và trên SQLite request huỷ sẽ phải chờ khoá ghi.
+Vì vậy alias này bắt buộc là cache dùng chung giữa các tiến trình (file, Redis...):
+với LocMemCache, yêu cầu huỷ gửi tới worker khác sẽ không bao giờ tới tác vụ
+(`check_shared_cache` cảnh báo khi khởi động). Cờ huỷ được kiểm tra lần cuối
+ngay trước khi transaction lưu batch commit (`raise_if_cancelled`).
+
+Đặt `HEALTH_IMPORT_JOBS_ASYNC = False` để chạy tác vụ ngay trong request (dùng khi test).
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import ImportJob
+from .stats import get_cache
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("pending", "running")
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Tác vụ dừng giữa chừng vì người dùng đã huỷ."""
+
+
+def _progress_key(job_pk):
+    return f"health_records:import_job:{job_pk}:progress"
+
+
+def _cancel_key(job_pk):
+    return f"health_records:import_job:{job_pk}:cancel"
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "HEALTH_IMPORT_WORKERS", 2),
+                thread_name_prefix="health-import",
+            )
+    return _executor
+
+
+def run_async():
+    return getattr(settings, "HEALTH_IMPORT_JOBS_ASYNC", True)
+
+
+def submit(kind, batch_id, func, *args, cleanup=()):
+    """
+    Tạo ImportJob và chạy `func(job, *args)` trong nền.
+    `func` trả về dict kết quả (lưu vào `job.result`). Các file trong `cleanup`
+    (file upload lưu tạm) bị xoá khi tác vụ kết thúc, kể cả khi bị huỷ trước lúc chạy.
+    """
+    job = ImportJob.objects.create(kind=kind, batch_id=batch_id)
+    cleanup = tuple(cleanup)
+    if run_async():
+        # chỉ đưa vào pool khi ImportJob đã commit để luồng nền đọc được
+        transaction.on_commit(lambda: get_executor().submit(_run, job.pk, func, args, cleanup))
+    else:
+        _run(job.pk, func, args, cleanup)
+        job.refresh_from_db()
+    return job
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _run(job_pk, func, args, cleanup=()):
+    in_thread = run_async()
+    if in_thread:
+        close_old_connections()
+    try:
+        job = ImportJob.objects.get(pk=job_pk)
+        if job.status != "pending" or is_cancel_requested(job):
+            _finish(job_pk, "cancelled")
+            return
+        ImportJob.objects.filter(pk=job_pk).update(status="running", updated_at=timezone.now())
+        start = time.perf_counter()
+        try:
+            result = func(job, *args)
+        except JobCancelled:
+            status = "cancelled"
+            _finish(job_pk, status, processed_rows=job.processed_rows)
+        except Exception as e:
+            status = "failed"
+            logger.exception("Tác vụ import %s lỗi", job_pk)
+            _finish(job_pk, status, processed_rows=job.processed_rows, error_message=str(e))
+        else:
+            status = "done"
+            _finish(job_pk, status, processed_rows=job.processed_rows, result=result or {})
+        metrics.observe_import(job.kind, status, job.processed_rows, time.perf_counter() - start)
+    finally:
+        _remove_files(cleanup)
+        get_cache().delete_many([_progress_key(job_pk), _cancel_key(job_pk)])
+        if in_thread:
+            connection.close()
+
+
+def _finish(job_pk, status, **fields):
+    now = timezone.now()
+    ImportJob.objects.filter(pk=job_pk).exclude(status__in=FINISHED_STATUSES) \
+        .update(status=status, finished_at=now, updated_at=now, **fields)
+
+
+def report_progress(job, processed, total=None):
+    """Ghi tiến độ; ném JobCancelled nếu người dùng đã yêu cầu huỷ."""
+    job.processed_rows = processed
+    if total is not None:
+        job.total_rows = total
+        ImportJob.objects.filter(pk=job.pk).update(total_rows=total, updated_at=timezone.now())
+    get_cache().set(_progress_key(job.pk), (job.processed_rows, job.total_rows), timeout=86400)
+    if is_cancel_requested(job):
+        raise JobCancelled()
+
+
+def is_cancel_requested(job):
+    return bool(get_cache().get(_cancel_key(job.pk)))
+
+
+def raise_if_cancelled(job):
+    """Gọi ở cuối transaction lưu batch: huỷ tới sau lần báo tiến độ cuối vẫn rollback được."""
+    if is_cancel_requested(job):
+        raise JobCancelled()
+
+
+def get_progress(job):
+    """(đã xử lý, tổng) — lấy từ cache khi tác vụ đang chạy, từ bảng khi đã xong."""
+    if job.status in ACTIVE_STATUSES:
+        live = get_cache().get(_progress_key(job.pk))
+        if live is not None:
+            return live
+    return job.processed_rows, job.total_rows
+
+
+def cancel(batch_id):
+    """Yêu cầu huỷ mọi tác vụ chưa kết thúc của batch. Trả về số tác vụ bị ảnh hưởng."""
+    job_pks = list(
+        ImportJob.objects.filter(batch_id=batch_id, status__in=ACTIVE_STATUSES).values_list("pk", flat=True)
+    )
+    # tác vụ tự dừng ở lần báo tiến độ tới (hoặc không bắt đầu nếu còn đang chờ)
+    get_cache().set_many({_cancel_key(pk): True for pk in job_pks}, timeout=86400)
+    return len(job_pks)
+
+
+def has_active_job(batch_id, kinds):
+    return ImportJob.objects.filter(batch_id=batch_id, kind__in=kinds, status__in=ACTIVE_STATUSES).exists()
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """System check: tác vụ chạy nền cần cache dùng chung để nhận cờ huỷ / tiến độ."""
+    if not run_async() or not isinstance(get_cache(), LocMemCache):
+        return []
+    return [checks.Warning(
+        "HEALTH_STATS_CACHE_ALIAS trỏ tới LocMemCache: cờ huỷ và tiến độ import không dùng chung giữa các tiến trình.",
+        hint="Cấu hình alias đó bằng cache dùng chung (FileBasedCache, Redis...), xem CACHES trong settings.",
+        id="health_records.W001",
+    )]
@@ -0,0 +1,152 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from health_records import stats, synthetic, views
+from health_records.models import (
+    CONCLUSION_FIT, Department, HealthClassification, HealthRecord, HealthRecordRollup,
+)
+from health_records.pagination import keyset_paginate
+
+# Bảng nhỏ (danh mục, bảng tổng hợp): quét toàn bảng là bình thường
+SMALL_TABLES = {
+    "health_records_department",
+    "health_records_examinationtype",
+    "health_records_healthclassification",
+    "health_records_healthrecordrollup",
+    "health_records_importjob",
+}
+# "SCAN <bảng>" = đọc toàn bảng; "SCAN <bảng> USING INDEX ..." = đọc toàn bộ index rồi tra từng dòng
+# (chỉ chấp nhận khi truy vấn có LIMIT: đọc theo thứ tự index và dừng sớm).
+# "USING COVERING INDEX" chỉ đọc index nên được chấp nhận.
+SCAN_RE = re.compile(r"^SCAN (\S+)(?: AS \S+)?( USING INDEX .*)?$")
+LIMIT_RE = re.compile(r"\sLIMIT\s", re.IGNORECASE)
+
+# (nhãn, view, tham số GET) — {year}, {hc}, {department}, {cursor} được điền từ dữ liệu
+CANONICAL_REQUESTS = [
+    ("Danh sách hồ sơ", views.healthrecord_list, {}),
+    ("Danh sách hồ sơ — trang sau", views.healthrecord_list, {"after": "{cursor}"}),
+    ("Danh sách hồ sơ — lọc năm", views.healthrecord_list, {"year": "{year}"}),
+    ("Danh sách hồ sơ — lọc phân loại", views.healthrecord_list, {"classification": "{hc}"}),
+    ("Danh sách hồ sơ — lọc kết luận", views.healthrecord_list, {"conclusion": CONCLUSION_FIT}),
+    ("Danh sách hồ sơ — tâm thu >= 140 trong năm", views.healthrecord_list,
+     {"year": "{year}", "systolic_min": "140"}),
+    ("Danh sách hồ sơ — lọc đã tiêm", views.healthrecord_list, {"vaccinated": "1"}),
+    ("Danh sách hồ sơ — tìm nhân viên", views.healthrecord_list, {"q": "nguyen van"}),
+    ("Xuất file — lọc năm", views.export_healthrecords_xlsx, {"format": "csv", "year": "{year}"}),
+    ("Xuất file — lọc khoa", views.export_healthrecords_xlsx, {"format": "csv", "department": "{department}"}),
+    ("Xuất file — lọc phân loại", views.export_healthrecords_xlsx,
+     {"format": "csv", "health_classification": "{hc}"}),
+    ("Xuất file — tâm thu >= 140 trong năm", views.export_healthrecords_xlsx,
+     {"format": "csv", "year": "{year}", "systolic_min": "140"}),
+    ("Xuất file — lọc trạng thái", views.export_healthrecords_xlsx, {"format": "csv", "status": "done"}),
+    ("Xuất file — tìm nhân viên", views.export_healthrecords_xlsx, {"format": "csv", "q": "syn0001"}),
+    ("Chọn nhân viên — autocomplete", views.employee_autocomplete, {"q": "nguyen th"}),
+    ("Trang chủ (báo cáo)", views.home, {}),
+    ("Báo cáo BMI / huyết áp — một năm", views.anthropometric_report, {"year": "{year}"}),
+]
+
+
+def scan_failures(plan, sql=""):
+    """Các dòng trong EXPLAIN QUERY PLAN (của câu `sql`) đọc toàn bộ một bảng lớn."""
+    failures = []
+    for detail in plan:
+        match = SCAN_RE.match(detail)
+        if not match or detail == "SCAN CONSTANT ROW":
+            continue
+        table, via_index = match.groups()
+        if table.startswith("(") or table in SMALL_TABLES:
+            continue
+        if via_index and LIMIT_RE.search(sql):
+            continue
+        failures.append(detail)
+    return failures
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Chạy EXPLAIN QUERY PLAN cho các truy vấn chính của danh sách hồ sơ, xuất file và báo cáo "
+        "trên dữ liệu giả; lỗi nếu có truy vấn quét toàn bảng hồ sơ / nhân viên."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--employees", type=int, default=5000,
+                            help="Số nhân viên giả (mỗi người 3 hồ sơ). Mặc định 5000.")
+        parser.add_argument("--use-existing", action="store_true",
+                            help="Kiểm tra trên CSDL hiện tại thay vì tạo CSDL thử nghiệm tạm.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Lệnh này chỉ hỗ trợ SQLite (EXPLAIN QUERY PLAN).")
+        if options["use_existing"]:
+            failures = self.check_plans(options)
+        else:
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.stdout.write(f"Sinh dữ liệu giả: {options['employees']} nhân viên...")
+                synthetic.generate(n_employees=options["employees"])
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+                failures = self.check_plans(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if failures:
+            raise CommandError(f"{failures} truy vấn quét toàn bảng.")
+        self.stdout.write(self.style.SUCCESS("Mọi truy vấn đều dùng index."))
+
+    def placeholders(self):
+        first_page = keyset_paginate(HealthRecord.objects.all(), "exam_date", descending=True, nullable=True,
+                                     page_size=views.HEALTHRECORD_PAGE_SIZE)
+        department = Department.objects.order_by("pk").first()
+        hc = HealthClassification.objects.order_by("pk").first()
+        return {
+            "year": HealthRecordRollup.objects.order_by("-year").values_list("year", flat=True).first() or "",
+            "hc": hc.pk if hc else "",
+            "department": department.pk if department else "",
+            "cursor": first_page.next_cursor or "",
+        }
+
+    def check_plans(self, options):
+        values = self.placeholders()
+        factory = RequestFactory()
+        failures = 0
+        for label, view, params in CANONICAL_REQUESTS:
+            params = {key: str(value).format(**values) for key, value in params.items()}
+            request = factory.get("/", params)
+            stats.invalidate()  # để truy vấn thật sự chạy thay vì đọc cache
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as ctx:
+                response = view(request)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+            elapsed = (time.perf_counter() - start) * 1000
+
+            self.stdout.write(f"\n{label} ({elapsed:.0f} ms, {len(ctx.captured_queries)} truy vấn)")
+            for query in ctx.captured_queries:
+                if not query["sql"].startswith("SELECT"):
+                    continue
+                plan = explain(query["sql"])
+                bad = scan_failures(plan, query["sql"])
+                failures += bool(bad)
+                if bad:
+                    self.stdout.write(self.style.ERROR(f"  ✗ {query['sql'][:200]}"))
+                    for detail in bad:
+                        self.stdout.write(self.style.ERROR(f"      {detail}"))
+                elif options["verbosity"] >= 2:
+                    self.stdout.write(f"  ✓ {query['sql'][:200]}")
+                    for detail in plan:
+                        self.stdout.write(f"      {detail}")
+        return failures
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# thư viện nặng chỉ được nạp khi import / xuất file, không được nạp lúc khởi động
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "pyarrow")
+
+# chạy trong tiến trình Python mới: django.setup() + nạp URLconf (kéo theo views, admin)
+STARTUP_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - start
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({HEAVY_MODULES!r}))
+print(json.dumps({{"ms": elapsed * 1000, "heavy": heavy}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Các import cấp cao nhất từ output `-X importtime`: [(thời gian cộng dồn µs, tên module)]."""
+    result = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        if name.startswith("  "):
+            continue  # import lồng bên trong module khác
+        result.append((int(parts[1]), name.strip()))
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Đo thời gian khởi động lạnh (django.setup() + nạp URLconf) trong tiến trình mới với "
+        "`python -X importtime`; lỗi nếu vượt HEALTH_STARTUP_BUDGET_MS hoặc nạp pandas/numpy/openpyxl."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=3, help="Số lần đo (lấy lần nhanh nhất). Mặc định 3.")
+        parser.add_argument("--budget-ms", type=float, default=None,
+                            help="Ngưỡng (ms), mặc định HEALTH_STARTUP_BUDGET_MS.")
+        parser.add_argument("--top", type=int, default=10, help="Số import chậm nhất được liệt kê.")
+
+    def handle(self, *args, **options):
+        budget = options["budget_ms"] or getattr(settings, "HEALTH_STARTUP_BUDGET_MS", 600)
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "MPHR.settings"))
+
+        best, best_stderr, heavy = None, "", []
+        for _ in range(max(options["runs"], 1)):
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                raise CommandError(f"Khởi động lỗi:\n{proc.stderr[-2000:]}")
+            data = json.loads(proc.stdout.strip().splitlines()[-1])
+            heavy = data["heavy"]
+            if best is None or data["ms"] < best:
+                best, best_stderr = data["ms"], proc.stderr
+
+        self.stdout.write(f"Khởi động: {best:.0f} ms (ngưỡng {budget:.0f} ms)")
+        self.stdout.write("Import chậm nhất:")
+        for cumulative, name in sorted(parse_importtime(best_stderr), reverse=True)[:options["top"]]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+        if heavy:
+            raise CommandError(f"Thư viện nặng bị nạp lúc khởi động: {', '.join(heavy)}")
+        if best > budget:
+            raise CommandError(f"Khởi động {best:.0f} ms vượt ngưỡng {budget:.0f} ms.")
+        self.stdout.write(self.style.SUCCESS("Thời gian khởi động trong ngưỡng."))
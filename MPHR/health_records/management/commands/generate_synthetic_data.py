@@ -0,0 +1,65 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from health_records import synthetic
+
+
+def parse_years(value):
+    try:
+        years = sorted({int(part) for part in value.split(",") if part.strip()})
+    except ValueError:
+        raise CommandError(f"--years không hợp lệ: {value!r} (vd. 2023,2024,2025)")
+    if not years:
+        raise CommandError("--years cần ít nhất một năm.")
+    return years
+
+
+class Command(BaseCommand):
+    help = (
+        "Sinh dữ liệu giả (khoa/phòng, nhân viên tên tiếng Việt, hồ sơ sức khỏe mỗi năm) bằng bulk insert "
+        "vào CSDL hiện tại; tuỳ chọn ghi kèm file Excel import khớp với dữ liệu."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--departments", type=int, default=20, help="Số khoa/phòng. Mặc định 20.")
+        parser.add_argument("--employees", type=int, default=2000, help="Số nhân viên thêm mới. Mặc định 2000.")
+        parser.add_argument("--years", default="2023,2024,2025", help="Các năm có hồ sơ, cách nhau dấu phẩy.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--workbooks", metavar="THƯ_MỤC",
+                            help="Ghi file import nhân viên và hồ sơ năm kế tiếp vào thư mục này.")
+        parser.add_argument("--workbook-rows", type=int, default=None,
+                            help="Số nhân viên hiện có đưa vào mỗi file import (mặc định: tất cả).")
+        parser.add_argument("--workbook-new-employees", type=int, default=0,
+                            help="Số nhân viên mới (chưa có trong CSDL) thêm vào file import nhân viên.")
+
+    def handle(self, *args, **options):
+        years = parse_years(options["years"])
+        start = time.perf_counter()
+        with transaction.atomic():
+            records = synthetic.generate(
+                n_employees=options["employees"], years=years,
+                n_departments=options["departments"], seed=options["seed"],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tạo {options['employees']} nhân viên, {records} hồ sơ ({time.perf_counter() - start:.1f} s)."
+        ))
+
+        directory = options["workbooks"]
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        employee_path = os.path.join(directory, "nhan_vien.xlsx")
+        rows, _ = synthetic.write_employee_workbook(
+            employee_path, limit=options["workbook_rows"], n_new=options["workbook_new_employees"],
+            seed=options["seed"],
+        )
+        self.stdout.write(f"{employee_path}: {rows} dòng")
+        record_year = years[-1] + 1
+        record_path = os.path.join(directory, f"ho_so_{record_year}.xlsx")
+        rows = synthetic.write_healthrecord_workbook(
+            record_path, record_year, limit=options["workbook_rows"], seed=options["seed"],
+        )
+        self.stdout.write(f"{record_path}: {rows} dòng")
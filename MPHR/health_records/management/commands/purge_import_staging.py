@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from health_records import staging
+
+
+class Command(BaseCommand):
+    help = "Xoá dữ liệu tạm import (HealthRecordTemp / EmployeeTemp) đã quá HEALTH_STAGING_TTL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Chỉ đếm, không xoá.")
+
+    def handle(self, *args, **options):
+        self.print_stats("Trước khi dọn")
+        deleted = staging.purge_expired(dry_run=options["dry_run"])
+        verb = "Sẽ xoá" if options["dry_run"] else "Đã xoá"
+        for name, count in deleted.items():
+            self.stdout.write(self.style.SUCCESS(f"{verb} {count} dòng {name}."))
+        if not options["dry_run"]:
+            self.print_stats("Sau khi dọn")
+
+    def print_stats(self, title):
+        self.stdout.write(f"{title}:")
+        for name, info in staging.table_stats().items():
+            oldest = info["oldest"].strftime("%d/%m/%Y %H:%M") if info["oldest"] else "—"
+            self.stdout.write(f"  {name}: {info['rows']} dòng, {info['batches']} batch, cũ nhất {oldest}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from health_records import rollup
+
+
+class Command(BaseCommand):
+    help = "Dựng lại bảng tổng hợp HealthRecordRollup từ toàn bộ hồ sơ sức khỏe."
+
+    def handle(self, *args, **options):
+        groups = rollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Đã dựng lại rollup: {groups} nhóm."))
@@ -0,0 +1,276 @@
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from health_records import stats, synthetic
+from health_records.management.commands.generate_synthetic_data import parse_years
+from health_records.models import Employee, HealthRecord
+from health_records.pagination import encode_cursor
+
+# kịch bản đo, theo thứ tự chạy (mỗi tên ứng với một hàm prepare_<tên>)
+SCENARIOS = (
+    "home",
+    "employee_list",
+    "employee_list_search",
+    "healthrecord_list",
+    "healthrecord_list_deep",
+    "export_csv",
+    "export_xlsx_year",
+    "anthropometric_report",
+    "employee_import_preview",
+    "employee_import_submit",
+    "healthrecord_import_preview",
+    "healthrecord_import_submit",
+)
+# chậm hơn lần chạy trước quá tỉ lệ này thì đánh dấu khi so sánh
+REGRESSION_RATIO = 1.2
+
+
+def parse_sizes(value):
+    try:
+        sizes = sorted({int(part) for part in value.split(",") if part.strip()})
+    except ValueError:
+        raise CommandError(f"--sizes không hợp lệ: {value!r} (vd. 1000,5000)")
+    if not sizes or sizes[0] <= 0:
+        raise CommandError("--sizes cần các số nhân viên dương.")
+    return sizes
+
+
+class Command(BaseCommand):
+    help = (
+        "Đo thời gian, số truy vấn SQL và bộ nhớ đỉnh của các trang chính (trang chủ, danh sách, xuất file, "
+        "import xem trước / lưu) trên dữ liệu giả ở nhiều cỡ, ghi báo cáo JSON để so sánh giữa các lần chạy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,5000",
+                            help="Các cỡ dữ liệu (số nhân viên), cách nhau dấu phẩy. Mặc định 1000,5000.")
+        parser.add_argument("--years", default="2023,2024,2025", help="Các năm có hồ sơ (mỗi nhân viên một hồ sơ/năm).")
+        parser.add_argument("--repeat", type=int, default=3, help="Số lần đo mỗi kịch bản (lấy trung vị).")
+        parser.add_argument("--import-rows", type=int, default=500, help="Số dòng của file import dùng để đo.")
+        parser.add_argument("--output", default="benchmark-report.json", help="File báo cáo JSON.")
+        parser.add_argument("--compare", metavar="REPORT", help="So sánh với một báo cáo JSON trước đó.")
+        parser.add_argument("--use-existing", action="store_true",
+                            help="Chạy trên CSDL hiện tại (dữ liệu giả được thêm vào) thay vì CSDL thử nghiệm tạm.")
+
+    def handle(self, *args, **options):
+        sizes = parse_sizes(options["sizes"])
+        self.years = parse_years(options["years"])
+        self.repeat = max(options["repeat"], 1)
+        self.import_rows = max(options["import_rows"], 5)
+        previous = self.load_report(options["compare"]) if options["compare"] else None
+
+        # Client gửi request với Host "testserver"
+        with override_settings(HEALTH_IMPORT_JOBS_ASYNC=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            if options["use_existing"]:
+                runs = self.run_sizes(sizes)
+            else:
+                old_name = connection.settings_dict["NAME"]
+                connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+                try:
+                    runs = self.run_sizes(sizes)
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+            },
+            "options": {"years": self.years, "repeat": self.repeat, "import_rows": self.import_rows},
+            "runs": runs,
+        }
+        with open(options["output"], "w", encoding="utf-8") as out:
+            json.dump(report, out, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"\nĐã ghi báo cáo: {options['output']}"))
+        if previous:
+            self.compare(previous, report)
+
+    def load_report(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Không đọc được báo cáo {path}: {e}")
+
+    # ---- chạy ----
+    def run_sizes(self, sizes):
+        runs = []
+        with tempfile.TemporaryDirectory(prefix="mphr-bench-") as directory:
+            self.directory = directory
+            for size in sizes:
+                missing = size - Employee.objects.count()
+                if missing > 0:
+                    self.stdout.write(f"\nSinh dữ liệu giả: thêm {missing} nhân viên...")
+                    synthetic.generate(n_employees=missing, years=self.years, seed=size)
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+                runs.append(self.run_size())
+        return runs
+
+    def run_size(self):
+        employees, records = Employee.objects.count(), HealthRecord.objects.count()
+        self.stdout.write(f"\n== {employees} nhân viên, {records} hồ sơ ==")
+        self.client = Client()
+        self.import_year = self.years[-1] + 1
+        self.employee_path = os.path.join(self.directory, "nhan_vien.xlsx")
+        n_new = self.import_rows // 5
+        _, self.new_codes = synthetic.write_employee_workbook(
+            self.employee_path, limit=self.import_rows - n_new, n_new=n_new)
+        self.record_path = os.path.join(self.directory, "ho_so.xlsx")
+        synthetic.write_healthrecord_workbook(self.record_path, self.import_year, limit=self.import_rows)
+
+        results = {}
+        try:
+            for name in SCENARIOS:
+                results[name] = self.measure(getattr(self, f"prepare_{name}"))
+                r = results[name]
+                self.stdout.write(
+                    f"  {name:<30} {r['seconds'] * 1000:9.1f} ms {r['queries']:6d} truy vấn "
+                    f"{r['peak_memory_kb'] / 1024:8.1f} MB"
+                )
+        finally:
+            # trả dữ liệu về như trước khi đo để cỡ dữ liệu sau không bị lệch
+            self.reset_imports()
+        return {"employees": employees, "records": records, "scenarios": results}
+
+    def measure(self, prepare):
+        """
+        Trung vị thời gian qua `repeat` lần và số truy vấn ít nhất (lần đầu có thể tốn thêm truy vấn
+        để nạp cache); thêm một lần chạy dưới tracemalloc để lấy bộ nhớ đỉnh.
+        """
+        timings, queries = [], []
+        for _ in range(self.repeat):
+            action = prepare()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                action()
+                timings.append(time.perf_counter() - start)
+            queries.append(len(ctx.captured_queries))
+        action = prepare()
+        tracemalloc.start()
+        try:
+            action()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            "seconds": statistics.median(timings),
+            "seconds_min": min(timings),
+            "queries": min(queries),
+            "peak_memory_kb": peak // 1024,
+        }
+
+    # ---- request ----
+    def get(self, url_name, params=None):
+        response = self.client.get(reverse(url_name), params or {})
+        if response.status_code != 200:
+            raise CommandError(f"{url_name}: HTTP {response.status_code}")
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def post_import(self, url_name, path=None, args=()):
+        if path:
+            with open(path, "rb") as f:
+                response = self.client.post(reverse(url_name, args=args), {"file": f})
+        else:
+            response = self.client.post(reverse(url_name, args=args))
+        data = response.json()
+        if response.status_code != 202 or data.get("status") != "done":
+            raise CommandError(f"{url_name}: HTTP {response.status_code} {data.get('status')} {data.get('error')}")
+        return data
+
+    def reset_imports(self):
+        Employee.objects.filter(code__in=self.new_codes).delete()
+        Employee.objects.filter(position="Tổ trưởng").update(position="")
+        HealthRecord.objects.filter(year=self.import_year).delete()
+
+    # ---- kịch bản: mỗi hàm chuẩn bị (không tính giờ) rồi trả về thao tác cần đo ----
+    def prepare_home(self):
+        stats.get_cache().clear()  # đo lúc cache trống: tính lại số liệu báo cáo
+        return lambda: self.get("home")
+
+    def prepare_employee_list(self):
+        return lambda: self.get("employee_list", {"sort": "full_name"})
+
+    def prepare_employee_list_search(self):
+        return lambda: self.get("employee_list", {"q": "nguyen thi"})
+
+    def prepare_healthrecord_list(self):
+        return lambda: self.get("healthrecord_list")
+
+    def prepare_healthrecord_list_deep(self):
+        # cursor của hồ sơ ở khoảng 90% danh sách (thứ tự exam_date giảm dần)
+        dated = HealthRecord.objects.exclude(exam_date=None).order_by("-exam_date", "-pk")
+        position = dated.count() * 9 // 10
+        exam_date, pk = dated.values_list("exam_date", "pk")[position]
+        cursor = encode_cursor(exam_date, pk)
+        return lambda: self.get("healthrecord_list", {"after": cursor})
+
+    def prepare_export_csv(self):
+        return lambda: self.get("healthrecord_export", {"format": "csv"})
+
+    def prepare_export_xlsx_year(self):
+        return lambda: self.get("healthrecord_export", {"format": "xlsx", "year": self.years[-1]})
+
+    def prepare_anthropometric_report(self):
+        stats.get_cache().clear()  # đo lúc cache trống
+        return lambda: self.get("anthropometric_report", {"year": self.years[-1]})
+
+    def prepare_employee_import_preview(self):
+        return lambda: self.post_import("employee_import_preview_ajax", self.employee_path)
+
+    def prepare_employee_import_submit(self):
+        self.reset_imports()
+        batch_id = self.post_import("employee_import_preview_ajax", self.employee_path)["batch_id"]
+        return lambda: self.post_import("employee_import_submit_ajax", args=[batch_id])
+
+    def prepare_healthrecord_import_preview(self):
+        return lambda: self.post_import("healthrecord_import_preview_ajax", self.record_path)
+
+    def prepare_healthrecord_import_submit(self):
+        self.reset_imports()
+        batch_id = self.post_import("healthrecord_import_preview_ajax", self.record_path)["batch_id"]
+        return lambda: self.post_import("healthrecord_import_submit_ajax", args=[batch_id])
+
+    # ---- so sánh ----
+    def compare(self, previous, current):
+        self.stdout.write(f"\nSo với báo cáo {previous.get('created_at', '?')}:")
+        old_runs = {run["employees"]: run for run in previous.get("runs", [])}
+        for run in current["runs"]:
+            old = old_runs.get(run["employees"])
+            if old is None:
+                self.stdout.write(f"  {run['employees']} nhân viên: không có trong báo cáo cũ")
+                continue
+            self.stdout.write(f"  {run['employees']} nhân viên:")
+            for name, result in run["scenarios"].items():
+                before = old["scenarios"].get(name)
+                if not before:
+                    continue
+                ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+                line = (
+                    f"    {name:<30} {before['seconds'] * 1000:9.1f} -> {result['seconds'] * 1000:9.1f} ms "
+                    f"(x{ratio:.2f}), truy vấn {before['queries']} -> {result['queries']}"
+                )
+                slower = ratio > REGRESSION_RATIO or result["queries"] > before["queries"]
+                self.stdout.write(self.style.WARNING(line) if slower else line)
@@ -0,0 +1,143 @@
+# health_records/metrics.py
+"""
+Số liệu hiệu năng ở dạng Prometheus (text exposition format 0.0.4), đọc tại /metrics.
+
+- Thời gian xử lý, số truy vấn SQL và thời gian SQL của từng view (RequestMetricsMiddleware).
+- Số dòng và thời gian của các tác vụ import đã xong (jobs.py), từ đó ra số dòng/giây.
+- Kích thước nơi lưu tạm import (staging.table_stats(), tính lúc scrape).
+
+Số liệu nằm trong bộ nhớ của từng tiến trình, không cần thư viện ngoài. Khi chạy nhiều
+worker, mỗi lần scrape chỉ thấy số liệu của worker trả lời request đó.
+"""
+import threading
+from collections import defaultdict
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+# tên -> (loại, mô tả)
+METRICS = {
+    "mphr_http_requests_total": ("counter", "Số request theo view, method và mã trạng thái."),
+    "mphr_http_request_duration_seconds": ("histogram", "Thời gian xử lý request theo view."),
+    "mphr_http_request_sql_queries": ("histogram", "Số truy vấn SQL trong một request theo view."),
+    "mphr_http_request_sql_seconds_total": ("counter", "Tổng thời gian chạy SQL theo view."),
+    "mphr_import_jobs_total": ("counter", "Số tác vụ import theo loại và trạng thái kết thúc."),
+    "mphr_import_rows_total": ("counter", "Tổng số dòng các tác vụ import đã xong đã xử lý."),
+    "mphr_import_seconds_total": ("counter", "Tổng thời gian chạy các tác vụ import đã xong."),
+    "mphr_import_rows_per_second": ("gauge", "Tốc độ (dòng/giây) của tác vụ import xong gần nhất."),
+    "mphr_staging_rows": ("gauge", "Số dòng đang nằm trong nơi lưu tạm import."),
+    "mphr_staging_batches": ("gauge", "Số batch đang nằm trong nơi lưu tạm import."),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # số mẫu rơi vào từng khoảng (chưa cộng dồn)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+_lock = threading.Lock()
+_counters = defaultdict(float)  # (tên, nhãn) -> giá trị
+_gauges = {}
+_histograms = {}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, labels, value=1):
+    with _lock:
+        _counters[name, _labels(labels)] += value
+
+
+def set_gauge(name, labels, value):
+    with _lock:
+        _gauges[name, _labels(labels)] = value
+
+
+def observe(name, labels, value, buckets=DURATION_BUCKETS):
+    key = (name, _labels(labels))
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(buckets)
+        _histograms[key].observe(value)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def observe_request(view, method, status, seconds, queries, sql_seconds):
+    labels = {"view": view}
+    inc("mphr_http_requests_total", {"view": view, "method": method, "status": str(status)})
+    observe("mphr_http_request_duration_seconds", labels, seconds)
+    observe("mphr_http_request_sql_queries", labels, queries, QUERY_BUCKETS)
+    inc("mphr_http_request_sql_seconds_total", labels, sql_seconds)
+
+
+def observe_import(kind, status, rows, seconds):
+    inc("mphr_import_jobs_total", {"kind": kind, "status": status})
+    if status != "done":
+        return
+    inc("mphr_import_rows_total", {"kind": kind}, rows)
+    inc("mphr_import_seconds_total", {"kind": kind}, seconds)
+    if seconds > 0:
+        set_gauge("mphr_import_rows_per_second", {"kind": kind}, rows / seconds)
+
+
+# ---- xuất dạng text ----
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    with _lock:
+        samples = defaultdict(list)
+        for (name, labels), value in sorted(_counters.items()):
+            samples[name].append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), value in sorted(_gauges.items()):
+            samples[name].append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), hist in sorted(_histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                le = labels + (("le", _format_value(float(bound))),)
+                samples[name].append(f"{name}_bucket{_format_labels(le)} {cumulative}")
+            samples[name].append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist.count}")
+            samples[name].append(f"{name}_sum{_format_labels(labels)} {_format_value(hist.sum)}")
+            samples[name].append(f"{name}_count{_format_labels(labels)} {hist.count}")
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        if not samples.get(name):
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples[name])
+    return "\n".join(lines) + "\n"
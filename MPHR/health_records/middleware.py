@@ -0,0 +1,82 @@
+# health_records/middleware.py
+import heapq
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+slow_logger = logging.getLogger("health_records.slow_requests")
+
+# số câu SQL chậm nhất được ghi kèm log request chậm
+SLOW_LOG_QUERIES = 5
+
+
+class QueryRecorder:
+    """execute_wrapper: đếm truy vấn, cộng thời gian và giữ vài câu SQL chậm nhất."""
+
+    def __init__(self, keep=SLOW_LOG_QUERIES):
+        self.keep = keep
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []  # heap (thời gian, thứ tự, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            item = (elapsed, self.count, sql)
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def slowest_queries(self):
+        return [(elapsed, sql) for elapsed, _, sql in sorted(self.slowest, reverse=True)]
+
+
+def view_label(request):
+    # tên URL (vd. "healthrecord_list") thay vì đường dẫn để số nhãn không tăng theo tham số
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match and match.view_name else "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """
+    Ghi thời gian, số truy vấn SQL và thời gian SQL của mỗi request vào metrics.py.
+    Đặt đầu danh sách MIDDLEWARE để tính cả các middleware khác.
+
+    Nếu `HEALTH_SLOW_REQUEST_MS` được đặt, request chậm hơn ngưỡng được ghi log (logger
+    "health_records.slow_requests") kèm các câu SQL chậm nhất. Với response dạng stream
+    (xuất file), thời gian chỉ tính tới khi trả header, phần nội dung sinh sau đó không tính.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        view = view_label(request)
+        metrics.observe_request(view, request.method, response.status_code, elapsed,
+                                recorder.count, recorder.seconds)
+
+        slow_ms = getattr(settings, "HEALTH_SLOW_REQUEST_MS", None)
+        if slow_ms is not None and elapsed * 1000 >= slow_ms:
+            queries = "\n".join(f"  {seconds * 1000:.1f} ms: {sql}" for seconds, sql in recorder.slowest_queries())
+            slow_logger.warning(
+                "Request chậm %s %s (%s): %.0f ms, %d truy vấn SQL (%.0f ms)\n%s",
+                request.method, request.get_full_path(), view, elapsed * 1000,
+                recorder.count, recorder.seconds * 1000, queries,
+            )
+        return response
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Trim, Upper
+
+# kết luận tại thời điểm migration này: nhập tay, nếu không thì sinh từ tên phân loại
+CONCLUSION_FIT = "Đủ sức khoẻ làm việc"
+CONCLUSION_LIMITED = "Làm việc hợp lý"
+FIT_CLASSIFICATIONS = ["I", "II", "III"]
+LIMITED_CLASSIFICATIONS = ["IV"]
+
+
+def build_rollup(apps, schema_editor):
+    HealthRecord = apps.get_model('health_records', 'HealthRecord')
+    HealthRecordRollup = apps.get_model('health_records', 'HealthRecordRollup')
+    rows = (
+        HealthRecord.objects
+        .alias(hc_name=Upper(Trim('health_classification__name')))
+        .annotate(rollup_conclusion=Trim(models.Case(
+            models.When(conclusion_text__gt='', then='conclusion_text'),
+            models.When(hc_name__in=FIT_CLASSIFICATIONS, then=models.Value(CONCLUSION_FIT)),
+            models.When(hc_name__in=LIMITED_CLASSIFICATIONS, then=models.Value(CONCLUSION_LIMITED)),
+            default=models.Value(''),
+            output_field=models.CharField(),
+        )))
+        .values('year', 'employee__department', 'employee__gender', 'health_classification',
+                'rollup_conclusion', 'vaccinated', 'status')
+        .annotate(n=models.Count('id'))
+        .order_by()
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=1000):
+        batch.append(HealthRecordRollup(
+            year=row['year'],
+            department_id=row['employee__department'],
+            gender=row['employee__gender'],
+            health_classification_id=row['health_classification'],
+            conclusion=row['rollup_conclusion'],
+            vaccinated=row['vaccinated'],
+            status=row['status'],
+            count=row['n'],
+        ))
+        if len(batch) == 1000:
+            HealthRecordRollup.objects.bulk_create(batch)
+            batch = []
+    HealthRecordRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0013_healthrecordtemp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthRecordRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(verbose_name='Năm hồ sơ')),
+                ('gender', models.CharField(blank=True, max_length=10, null=True, verbose_name='Giới tính')),
+                ('conclusion', models.CharField(blank=True, default='', max_length=255, verbose_name='Kết luận')),
+                ('vaccinated', models.BooleanField(default=False, verbose_name='Đã tiêm vắc-xin')),
+                ('status', models.CharField(max_length=20, verbose_name='Trạng thái')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Số hồ sơ')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='health_records.department', verbose_name='Khoa/Phòng')),
+                ('health_classification', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='health_records.healthclassification', verbose_name='Phân loại sức khỏe')),
+            ],
+            options={
+                'verbose_name': 'Tổng hợp hồ sơ sức khỏe',
+                'verbose_name_plural': 'Tổng hợp hồ sơ sức khỏe',
+                'ordering': ['-year'],
+                'indexes': [models.Index(fields=['year', 'department', 'health_classification'], name='health_reco_year_f1bec4_idx')],
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0014_healthrecordrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['exam_date', 'id'], name='health_reco_exam_da_18db2d_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0015_healthrecord_exam_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(db_index=True, max_length=50, verbose_name='Mã batch')),
+                ('kind', models.CharField(choices=[('healthrecord_preview', 'Xem trước hồ sơ sức khỏe'), ('healthrecord_submit', 'Lưu hồ sơ sức khỏe'), ('employee_preview', 'Xem trước nhân viên'), ('employee_submit', 'Lưu nhân viên')], max_length=30, verbose_name='Loại tác vụ')),
+                ('status', models.CharField(choices=[('pending', 'Đang chờ'), ('running', 'Đang chạy'), ('done', 'Hoàn tất'), ('failed', 'Lỗi'), ('cancelled', 'Đã huỷ')], default='pending', max_length=20, verbose_name='Trạng thái')),
+                ('total_rows', models.PositiveIntegerField(default=0, verbose_name='Tổng số dòng')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='Số dòng đã xử lý')),
+                ('error_message', models.TextField(blank=True, default='', verbose_name='Lỗi (nếu có)')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Kết quả')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Tạo lúc')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Cập nhật lúc')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Kết thúc lúc')),
+            ],
+            options={
+                'verbose_name': 'Tác vụ import',
+                'verbose_name_plural': 'Tác vụ import',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0016_importjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employeetemp',
+            index=models.Index(fields=['batch_id', 'is_valid', 'id'], name='health_reco_batch_i_dad85f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecordtemp',
+            index=models.Index(fields=['batch_id', 'is_valid', 'id'], name='health_reco_batch_i_0e8851_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0017_temp_preview_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='employeetemp',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='healthrecordtemp',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
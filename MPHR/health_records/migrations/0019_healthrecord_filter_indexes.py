@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0018_temp_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['year', 'exam_date', 'id'], name='health_reco_year_1c8e47_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['health_classification', 'exam_date', 'id'], name='health_reco_health__7958f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['vaccinated', 'exam_date', 'id'], name='health_reco_vaccina_2e5059_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['status', 'year'], name='health_reco_status_6544e2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['conclusion_text'], name='health_reco_conclus_1597f5_idx'),
+        ),
+    ]
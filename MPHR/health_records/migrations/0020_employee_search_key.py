@@ -0,0 +1,84 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:59
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+WORD_RE = re.compile(r"[^\W_]+")
+FTS_TABLE = "health_records_employee_fts"
+FTS_TRIGGERS = (f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au")
+
+
+def fold(text):
+    # bản sao search.fold() tại thời điểm migration này
+    text = unicodedata.normalize("NFD", str(text or "")).replace("đ", "d").replace("Đ", "D")
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def fill_search_keys(apps, schema_editor):
+    # đọc theo từng khối khoá chính (không giữ cursor mở trong lúc ghi cùng bảng)
+    Employee = apps.get_model('health_records', 'Employee')
+    employees = Employee.objects.only('id', 'code', 'full_name').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(employees.filter(pk__gt=last_pk)[:1000])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for emp in batch:
+            emp.search_key = fold(f"{emp.code or ''} {emp.full_name or ''}")
+        Employee.objects.bulk_update(batch, ['search_key'])
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            search_key, content='health_records_employee', content_rowid='id', tokenize='unicode61'
+        )
+    """)
+    schema_editor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON health_records_employee BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, search_key) VALUES (new.id, new.search_key);
+        END
+    """)
+    schema_editor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON health_records_employee BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_key) VALUES ('delete', old.id, old.search_key);
+        END
+    """)
+    schema_editor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_key ON health_records_employee BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_key) VALUES ('delete', old.id, old.search_key);
+            INSERT INTO {FTS_TABLE}(rowid, search_key) VALUES (new.id, new.search_key);
+        END
+    """)
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in FTS_TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0019_healthrecord_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='search_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300, verbose_name='Khoá tìm kiếm'),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
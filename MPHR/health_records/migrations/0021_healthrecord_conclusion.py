@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:16
+
+from django.db import migrations, models
+from django.db.models.functions import Trim
+
+# quy tắc kết luận tại thời điểm migration này (models.compute_conclusion)
+CONCLUSION_FIT = "Đủ sức khoẻ làm việc"
+CONCLUSION_LIMITED = "Làm việc hợp lý"
+FIT_CLASSIFICATIONS = ["I", "II", "III"]
+LIMITED_CLASSIFICATIONS = ["IV"]
+
+
+def classification_conclusion(name):
+    name = (name or "").strip().upper()
+    if name in FIT_CLASSIFICATIONS:
+        return CONCLUSION_FIT
+    if name in LIMITED_CLASSIFICATIONS:
+        return CONCLUSION_LIMITED
+    return ""
+
+
+def fill_conclusions(apps, schema_editor):
+    # một UPDATE cho mỗi phân loại (kể cả hồ sơ chưa phân loại), không nạp hồ sơ lên Python
+    HealthRecord = apps.get_model('health_records', 'HealthRecord')
+    HealthClassification = apps.get_model('health_records', 'HealthClassification')
+    groups = [(HealthRecord.objects.filter(health_classification_id=pk), name)
+              for pk, name in HealthClassification.objects.values_list('pk', 'name').iterator()]
+    groups.append((HealthRecord.objects.filter(health_classification=None), None))
+    for records, name in groups:
+        records.update(conclusion=models.Case(
+            models.When(conclusion_text__gt='', then=Trim('conclusion_text')),
+            default=models.Value(classification_conclusion(name)),
+            output_field=models.CharField(),
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0020_employee_search_key'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='healthrecord',
+            name='health_reco_conclus_1597f5_idx',
+        ),
+        migrations.AddField(
+            model_name='healthrecord',
+            name='conclusion',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Kết luận'),
+        ),
+        migrations.RunPython(fill_conclusions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['conclusion', 'exam_date', 'id'], name='health_reco_conclus_2f0c45_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:20
+
+import re
+
+from django.db import migrations, models
+
+# cách đọc huyết áp tại thời điểm migration này (models.parse_blood_pressure)
+BLOOD_PRESSURE_PATTERN = re.compile(r"(\d{2,3})\s*/\s*(\d{2,3})")
+BLOOD_PRESSURE_RANGE = (30, 300)
+BATCH_SIZE = 1000
+
+
+def parse_blood_pressure(value):
+    match = BLOOD_PRESSURE_PATTERN.search(str(value or ""))
+    if not match:
+        return None, None
+    low, high = BLOOD_PRESSURE_RANGE
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if not (low <= systolic <= high and low <= diastolic <= high):
+        return None, None
+    return systolic, diastolic
+
+
+def fill_blood_pressure(apps, schema_editor):
+    # đọc theo từng khối khoá chính (không giữ cursor mở trong lúc ghi cùng bảng)
+    HealthRecord = apps.get_model('health_records', 'HealthRecord')
+    records = HealthRecord.objects.exclude(blood_pressure=None).only('id', 'blood_pressure').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(records.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for record in batch:
+            record.systolic_bp, record.diastolic_bp = parse_blood_pressure(record.blood_pressure)
+        HealthRecord.objects.bulk_update(
+            [record for record in batch if record.systolic_bp is not None], ['systolic_bp', 'diastolic_bp'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0021_healthrecord_conclusion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthrecord',
+            name='diastolic_bp',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Huyết áp tâm trương'),
+        ),
+        migrations.AddField(
+            model_name='healthrecord',
+            name='systolic_bp',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Huyết áp tâm thu'),
+        ),
+        migrations.AddField(
+            model_name='healthrecordtemp',
+            name='diastolic_bp',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='healthrecordtemp',
+            name='systolic_bp',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_blood_pressure, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['year', 'systolic_bp'], name='health_reco_year_9c9965_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['year', 'diastolic_bp'], name='health_reco_year_806aae_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:23
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# công thức BMI tại thời điểm migration này (models.compute_bmi)
+BMI_RANGE = (5, 100)
+BATCH_SIZE = 1000
+
+
+def compute_bmi(height_cm, weight_kg):
+    if not height_cm or not weight_kg:
+        return None
+    bmi = float(weight_kg) / (float(height_cm) / 100) ** 2
+    low, high = BMI_RANGE
+    if not low <= bmi <= high:
+        return None
+    return Decimal(f"{bmi:.1f}")
+
+
+def fill_bmi(apps, schema_editor):
+    # đọc theo từng khối khoá chính (không giữ cursor mở trong lúc ghi cùng bảng)
+    HealthRecord = apps.get_model('health_records', 'HealthRecord')
+    records = (
+        HealthRecord.objects.exclude(height_cm=None).exclude(weight_kg=None)
+        .only('id', 'height_cm', 'weight_kg').order_by('pk')
+    )
+    last_pk = 0
+    while True:
+        batch = list(records.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        for record in batch:
+            record.bmi = compute_bmi(record.height_cm, record.weight_kg)
+        HealthRecord.objects.bulk_update([record for record in batch if record.bmi is not None], ['bmi'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0022_blood_pressure_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthrecord',
+            name='bmi',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=4, null=True, verbose_name='BMI'),
+        ),
+        migrations.RunPython(fill_bmi, migrations.RunPython.noop),
+    ]
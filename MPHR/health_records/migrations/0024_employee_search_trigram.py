@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:05
+
+from django.db import migrations
+
+FTS_TABLE = "health_records_employee_fts"
+
+
+def recreate_fts_table(tokenizer):
+    # trigger đồng bộ chỉ tham chiếu tên bảng nên giữ nguyên; chỉ tạo lại bảng ảo rồi dựng lại chỉ mục
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        schema_editor.execute(f"""
+            CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+                search_key, content='health_records_employee', content_rowid='id', tokenize='{tokenizer}'
+            )
+        """)
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0023_healthrecord_bmi'),
+    ]
+
+    operations = [
+        # trigram: tìm được một phần mã / họ tên ("0012" -> "NV0012"), không chỉ đầu từ
+        migrations.RunPython(recreate_fts_table('trigram'), recreate_fts_table('unicode61')),
+    ]
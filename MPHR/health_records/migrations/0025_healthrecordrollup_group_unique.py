@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:10
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+GROUP_FIELDS = ('year', 'department', 'gender', 'health_classification', 'conclusion', 'vaccinated', 'status')
+
+
+def merge_duplicate_groups(apps, schema_editor):
+    # hai tác vụ ghi đồng thời có thể đã tạo hai dòng cho cùng một nhóm: gộp lại trước khi thêm ràng buộc
+    HealthRecordRollup = apps.get_model('health_records', 'HealthRecordRollup')
+    duplicates = (
+        HealthRecordRollup.objects.values(*GROUP_FIELDS)
+        .annotate(rows=models.Count('id'), total=models.Sum('count'), keep=models.Min('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for group in list(duplicates):
+        lookup = {field: group[field] for field in GROUP_FIELDS}
+        HealthRecordRollup.objects.filter(pk=group['keep']).update(count=group['total'])
+        HealthRecordRollup.objects.filter(**lookup).exclude(pk=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_records', '0024_employee_search_trigram'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_groups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='healthrecordrollup',
+            constraint=models.UniqueConstraint(models.F('year'), django.db.models.functions.comparison.Coalesce('department', models.Value(0)), django.db.models.functions.comparison.Coalesce('gender', models.Value('')), django.db.models.functions.comparison.Coalesce('health_classification', models.Value(0)), models.F('conclusion'), models.F('vaccinated'), models.F('status'), name='health_records_rollup_group_unique'),
+        ),
+    ]
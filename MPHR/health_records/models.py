@@ -1,7 +1,88 @@
 from django.db import models
+from django.db.models import Case, CharField, Value, When
+from django.db.models.functions import Coalesce, Trim
 from django.utils import timezone
+from decimal import Decimal
+import re
 import uuid
 
+from .search import employee_search_key
+
+
+# Kết luận sinh tự động từ phân loại sức khỏe (dùng chung cho property và SQL)
+CONCLUSION_FIT = "Đủ sức khoẻ làm việc"
+CONCLUSION_LIMITED = "Làm việc hợp lý"
+FIT_CLASSIFICATIONS = ["I", "II", "III"]
+LIMITED_CLASSIFICATIONS = ["IV"]
+
+
+# Huyết áp nhập dạng "tâm thu/tâm trương" (vd. "120/80", "130 / 85 mmHg");
+# importers.py dùng cùng mẫu để parse cả cột
+BLOOD_PRESSURE_PATTERN = r"(\d{2,3})\s*/\s*(\d{2,3})"
+BLOOD_PRESSURE_RANGE = (30, 300)  # ngoài khoảng này coi như nhập sai
+
+
+def parse_blood_pressure(value):
+    """(tâm thu, tâm trương) từ chuỗi huyết áp; (None, None) nếu không đọc được."""
+    match = re.search(BLOOD_PRESSURE_PATTERN, str(value or ""))
+    if not match:
+        return None, None
+    low, high = BLOOD_PRESSURE_RANGE
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if not (low <= systolic <= high and low <= diastolic <= high):
+        return None, None
+    return systolic, diastolic
+
+
+BMI_RANGE = (5, 100)  # ngoài khoảng này coi như chiều cao / cân nặng nhập sai
+
+
+def compute_bmi(height_cm, weight_kg):
+    """Chỉ số BMI (kg/m², làm tròn 1 chữ số) hoặc None nếu thiếu / không hợp lý."""
+    if not height_cm or not weight_kg:
+        return None
+    bmi = float(weight_kg) / (float(height_cm) / 100) ** 2
+    low, high = BMI_RANGE
+    if not low <= bmi <= high:
+        return None
+    return Decimal(f"{bmi:.1f}")
+
+
+def classification_conclusion(name):
+    """Kết luận sinh tự động từ tên phân loại sức khỏe ("" nếu không có quy tắc)."""
+    name = (name or "").strip().upper()
+    if name in FIT_CLASSIFICATIONS:
+        return CONCLUSION_FIT
+    if name in LIMITED_CLASSIFICATIONS:
+        return CONCLUSION_LIMITED
+    return ""
+
+
+def compute_conclusion(conclusion_text, classification_name):
+    """
+    Giá trị cột `HealthRecord.conclusion`: nếu có nhập tay thì dùng, nếu không thì
+    sinh tự động từ phân loại sức khỏe. Luôn bỏ khoảng trắng đầu/cuối.
+    """
+    if conclusion_text:
+        return conclusion_text.strip()
+    return classification_conclusion(classification_name)
+
+
+def classification_conclusion_expression(classification_name):
+    """Biểu thức SQL tương đương `compute_conclusion` cho các hồ sơ cùng phân loại `classification_name`."""
+    return Case(
+        When(conclusion_text__gt="", then=Trim("conclusion_text")),
+        default=Value(classification_conclusion(classification_name)),
+        output_field=CharField(),
+    )
+
+
+def refresh_conclusions(records, classification_name):
+    """
+    Tính lại cột `conclusion` cho các hồ sơ cùng một phân loại (tên `classification_name`)
+    bằng một câu UPDATE. Trả về số hồ sơ được cập nhật.
+    """
+    return records.update(conclusion=classification_conclusion_expression(classification_name))
 
 
 # --- Danh mục Khoa/Phòng ---
@@ -45,6 +126,23 @@ class HealthClassification(models.Model):
 
 
 # --- Nhân viên ---
+class EmployeeQuerySet(models.QuerySet):
+    # bulk_create / bulk_update không gọi save(): tự tính search_key cho từng dòng
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.search_key = employee_search_key(obj.code, obj.full_name)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if {"code", "full_name"} & set(fields):
+            for obj in objs:
+                obj.search_key = employee_search_key(obj.code, obj.full_name)
+            fields = [*fields, "search_key"]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Employee(models.Model):
     code = models.CharField(max_length=50, unique=True, verbose_name="Mã nhân viên")
     full_name = models.CharField(max_length=200, verbose_name="Họ và tên")
@@ -54,6 +152,10 @@ class Employee(models.Model):
     job_title = models.CharField(max_length=200, blank=True, null=True, verbose_name="Chức danh nghề nghiệp")
     position = models.CharField(max_length=200, blank=True, null=True, verbose_name="Chức vụ")
     department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Khoa/Phòng")
+    # mã + họ tên bỏ dấu, viết thường; được đánh chỉ mục FTS5 (xem search.py)
+    search_key = models.CharField(max_length=300, blank=True, default="", editable=False, verbose_name="Khoá tìm kiếm")
+
+    objects = EmployeeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Nhân viên"
@@ -63,6 +165,13 @@ class Employee(models.Model):
     def __str__(self):
         return f"{self.full_name} ({self.code})"
 
+    def save(self, *args, **kwargs):
+        self.search_key = employee_search_key(self.code, self.full_name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"code", "full_name"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "search_key"}
+        super().save(*args, **kwargs)
+
 # --- Dữ liệu tạm import ---
 class EmployeeTemp(models.Model):
     batch_id = models.CharField(max_length=50, verbose_name="Mã batch", db_index=True)
@@ -75,17 +184,48 @@ class EmployeeTemp(models.Model):
     department_name = models.CharField(max_length=100, blank=True, null=True, verbose_name="Tên khoa/phòng")
     is_valid = models.BooleanField(default=True, verbose_name="Hợp lệ")
     error_message = models.TextField(blank=True, null=True, verbose_name="Lỗi (nếu có)")
-    created_at = models.DateTimeField(default=timezone.now)
+    # dùng để dọn batch bỏ dở (xem staging.py)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         verbose_name = "Dữ liệu tạm nhân viên"
         verbose_name_plural = "Dữ liệu tạm nhân viên"
         ordering = ['full_name']
+        # bảng preview: dòng lỗi trước, phân trang keyset theo (is_valid, id)
+        indexes = [
+            models.Index(fields=["batch_id", "is_valid", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.full_name} ({'Hợp lệ' if self.is_valid else 'Lỗi'})"
 
 # --- Hồ sơ sức khỏe từng năm ---
+class HealthRecordQuerySet(models.QuerySet):
+    # bulk_create / bulk_update không gọi save(): tự tính cột conclusion cho từng dòng
+    def _fill_conclusions(self, objs):
+        field = self.model._meta.get_field("health_classification")
+        names = {obj.health_classification_id: obj.health_classification.name
+                 for obj in objs if obj.health_classification_id and field.is_cached(obj)}
+        missing = {obj.health_classification_id for obj in objs if obj.health_classification_id} - set(names)
+        if missing:
+            names.update(HealthClassification.objects.filter(pk__in=missing).values_list("pk", "name"))
+        for obj in objs:
+            obj.conclusion = compute_conclusion(obj.conclusion_text, names.get(obj.health_classification_id))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        self._fill_conclusions(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if {"conclusion_text", "health_classification"} & set(fields):
+            self._fill_conclusions(objs)
+            if "conclusion" not in fields:
+                fields = [*fields, "conclusion"]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class HealthRecord(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, verbose_name="Nhân viên")
     year = models.PositiveIntegerField(verbose_name="Năm hồ sơ")
@@ -99,6 +239,11 @@ class HealthRecord(models.Model):
     height_cm = models.DecimalField("Chiều cao (cm)", max_digits=6, decimal_places=2, blank=True, null=True)
     weight_kg = models.DecimalField("Cân nặng (kg)", max_digits=6, decimal_places=2, blank=True, null=True)
     blood_pressure = models.CharField("Huyết áp (mmHg)", max_length=50, blank=True, null=True)
+    # tính từ chiều cao / cân nặng khi lưu / import (xem compute_bmi)
+    bmi = models.DecimalField("BMI", max_digits=4, decimal_places=1, blank=True, null=True, editable=False)
+    # tách từ blood_pressure khi lưu / import để lọc theo khoảng bằng index
+    systolic_bp = models.PositiveSmallIntegerField("Huyết áp tâm thu", blank=True, null=True, editable=False)
+    diastolic_bp = models.PositiveSmallIntegerField("Huyết áp tâm trương", blank=True, null=True, editable=False)
 
     # --- Vaccine ---
     vaccinated = models.BooleanField(default=False, verbose_name="Đã tiêm vắc-xin")
@@ -110,6 +255,9 @@ class HealthRecord(models.Model):
         HealthClassification, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Phân loại sức khỏe"
     )
     conclusion_text = models.CharField(max_length=255, blank=True, null=True, verbose_name="Kết luận (ghi tay, nếu có)")
+    # kết luận cuối cùng (nhập tay hoặc sinh từ phân loại), tính lại khi lưu, khi import
+    # và khi đổi tên phân loại (xem signals.py); dùng để lọc / thống kê theo kết luận
+    conclusion = models.CharField(max_length=255, blank=True, default="", editable=False, verbose_name="Kết luận")
 
     # --- File & thông tin thêm ---
     result_file = models.FileField(upload_to="health_results/", blank=True, null=True, verbose_name="File kết quả (PDF)")
@@ -127,25 +275,43 @@ class HealthRecord(models.Model):
         verbose_name_plural = "Hồ sơ sức khỏe"
         ordering = ["-year", "employee__full_name"]
         unique_together = ("employee", "year")
+        indexes = [
+            # phân trang keyset của danh sách hồ sơ (xem pagination.py)
+            models.Index(fields=["exam_date", "id"]),
+            # danh sách / xuất file lọc theo một cột rồi sắp theo (exam_date, id)
+            # (kiểm tra bằng lệnh check_query_plans)
+            models.Index(fields=["year", "exam_date", "id"]),
+            models.Index(fields=["health_classification", "exam_date", "id"]),
+            models.Index(fields=["vaccinated", "exam_date", "id"]),
+            models.Index(fields=["status", "year"]),
+            # lọc theo kết luận; danh sách kết luận cho bộ lọc (DISTINCT đọc từ index)
+            models.Index(fields=["conclusion", "exam_date", "id"]),
+            # sàng lọc tăng huyết áp, vd. tâm thu >= 140 trong một năm
+            models.Index(fields=["year", "systolic_bp"]),
+            models.Index(fields=["year", "diastolic_bp"]),
+        ]
+
+    objects = HealthRecordQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.employee.full_name} - {self.year}"
 
-    @property
-    def conclusion(self):
-        """
-        Nếu có nhập tay thì dùng, nếu không thì sinh tự động từ phân loại sức khỏe.
-        """
-        if self.conclusion_text:
-            return self.conclusion_text
-        if not self.health_classification:
-            return ""
-        name = self.health_classification.name.strip().upper()
-        if name in ["I", "II", "III"]:
-            return "Đủ sức khoẻ làm việc"
-        elif name == "IV":
-            return "Làm việc hợp lý"
-        return ""
+    def save(self, *args, **kwargs):
+        hc = self.health_classification if self.health_classification_id else None
+        self.conclusion = compute_conclusion(self.conclusion_text, hc.name if hc else None)
+        self.systolic_bp, self.diastolic_bp = parse_blood_pressure(self.blood_pressure)
+        self.bmi = compute_bmi(self.height_cm, self.weight_kg)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {"conclusion_text", "health_classification"} & update_fields:
+                update_fields.add("conclusion")
+            if "blood_pressure" in update_fields:
+                update_fields |= {"systolic_bp", "diastolic_bp"}
+            if {"height_cm", "weight_kg"} & update_fields:
+                update_fields.add("bmi")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
 
 # --- Dữ liệu tạm import hồ sơ sức khỏe ---
 class HealthRecordTemp(models.Model):
@@ -159,6 +325,8 @@ class HealthRecordTemp(models.Model):
     height_cm = models.DecimalField(max_digits=6, decimal_places=2, blank=True, null=True)
     weight_kg = models.DecimalField(max_digits=6, decimal_places=2, blank=True, null=True)
     blood_pressure = models.CharField(max_length=50, blank=True, null=True)
+    systolic_bp = models.PositiveSmallIntegerField(blank=True, null=True)
+    diastolic_bp = models.PositiveSmallIntegerField(blank=True, null=True)
     health_classification_name = models.CharField(max_length=50, blank=True, null=True, verbose_name="Phân loại (text)")
     conclusion_text = models.CharField(max_length=255, blank=True, null=True, verbose_name="Kết luận nhập tay")
     vaccinated = models.BooleanField(default=False)
@@ -168,9 +336,98 @@ class HealthRecordTemp(models.Model):
 
     is_valid = models.BooleanField(default=True, verbose_name="Hợp lệ")
     error_message = models.TextField(blank=True, null=True, verbose_name="Lỗi (nếu có)")
-    created_at = models.DateTimeField(default=timezone.now)
+    # dùng để dọn batch bỏ dở (xem staging.py)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         verbose_name = "Dữ liệu tạm hồ sơ sức khỏe"
         verbose_name_plural = "Dữ liệu tạm hồ sơ sức khỏe"
         ordering = ['-created_at']
+        # bảng preview: dòng lỗi trước, phân trang keyset theo (is_valid, id)
+        indexes = [
+            models.Index(fields=["batch_id", "is_valid", "id"]),
+        ]
+
+
+# --- Bảng tổng hợp số liệu (rollup) ---
+class HealthRecordRollup(models.Model):
+    """
+    Số hồ sơ theo từng nhóm (năm, khoa, giới tính, phân loại, kết luận, vắc-xin, trạng thái).
+    Được cập nhật tăng dần bởi rollup.py; dựng lại bằng `manage.py rebuild_rollup`.
+    """
+    year = models.PositiveIntegerField(verbose_name="Năm hồ sơ")
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Khoa/Phòng")
+    gender = models.CharField(max_length=10, blank=True, null=True, verbose_name="Giới tính")
+    health_classification = models.ForeignKey(
+        HealthClassification, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Phân loại sức khỏe"
+    )
+    conclusion = models.CharField(max_length=255, blank=True, default="", verbose_name="Kết luận")
+    vaccinated = models.BooleanField(default=False, verbose_name="Đã tiêm vắc-xin")
+    status = models.CharField(max_length=20, verbose_name="Trạng thái")
+    count = models.PositiveIntegerField(default=0, verbose_name="Số hồ sơ")
+
+    class Meta:
+        verbose_name = "Tổng hợp hồ sơ sức khỏe"
+        verbose_name_plural = "Tổng hợp hồ sơ sức khỏe"
+        ordering = ["-year"]
+        indexes = [
+            models.Index(fields=["year", "department", "health_classification"]),
+        ]
+        constraints = [
+            # một dòng cho mỗi nhóm; các chiều có thể NULL được quy về giá trị cố định
+            # vì UNIQUE coi các NULL là khác nhau
+            models.UniqueConstraint(
+                "year",
+                Coalesce("department", Value(0)),
+                Coalesce("gender", Value("")),
+                Coalesce("health_classification", Value(0)),
+                "conclusion",
+                "vaccinated",
+                "status",
+                name="health_records_rollup_group_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.year} - {self.department_id} - {self.count}"
+
+
+# --- Tác vụ import chạy nền ---
+class ImportJob(models.Model):
+    """Một lần xem trước / lưu import chạy trong luồng nền (xem jobs.py)."""
+    KIND_CHOICES = [
+        ("healthrecord_preview", "Xem trước hồ sơ sức khỏe"),
+        ("healthrecord_submit", "Lưu hồ sơ sức khỏe"),
+        ("employee_preview", "Xem trước nhân viên"),
+        ("employee_submit", "Lưu nhân viên"),
+    ]
+    STATUS_CHOICES = [
+        ("pending", "Đang chờ"),
+        ("running", "Đang chạy"),
+        ("done", "Hoàn tất"),
+        ("failed", "Lỗi"),
+        ("cancelled", "Đã huỷ"),
+    ]
+
+    batch_id = models.CharField(max_length=50, db_index=True, verbose_name="Mã batch")
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name="Loại tác vụ")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Trạng thái")
+    total_rows = models.PositiveIntegerField(default=0, verbose_name="Tổng số dòng")
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name="Số dòng đã xử lý")
+    error_message = models.TextField(blank=True, default="", verbose_name="Lỗi (nếu có)")
+    result = models.JSONField(default=dict, blank=True, verbose_name="Kết quả")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Tạo lúc")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Cập nhật lúc")
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name="Kết thúc lúc")
+
+    class Meta:
+        verbose_name = "Tác vụ import"
+        verbose_name_plural = "Tác vụ import"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.batch_id} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ("done", "failed", "cancelled")
@@ -0,0 +1,115 @@
+# health_records/pagination.py
+"""
+Phân trang keyset (cursor) cho các danh sách lớn.
+
+Khác với Paginator (OFFSET + COUNT), mỗi trang chỉ đọc `page_size + 1` dòng
+bắt đầu từ giá trị khoá sắp xếp của dòng cuối trang trước, nên thời gian
+render không tăng theo số dòng trong bảng. Khoá sắp xếp luôn được ghép thêm
+`pk` để thứ tự là duy nhất; cột có thể NULL thì truyền `nullable=True`.
+"""
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([value, pk], cls=DjangoJSONEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Trả về (value, pk) hoặc None nếu cursor rỗng / không hợp lệ."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, pk = json.loads(raw.decode("utf-8"))
+        return value, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_paginate(queryset, sort_field, descending=False, after=None, before=None, page_size=50,
+                    nullable=False):
+    """
+    Lấy một trang của `queryset` theo (sort_field, pk).
+
+    `after` / `before` là cursor của trang kế tiếp / trang trước (xem encode_cursor).
+    Với `nullable=True`, các dòng có sort_field NULL luôn nằm cuối danh sách.
+    """
+    after = decode_cursor(after)
+    before = None if after else decode_cursor(before)
+    backward = before is not None
+    cursor = before or after
+
+    # đi lùi = đọc theo thứ tự ngược rồi đảo lại kết quả
+    reverse = descending != backward
+    if cursor is not None:
+        queryset = queryset.filter(_after_cursor(sort_field, cursor, reverse, backward, nullable))
+    nulls = ({"nulls_first": True} if backward else {"nulls_last": True}) if nullable else {}
+    field = F(sort_field).desc(**nulls) if reverse else F(sort_field).asc(**nulls)
+    rows = list(queryset.order_by(field, "-pk" if reverse else "pk")[:page_size + 1])
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+
+    def key(obj):
+        return encode_cursor(_sort_value(obj, sort_field), obj.pk)
+
+    next_cursor = key(rows[-1]) if (has_more or backward) else None
+    previous_cursor = key(rows[0]) if (after or (backward and has_more)) else None
+    return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+def _after_cursor(sort_field, cursor, reverse, backward, nullable):
+    """Điều kiện lấy các dòng đứng sau cursor theo thứ tự đang đọc."""
+    value, pk = cursor
+    op = "lt" if reverse else "gt"
+    same_value_after = Q(**{f"pk__{op}": pk})
+    if value is None:
+        # đang ở nhóm NULL: đi tiếp trong nhóm, hoặc (khi đi lùi) quay về các dòng có giá trị
+        condition = Q(**{f"{sort_field}__isnull": True}) & same_value_after
+        if backward:
+            condition |= Q(**{f"{sort_field}__isnull": False})
+        return condition
+    # `<=`/`>=` trước để CSDL dùng được index trên (sort_field, id)
+    condition = Q(**{f"{sort_field}__{op}e": value}) & (
+        Q(**{f"{sort_field}__{op}": value}) | same_value_after
+    )
+    if nullable and not backward:
+        condition |= Q(**{f"{sort_field}__isnull": True})
+    return condition
+
+
+def _sort_value(obj, sort_field):
+    value = obj
+    for part in sort_field.split("__"):
+        value = getattr(value, part)
+    return value
@@ -0,0 +1,134 @@
+# health_records/readers.py
+"""
+Đọc file import (Excel / CSV) theo từng khối dòng thay vì `pd.read_excel` cả file.
+
+File upload được ghi ra đĩa, rồi đọc bằng openpyxl ở chế độ read-only (hoặc
+`pd.read_csv(chunksize=...)` với CSV). Mỗi khối là một DataFrame nhỏ với tên cột
+đã chuẩn hoá, nên bộ nhớ chỉ phụ thuộc kích thước khối và bước kiểm tra có thể
+bắt đầu ngay khi đọc xong khối đầu tiên. (Với xlsx, openpyxl vẫn nạp bảng
+shared strings — mỗi chuỗi khác nhau một bản — khi mở file.)
+"""
+import os
+import tempfile
+
+import pandas as pd
+from django.conf import settings
+from openpyxl import load_workbook
+
+CSV_EXTENSIONS = (".csv",)
+
+
+# ---- helper: find best matching column name in df ----
+def find_column(df, candidates):
+    cols = list(df.columns)
+    # exact
+    for c in candidates:
+        if c in cols:
+            return c
+    # case-insensitive direct
+    lc = {col.lower().strip(): col for col in cols}
+    for c in candidates:
+        key = c.lower().strip()
+        if key in lc:
+            return lc[key]
+    # substring match (normalize spaces)
+    cols_norm = {col.replace(" ", "").lower(): col for col in cols}
+    for c in candidates:
+        k = c.replace(" ", "").lower()
+        for kn, orig in cols_norm.items():
+            if k in kn or kn in k:
+                return orig
+    return None
+
+
+def spool_upload(upload):
+    """Ghi file upload ra file tạm trên đĩa (theo từng chunk), trả về đường dẫn."""
+    fd, path = tempfile.mkstemp(prefix='mphr-import-', suffix=os.path.splitext(upload.name)[1].lower())
+    with os.fdopen(fd, 'wb') as out:
+        for chunk in upload.chunks():
+            out.write(chunk)
+    return path
+
+
+def get_chunk_size():
+    return getattr(settings, 'HEALTH_IMPORT_CHUNK_SIZE', 500)
+
+
+def resolve_columns(header, spec):
+    """
+    Map tên cột trong file -> tên chuẩn (tên đầu tiên của mỗi mục trong `spec`),
+    tìm bằng find_column một lần cho cả file. Cột không khớp giữ nguyên tên.
+    """
+    header = [str(name).strip() if name is not None else '' for name in header]
+    frame = pd.DataFrame(columns=[name for name in header if name])
+    renames = {}
+    for candidates in spec.values():
+        found = find_column(frame, candidates)
+        if found is not None and found not in renames:
+            renames[found] = candidates[0]
+    return [renames.get(name, name) for name in header]
+
+
+def _excel_cell(value):
+    # giống pandas: số thực nguyên (2024.0) đọc thành int
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and not value.strip():
+        return None
+    return value
+
+
+def _xlsx_chunks(path, chunk_size, spec):
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = resolve_columns(header, spec)
+        width = len(columns)
+        chunk = []
+        for row in rows:
+            values = [_excel_cell(v) for v in row[:width]]
+            if all(v is None for v in values):
+                continue  # bỏ dòng trống
+            chunk.append(values + [None] * (width - len(values)))
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        wb.close()
+
+
+def _csv_chunks(path, chunk_size, spec):
+    # dtype=str để giữ nguyên mã nhân viên dạng "0012"
+    reader = pd.read_csv(path, chunksize=chunk_size, dtype=str, encoding='utf-8-sig', skip_blank_lines=True)
+    with reader:
+        for chunk in reader:
+            chunk.columns = resolve_columns(chunk.columns, spec)
+            yield chunk.reset_index(drop=True)
+
+
+def iter_row_chunks(path, spec, chunk_size=None):
+    """
+    Sinh các DataFrame tối đa `chunk_size` dòng (index 0..n-1 trong từng khối).
+    `spec` là dict {khoá: (tên cột chuẩn, tên khác...)} như HEALTHRECORD_COLUMNS.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    if path.lower().endswith(CSV_EXTENSIONS):
+        return _csv_chunks(path, chunk_size, spec)
+    return _xlsx_chunks(path, chunk_size, spec)
+
+
+def estimate_rows(path):
+    """Số dòng dữ liệu theo kích thước sheet khai báo trong file Excel (0 nếu không biết)."""
+    if path.lower().endswith(CSV_EXTENSIONS):
+        return 0
+    wb = load_workbook(path, read_only=True)
+    try:
+        max_row = wb.active.max_row
+    finally:
+        wb.close()
+    return max(max_row - 1, 0) if max_row else 0
@@ -0,0 +1,123 @@
+# health_records/rollup.py
+"""
+Duy trì bảng HealthRecordRollup.
+
+Mỗi thay đổi được tính theo kiểu "trước / sau": chụp số đếm theo nhóm của các
+hồ sơ bị ảnh hưởng trước khi ghi, chụp lại sau khi ghi, rồi cộng phần chênh
+lệch vào bảng rollup. Nhờ vậy chi phí chỉ phụ thuộc số hồ sơ bị ảnh hưởng.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import HealthRecord, HealthRecordRollup
+
+# (tên cột trong values() của HealthRecord, tên field trên HealthRecordRollup)
+DIMENSIONS = (
+    ("year", "year"),
+    ("employee__department", "department_id"),
+    ("employee__gender", "gender"),
+    ("health_classification", "health_classification_id"),
+    ("conclusion", "conclusion"),
+    ("vaccinated", "vaccinated"),
+    ("status", "status"),
+)
+
+_state = threading.local()
+
+
+def group_counts(records, **expressions):
+    """
+    Counter {(year, department_id, gender, hc_id, conclusion, vaccinated, status): số hồ sơ}.
+    `expressions` thay giá trị một chiều (theo tên field rollup) bằng biểu thức SQL,
+    ví dụ department_id=Value(None) để đếm như thể khoa/phòng đã bị xoá.
+    """
+    annotations = {f"rollup_{field}": expressions[field] for _, field in DIMENSIONS if field in expressions}
+    columns = [f"rollup_{field}" if field in expressions else source for source, field in DIMENSIONS]
+    rows = (
+        records
+        .annotate(**annotations)
+        .values(*columns)
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    return Counter({tuple(row[column] for column in columns): row["n"] for row in rows})
+
+
+def _insert_or_add(lookup, diff):
+    try:
+        with transaction.atomic():
+            HealthRecordRollup.objects.create(count=diff, **lookup)
+    except IntegrityError:
+        # tác vụ khác vừa tạo dòng của nhóm này (ràng buộc unique trên các chiều): cộng vào dòng đó
+        HealthRecordRollup.objects.filter(**lookup).update(count=F("count") + diff)
+
+
+def apply_delta(before, after):
+    """Cộng chênh lệch (after - before) vào bảng rollup."""
+    keys = set(before) | set(after)
+    with transaction.atomic():
+        missing = []
+        for key in keys:
+            diff = after.get(key, 0) - before.get(key, 0)
+            if not diff:
+                continue
+            lookup = {field: value for (_, field), value in zip(DIMENSIONS, key)}
+            updated = HealthRecordRollup.objects.filter(**lookup).update(count=F("count") + diff)
+            if not updated and diff > 0:
+                missing.append((lookup, diff))
+        if missing:
+            try:
+                with transaction.atomic():
+                    HealthRecordRollup.objects.bulk_create(
+                        [HealthRecordRollup(count=diff, **lookup) for lookup, diff in missing], batch_size=1000,
+                    )
+            except IntegrityError:
+                for lookup, diff in missing:
+                    _insert_or_add(lookup, diff)
+        HealthRecordRollup.objects.filter(count__lte=0).delete()
+
+
+def rebuild(record_model=HealthRecord, rollup_model=HealthRecordRollup):
+    """Dựng lại toàn bộ bảng rollup từ HealthRecord."""
+    counts = group_counts(record_model.objects.all())
+    with transaction.atomic():
+        rollup_model.objects.all().delete()
+        rollup_model.objects.bulk_create([
+            rollup_model(count=n, **{field: value for (_, field), value in zip(DIMENSIONS, key)})
+            for key, n in counts.items()
+        ], batch_size=1000)
+    return len(counts)
+
+
+def is_suspended():
+    return getattr(_state, "suspended", False)
+
+
+@contextmanager
+def bulk_refresh(records):
+    """
+    Dùng cho import hàng loạt: tắt cập nhật theo từng dòng (signal) và áp dụng
+    một lần cho cả batch. `records` là queryset bao trùm các hồ sơ có thể thay đổi.
+    """
+    before = group_counts(records)
+    previous = is_suspended()
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+    apply_delta(before, group_counts(records))
+
+
+def snapshot(records):
+    """Chụp số đếm theo nhóm của `records` trước khi ghi."""
+    return group_counts(records)
+
+
+def apply_snapshot(before, records):
+    """Cộng chênh lệch giữa `before` và số đếm hiện tại của `records` (cùng bộ lọc lúc chụp)."""
+    apply_delta(before, group_counts(records))
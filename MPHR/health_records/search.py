@@ -0,0 +1,213 @@
+# health_records/search.py
+"""
+Tìm nhân viên theo mã / họ tên, không phân biệt dấu và chữ hoa/thường.
+
+Mỗi Employee lưu `search_key` = mã + họ tên đã bỏ dấu, viết thường ("nv001 nguyen van a"),
+tính trong Employee.save() và Employee.objects.bulk_create / bulk_update (QuerySet.update()
+không tính lại). Trên SQLite cột này được đánh chỉ mục FTS5 (bảng ảo `health_records_employee_fts`,
+tạo trong migration 0020, đổi sang tokenizer trigram ở 0024), đồng bộ bằng trigger với mọi INSERT / UPDATE / DELETE. Migration
+"dựng lại bảng" của SQLite xoá trigger, nên install_index() chạy lại sau mỗi lần migrate
+(post_migrate, apps.py).
+
+Chỉ mục dùng tokenizer `trigram`, nên từ khoá từ 3 ký tự trở lên khớp ở bất kỳ vị trí nào
+trong khoá: "0012" khớp mã "NV0012", "uyen" khớp "Nguyễn". Trigram không tra được từ khoá
+1-2 ký tự; các từ khoá đó khớp với đầu một từ ("nguyen van a" khớp "Nguyễn Văn An") bằng
+LIKE trên search_key, kết hợp với các từ khoá dài hơn. Với CSDL khác, mọi từ khoá đều
+là LIKE trên search_key (vẫn bỏ dấu, nhưng quét bảng).
+
+Ô chọn nhân viên trong form hồ sơ gọi autocomplete_employees(); kết quả được giữ trong một
+LRU nhỏ trong tiến trình, khoá theo phiên bản dữ liệu của stats.py nên tự hết hiệu lực khi
+nhân viên thay đổi.
+"""
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from . import stats
+
+FTS_TABLE = "health_records_employee_fts"
+FTS_MATCH_SQL = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+FTS_TRIGGERS = (f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au")
+FTS_TOKENIZER = "trigram"
+# trigram chỉ tra được chuỗi từ 3 ký tự
+FTS_MIN_TOKEN = 3
+
+# Bảng FTS5 "external content": chỉ lưu chỉ mục, nội dung đọc từ cột search_key
+FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        search_key, content='health_records_employee', content_rowid='id', tokenize='{FTS_TOKENIZER}'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON health_records_employee BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_key) VALUES (new.id, new.search_key);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON health_records_employee BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_key) VALUES ('delete', old.id, old.search_key);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_key ON health_records_employee BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_key) VALUES ('delete', old.id, old.search_key);
+        INSERT INTO {FTS_TABLE}(rowid, search_key) VALUES (new.id, new.search_key);
+    END
+    """,
+]
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+def fold(text):
+    """Bỏ dấu tiếng Việt, viết thường, chỉ giữ chữ và số: 'Nguyễn Văn Đức' -> 'nguyen van duc'."""
+    text = unicodedata.normalize("NFD", str(text or "")).replace("đ", "d").replace("Đ", "D")
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def employee_search_key(code, full_name):
+    return fold(f"{code or ''} {full_name or ''}")
+
+
+def tokenize(query):
+    return fold(query).split()
+
+
+def match_expression(tokens):
+    """Biểu thức MATCH của FTS5: mọi từ khoá đều phải khớp (chuỗi con, mỗi từ khoá >= 3 ký tự)."""
+    return " ".join(f'"{token}"' for token in tokens)
+
+
+def fts_enabled(using="default"):
+    return connections[using].vendor == "sqlite"
+
+
+def install_index(connection):
+    """
+    Tạo bảng FTS5 và trigger còn thiếu (bảng FTS dùng tokenizer khác thì tạo lại) rồi dựng
+    lại chỉ mục từ search_key. Không làm gì nếu đã đủ, không phải SQLite hoặc bảng nhân viên
+    chưa có cột search_key. Trả về True nếu có tạo mới.
+    """
+    if connection.vendor != "sqlite":
+        return False
+    names = (FTS_TABLE, *FTS_TRIGGERS)
+    with connection.cursor() as cursor:
+        if "health_records_employee" not in connection.introspection.table_names(cursor):
+            return False
+        columns = connection.introspection.get_table_description(cursor, "health_records_employee")
+        if "search_key" not in {column.name for column in columns}:
+            return False
+        cursor.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names
+        )
+        existing = dict(cursor.fetchall())
+        if len(existing) == len(names) and f"tokenize='{FTS_TOKENIZER}'" in existing[FTS_TABLE]:
+            return False
+        if FTS_TABLE in existing:
+            cursor.execute(f"DROP TABLE {FTS_TABLE}")
+        for sql in FTS_DDL:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def drop_index(connection):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name in FTS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def filter_employees(queryset, query, prefix=""):
+    """
+    Lọc `queryset` theo từ khoá tìm nhân viên. `prefix` là đường dẫn tới Employee
+    ("" cho Employee, "employee__" cho HealthRecord). Từ khoá rỗng: trả nguyên queryset.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset
+    if not fts_enabled(queryset.db):
+        for token in tokens:
+            queryset = queryset.filter(**{f"{prefix}search_key__contains": token})
+        return queryset
+    long_tokens = [token for token in tokens if len(token) >= FTS_MIN_TOKEN]
+    if long_tokens:
+        queryset = queryset.filter(**{f"{prefix}pk__in": RawSQL(FTS_MATCH_SQL, [match_expression(long_tokens)])})
+    for token in tokens:
+        if len(token) < FTS_MIN_TOKEN:
+            # từ khoá ngắn: khớp đầu một từ (search_key là các từ cách nhau một dấu cách)
+            queryset = queryset.filter(
+                Q(**{f"{prefix}search_key__startswith": token}) | Q(**{f"{prefix}search_key__contains": f" {token}"})
+            )
+    return queryset
+
+
+# ---- autocomplete ----
+AUTOCOMPLETE_LIMIT = 20
+AUTOCOMPLETE_CACHE_SIZE = 256
+
+
+class LRUCache:
+    """Dict giới hạn `maxsize` phần tử, bỏ phần tử lâu không dùng nhất; an toàn giữa các thread."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+AUTOCOMPLETE_CACHE = LRUCache(AUTOCOMPLETE_CACHE_SIZE)
+
+
+def autocomplete_employees(query, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Tối đa `limit` nhân viên khớp `query` (một phần mã / họ tên bỏ dấu), sắp theo mã:
+    [{'id', 'code', 'full_name', 'department', 'text'}]. Từ khoá rỗng: [].
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    key = (stats.get_data_version(), " ".join(tokens), limit)
+    results = AUTOCOMPLETE_CACHE.get(key)
+    if results is None:
+        from .models import Employee  # models.py import module này
+
+        rows = (
+            filter_employees(Employee.objects.all(), query)
+            .order_by("code")
+            .values_list("id", "code", "full_name", "department__name")[:limit]
+        )
+        results = [
+            {"id": pk, "code": code, "full_name": full_name, "department": department,
+             "text": f"{full_name} ({code})"}
+            for pk, code, full_name, department in rows
+        ]
+        AUTOCOMPLETE_CACHE.set(key, results)
+    return results
@@ -0,0 +1,122 @@
+# health_records/signals.py
+from collections import Counter
+
+from django.db.models import BigIntegerField, Value
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from . import rollup, stats
+from .models import (
+    Department, Employee, ExaminationType, HealthClassification, HealthRecord,
+    classification_conclusion_expression, refresh_conclusions,
+)
+
+# Các model ảnh hưởng tới số liệu trang chủ
+STATS_SENDERS = (HealthRecord, Employee, Department, HealthClassification, ExaminationType)
+
+
+def invalidate_dashboard_stats(sender, **kwargs):
+    stats.invalidate()
+
+
+for model in STATS_SENDERS:
+    post_save.connect(invalidate_dashboard_stats, sender=model, dispatch_uid=f"stats_save_{model.__name__}")
+    post_delete.connect(invalidate_dashboard_stats, sender=model, dispatch_uid=f"stats_delete_{model.__name__}")
+
+
+# --- Cột HealthRecord.conclusion khi phân loại sức khỏe thay đổi ---
+# Phải nối trước các hook rollup bên dưới: rollup đọc cột conclusion sau khi đã tính lại.
+
+def remember_classification_rename(sender, instance, **kwargs):
+    # chỉ đổi tên mới làm thay đổi kết luận / nhóm rollup của các hồ sơ
+    old_name = None
+    if instance.pk is not None:
+        old_name = sender.objects.filter(pk=instance.pk).values_list("name", flat=True).first()
+    instance._name_changed = old_name is not None and old_name != instance.name
+
+
+def refresh_conclusions_on_rename(sender, instance, created, **kwargs):
+    if created or not getattr(instance, "_name_changed", False):
+        return
+    refresh_conclusions(HealthRecord.objects.filter(health_classification_id=instance.pk), instance.name)
+
+
+def refresh_conclusions_on_delete(sender, instance, **kwargs):
+    # hồ sơ của phân loại bị xoá đã được SET_NULL: kết luận tự động của chúng về rỗng
+    refresh_conclusions(HealthRecord.objects.filter(health_classification=None, conclusion__gt=""), None)
+
+
+pre_save.connect(remember_classification_rename, sender=HealthClassification, dispatch_uid="conclusion_old_name")
+post_save.connect(refresh_conclusions_on_rename, sender=HealthClassification, dispatch_uid="conclusion_rename")
+post_delete.connect(refresh_conclusions_on_delete, sender=HealthClassification, dispatch_uid="conclusion_delete")
+
+
+# --- Cập nhật bảng rollup theo từng thay đổi ---
+# Lưu: chụp số đếm theo nhóm của các hồ sơ bị ảnh hưởng trước khi ghi, so với sau khi ghi.
+# Xoá: sau khi xoá các hồ sơ không còn lọc lại được (SET_NULL), nên số đếm "sau" được
+# tính sẵn ở pre_delete bằng cách thay cột bị SET_NULL bằng NULL ngay trong câu GROUP BY.
+
+def _affected_records(sender, instance):
+    if sender is HealthRecord:
+        return HealthRecord.objects.filter(pk=instance.pk)
+    if sender is Employee:
+        return HealthRecord.objects.filter(employee_id=instance.pk)
+    if sender is HealthClassification:
+        return HealthRecord.objects.filter(health_classification_id=instance.pk)
+    if sender is Department:
+        return HealthRecord.objects.filter(employee__department_id=instance.pk)
+    return HealthRecord.objects.none()
+
+
+def _counts_after_delete(sender, records):
+    null_id = Value(None, output_field=BigIntegerField())
+    if sender is HealthClassification:
+        return rollup.group_counts(
+            records, health_classification_id=null_id, conclusion=classification_conclusion_expression(None),
+        )
+    if sender is Department:
+        return rollup.group_counts(records, department_id=null_id)
+    return Counter()  # HealthRecord: chính hồ sơ bị xoá
+
+
+def rollup_before_save(sender, instance, **kwargs):
+    if rollup.is_suspended() or instance.pk is None:
+        return
+    if sender is HealthClassification and not instance._name_changed:
+        return
+    instance._rollup_before = rollup.snapshot(_affected_records(sender, instance))
+
+
+def rollup_after_save(sender, instance, created, **kwargs):
+    before = getattr(instance, "_rollup_before", None)
+    instance._rollup_before = None
+    if rollup.is_suspended() or (before is None and not created):
+        return
+    rollup.apply_snapshot(before or Counter(), _affected_records(sender, instance))
+
+
+def rollup_before_delete(sender, instance, **kwargs):
+    if rollup.is_suspended():
+        return
+    records = _affected_records(sender, instance)
+    instance._rollup_delta = (rollup.snapshot(records), _counts_after_delete(sender, records))
+
+
+def rollup_after_delete(sender, instance, **kwargs):
+    delta = getattr(instance, "_rollup_delta", None)
+    instance._rollup_delta = None
+    if rollup.is_suspended() or delta is None:
+        return
+    rollup.apply_delta(*delta)
+
+
+# HealthRecord: thêm / sửa / xoá; Employee: đổi khoa hoặc giới tính;
+# HealthClassification: đổi tên hoặc xoá; Department: xoá (nhân viên bị SET_NULL).
+ROLLUP_SAVE_SENDERS = (HealthRecord, Employee, HealthClassification)
+ROLLUP_DELETE_SENDERS = (HealthRecord, HealthClassification, Department)
+
+for model in ROLLUP_SAVE_SENDERS:
+    pre_save.connect(rollup_before_save, sender=model, dispatch_uid=f"rollup_before_save_{model.__name__}")
+    post_save.connect(rollup_after_save, sender=model, dispatch_uid=f"rollup_after_save_{model.__name__}")
+for model in ROLLUP_DELETE_SENDERS:
+    pre_delete.connect(rollup_before_delete, sender=model, dispatch_uid=f"rollup_before_delete_{model.__name__}")
+    post_delete.connect(rollup_after_delete, sender=model, dispatch_uid=f"rollup_after_delete_{model.__name__}")
@@ -0,0 +1,345 @@
+# health_records/staging.py
+"""
+Dữ liệu tạm của import (HealthRecordTemp / EmployeeTemp).
+
+Mỗi lần preview tạo một batch riêng; batch thuộc về phiên (session) đã tải file
+lên, nên nhiều người có thể preview cùng lúc mà không xoá / lưu nhầm batch của
+nhau. Batch bị bỏ dở (không lưu, không huỷ) hết hạn sau `HEALTH_STAGING_TTL`
+giây và được dọn bởi lệnh `purge_import_staging` hoặc tự động trong lúc preview
+(tối đa một lần mỗi `HEALTH_STAGING_PURGE_INTERVAL` giây).
+
+Nơi lưu batch chọn bằng `HEALTH_STAGING_BACKEND`:
+- "table" (mặc định): mỗi dòng một bản ghi trong bảng tạm.
+- "parquet": mỗi batch một file Parquet trong `HEALTH_STAGING_DIR` (cần pyarrow).
+  Không ghi / đếm / xoá từng dòng trong CSDL; các dòng đọc ra là object tạm
+  chưa lưu nên template preview và bước lưu dùng chung với "table".
+"""
+import logging
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import EmployeeTemp, HealthRecordTemp, ImportJob
+from .pagination import KeysetPage, decode_cursor, encode_cursor, keyset_paginate
+from .stats import get_cache
+
+logger = logging.getLogger(__name__)
+
+STAGING_MODELS = (HealthRecordTemp, EmployeeTemp)
+# cột mã dùng khi hiện các lỗi đầu tiên
+CODE_FIELDS = {HealthRecordTemp: "employee_code", EmployeeTemp: "code"}
+SESSION_KEY = "import_batches"
+# số batch gần nhất giữ trong session (đủ cho vài tab import cùng lúc)
+SESSION_MAX_BATCHES = 20
+PURGE_LOCK_KEY = "health_records:staging:purge"
+
+
+def get_ttl():
+    return timedelta(seconds=getattr(settings, "HEALTH_STAGING_TTL", 86400))
+
+
+def new_batch_id():
+    return uuid.uuid4().hex
+
+
+# ---- quyền sở hữu batch (theo session) ----
+def claim(request, batch_id):
+    batches = [b for b in request.session.get(SESSION_KEY, []) if b != batch_id]
+    batches.append(batch_id)
+    request.session[SESSION_KEY] = batches[-SESSION_MAX_BATCHES:]
+
+
+def owns(request, batch_id):
+    return batch_id in request.session.get(SESSION_KEY, [])
+
+
+def release(request, batch_id):
+    batches = request.session.get(SESSION_KEY, [])
+    if batch_id in batches:
+        request.session[SESSION_KEY] = [b for b in batches if b != batch_id]
+
+
+# ---- nơi lưu batch ----
+class TableStore:
+    """Mỗi dòng tạm là một bản ghi HealthRecordTemp / EmployeeTemp."""
+
+    @contextmanager
+    def writer(self, model, batch_id):
+        yield model.objects.bulk_create
+
+    def counts(self, model, batch_id):
+        return model.objects.filter(batch_id=batch_id).aggregate(
+            total=Count("id"),
+            valid_count=Count("id", filter=Q(is_valid=True)),
+            invalid_count=Count("id", filter=Q(is_valid=False)),
+        )
+
+    def page(self, model, batch_id, after=None, page_size=100):
+        # dòng lỗi (is_valid=False) trước, sau đó theo thứ tự trong file
+        return keyset_paginate(model.objects.filter(batch_id=batch_id), "is_valid", after=after,
+                               page_size=page_size)
+
+    def invalid_sample(self, model, batch_id, limit):
+        return list(
+            model.objects.filter(batch_id=batch_id, is_valid=False)
+            .order_by("id").values_list(CODE_FIELDS[model], "error_message")[:limit]
+        )
+
+    def valid_rows(self, model, batch_id):
+        return list(model.objects.filter(batch_id=batch_id, is_valid=True))
+
+    def has_valid(self, model, batch_id):
+        return model.objects.filter(batch_id=batch_id, is_valid=True).exists()
+
+    def delete(self, model, batch_id):
+        model.objects.filter(batch_id=batch_id).delete()
+
+    def purge(self, cutoff, busy, dry_run=False):
+        deleted = {}
+        for model in STAGING_MODELS:
+            expired = model.objects.filter(created_at__lt=cutoff).exclude(batch_id__in=busy)
+            deleted[model.__name__] = expired.count() if dry_run else expired.delete()[0]
+        return deleted
+
+    def stats(self):
+        return {
+            model.__name__: model.objects.aggregate(
+                rows=Count("id"), batches=Count("batch_id", distinct=True), oldest=Min("created_at"),
+            )
+            for model in STAGING_MODELS
+        }
+
+
+class ParquetStore:
+    """
+    Mỗi batch một file `<model>-<batch_id>.parquet`, ghi theo từng row group khi
+    đọc file upload. File đang ghi có đuôi `.part` nên file `.parquet` luôn đầy đủ;
+    thời gian sửa file là mốc tính TTL.
+    """
+
+    def __init__(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured('HEALTH_STAGING_BACKEND = "parquet" cần cài pyarrow.')
+
+    @property
+    def directory(self):
+        return getattr(settings, "HEALTH_STAGING_DIR", None) or os.path.join(tempfile.gettempdir(), "mphr-staging")
+
+    def path(self, model, batch_id):
+        return os.path.join(self.directory, f"{model._meta.model_name}-{batch_id}.parquet")
+
+    @staticmethod
+    def fields(model):
+        return [f for f in model._meta.concrete_fields if f.name not in ("id", "batch_id", "created_at")]
+
+    def schema(self, model):
+        import pyarrow as pa
+
+        def arrow_type(field):
+            internal = field.get_internal_type()
+            if internal == "BooleanField":
+                return pa.bool_()
+            if internal.endswith("IntegerField"):
+                return pa.int64()
+            if internal == "DecimalField":
+                return pa.decimal128(field.max_digits, field.decimal_places)
+            if internal == "DateField":
+                return pa.date32()
+            return pa.string()
+
+        return pa.schema([(f.name, arrow_type(f)) for f in self.fields(model)])
+
+    @staticmethod
+    def _value(field, value):
+        if value is None or value != value:  # None / NaN / NaT
+            return None
+        value = field.to_python(value)
+        if isinstance(value, Decimal):
+            value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+        return value
+
+    def _sample_key(self, model, batch_id):
+        return f"health_records:staging:{model._meta.model_name}:{batch_id}:errors"
+
+    @contextmanager
+    def writer(self, model, batch_id, sample_size=10):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(model, batch_id)
+        part = path + ".part"
+        schema = self.schema(model)
+        fields = self.fields(model)
+        code_field = CODE_FIELDS[model]
+        sample = []
+
+        try:
+            with pq.ParquetWriter(part, schema, compression="snappy") as out:
+                def write(temps):
+                    columns = [[self._value(f, getattr(t, f.attname)) for t in temps] for f in fields]
+                    out.write_table(pa.Table.from_arrays(
+                        [pa.array(col, type=af.type) for col, af in zip(columns, schema)], schema=schema,
+                    ))
+                    # file chưa đóng thì chưa đọc được: giữ vài lỗi đầu trong cache cho trang tiến độ
+                    if len(sample) < sample_size:
+                        sample.extend((getattr(t, code_field), t.error_message) for t in temps if not t.is_valid)
+                        get_cache().set(self._sample_key(model, batch_id), sample[:sample_size], timeout=3600)
+
+                yield write
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        else:
+            os.replace(part, path)
+        finally:
+            get_cache().delete(self._sample_key(model, batch_id))
+
+    def _read(self, model, batch_id, columns=None):
+        import pyarrow.parquet as pq
+
+        path = self.path(model, batch_id)
+        if not os.path.exists(path):
+            return None
+        return pq.read_table(path, columns=columns, memory_map=True)
+
+    def _objects(self, model, batch_id, table):
+        return [model(batch_id=batch_id, **row) for row in table.to_pylist()]
+
+    def counts(self, model, batch_id):
+        table = self._read(model, batch_id, columns=["is_valid"])
+        if table is None:
+            return {"total": 0, "valid_count": 0, "invalid_count": 0}
+        valid = int(table.column("is_valid").to_numpy(zero_copy_only=False).sum())
+        return {"total": table.num_rows, "valid_count": valid, "invalid_count": table.num_rows - valid}
+
+    def page(self, model, batch_id, after=None, page_size=100):
+        import numpy as np
+
+        # cùng thứ tự và dạng cursor (is_valid, vị trí dòng trong file) như TableStore
+        table = self._read(model, batch_id)
+        if table is None:
+            return KeysetPage([])
+        valid = table.column("is_valid").to_numpy(zero_copy_only=False)
+        order = np.concatenate([np.flatnonzero(~valid), np.flatnonzero(valid)])
+        start = 0
+        cursor = decode_cursor(after)
+        if cursor is not None:
+            found = np.flatnonzero(order == cursor[1])
+            start = int(found[0]) + 1 if len(found) else 0
+        positions = order[start:start + page_size + 1]
+        rows = self._objects(model, batch_id, table.take(positions[:page_size]))
+        next_cursor = None
+        if len(positions) > page_size:
+            last = int(positions[page_size - 1])
+            next_cursor = encode_cursor(bool(valid[last]), last)
+        return KeysetPage(rows, next_cursor=next_cursor)
+
+    def invalid_sample(self, model, batch_id, limit):
+        code_field = CODE_FIELDS[model]
+        table = self._read(model, batch_id, columns=[code_field, "error_message", "is_valid"])
+        if table is None:
+            return get_cache().get(self._sample_key(model, batch_id), [])[:limit]
+        import pyarrow.compute as pc
+
+        rows = table.filter(pc.invert(table.column("is_valid")))
+        return [(r[code_field], r["error_message"]) for r in rows.slice(0, limit).to_pylist()]
+
+    def valid_rows(self, model, batch_id):
+        table = self._read(model, batch_id)
+        if table is None:
+            return []
+        return self._objects(model, batch_id, table.filter(table.column("is_valid")))
+
+    def has_valid(self, model, batch_id):
+        return self.counts(model, batch_id)["valid_count"] > 0
+
+    def delete(self, model, batch_id):
+        for path in (self.path(model, batch_id), self.path(model, batch_id) + ".part"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _files(self):
+        """(model, batch_id, đường dẫn, số dòng, mtime) cho mọi file trong thư mục tạm."""
+        import pyarrow.parquet as pq
+
+        prefixes = {f"{model._meta.model_name}-": model for model in STAGING_MODELS}
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            complete = name.endswith(".parquet")
+            for prefix, model in prefixes.items():
+                if name.startswith(prefix) and (complete or name.endswith(".parquet.part")):
+                    batch_id = name[len(prefix):].split(".", 1)[0]
+                    rows = pq.read_metadata(entry.path).num_rows if complete else 0
+                    yield model, batch_id, entry.path, rows, entry.stat().st_mtime
+
+    def purge(self, cutoff, busy, dry_run=False):
+        deleted = {model.__name__: 0 for model in STAGING_MODELS}
+        for model, batch_id, path, rows, mtime in list(self._files()):
+            if mtime < cutoff.timestamp() and batch_id not in busy:
+                deleted[model.__name__] += rows
+                if not dry_run:
+                    os.remove(path)
+        return deleted
+
+    def stats(self):
+        result = {model.__name__: {"rows": 0, "batches": 0, "oldest": None, "bytes": 0} for model in STAGING_MODELS}
+        for model, _batch_id, path, rows, mtime in self._files():
+            info = result[model.__name__]
+            modified = datetime.fromtimestamp(mtime, tz=timezone.get_current_timezone())
+            info["rows"] += rows
+            info["batches"] += 1
+            info["bytes"] += os.path.getsize(path)
+            info["oldest"] = min(info["oldest"] or modified, modified)
+        return result
+
+
+STORES = {"table": TableStore, "parquet": ParquetStore}
+
+
+def get_store():
+    backend = getattr(settings, "HEALTH_STAGING_BACKEND", "table")
+    if backend not in STORES:
+        raise ImproperlyConfigured(f"HEALTH_STAGING_BACKEND không hợp lệ: {backend!r}")
+    return STORES[backend]()
+
+
+# ---- dọn batch hết hạn ----
+def purge_expired(now=None, dry_run=False):
+    """
+    Xoá các dòng tạm cũ hơn TTL (trừ batch đang có tác vụ chạy).
+    Trả về {tên model: số dòng đã xoá (hoặc sẽ xoá nếu dry_run)}.
+    """
+    cutoff = (now or timezone.now()) - get_ttl()
+    busy = set(ImportJob.objects.filter(status__in=("pending", "running")).values_list("batch_id", flat=True))
+    deleted = get_store().purge(cutoff, busy, dry_run=dry_run)
+    if not dry_run and any(deleted.values()):
+        logger.info("Đã dọn dữ liệu tạm import hết hạn: %s", deleted)
+    return deleted
+
+
+def maybe_purge():
+    """Dọn batch hết hạn nếu lần dọn trước đã quá `HEALTH_STAGING_PURGE_INTERVAL` giây."""
+    interval = getattr(settings, "HEALTH_STAGING_PURGE_INTERVAL", 600)
+    # cache.add chỉ thành công với một tiến trình / luồng trong mỗi khoảng
+    if not get_cache().add(PURGE_LOCK_KEY, True, timeout=interval):
+        return None
+    return purge_expired()
+
+
+def table_stats():
+    """Kích thước nơi lưu tạm: {tên model: {'rows', 'batches', 'oldest'[, 'bytes']}}."""
+    return get_store().stats()
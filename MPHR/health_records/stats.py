@@ -0,0 +1,115 @@
+# health_records/stats.py
+"""
+Cache cho số liệu thống kê trang chủ và các danh sách lựa chọn của bộ lọc.
+
+Dữ liệu chỉ thay đổi khi import / thêm / sửa / xoá, nên kết quả được lưu trong
+cache backend của Django (cấu hình bằng `HEALTH_STATS_CACHE_ALIAS`) và bị xoá
+bởi signal (xem signals.py) hoặc trực tiếp từ các view import hàng loạt.
+
+Alias này phải trỏ tới backend dùng chung giữa các worker (file, Redis...): với
+LocMemCache mỗi process có cache và bộ đếm riêng, invalidate() ở một worker
+không xoá được dữ liệu cũ ở worker khác.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+STATS_KEY = "health_records:dashboard_stats"
+HITS_KEY = "health_records:dashboard_stats:hits"
+MISSES_KEY = "health_records:dashboard_stats:misses"
+EMPLOYEE_FILTERS_KEY = "health_records:employee_filter_options"
+# Tăng mỗi lần dữ liệu đổi; các key đếm theo bộ lọc chứa version nên tự hết hiệu lực
+VERSION_KEY = "health_records:data_version"
+
+
+def get_cache():
+    return caches[getattr(settings, "HEALTH_STATS_CACHE_ALIAS", "default")]
+
+
+def _incr(cache, key):
+    # add() không ghi đè nếu key đã có; incr() chỉ nguyên tử với Redis/Memcached,
+    # backend file có thể lỡ vài lần đếm khi nhiều worker ghi cùng lúc
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_dashboard_stats(compute):
+    """Trả về số liệu trang chủ từ cache, gọi `compute()` khi cache trống."""
+    cache = get_cache()
+    stats = cache.get(STATS_KEY)
+    if stats is not None:
+        _incr(cache, HITS_KEY)
+        return stats
+
+    _incr(cache, MISSES_KEY)
+    stats = compute()
+    cache.set(STATS_KEY, stats, timeout=getattr(settings, "HEALTH_STATS_CACHE_TIMEOUT", 3600))
+    return stats
+
+
+def get_employee_filter_options(compute):
+    """Danh sách Khoa/Phòng và Chức danh cho bộ lọc nhân viên, gọi `compute()` khi cache trống."""
+    cache = get_cache()
+    options = cache.get(EMPLOYEE_FILTERS_KEY)
+    if options is None:
+        options = compute()
+        cache.set(EMPLOYEE_FILTERS_KEY, options, timeout=getattr(settings, "HEALTH_STATS_CACHE_TIMEOUT", 3600))
+    return options
+
+
+def get_data_version():
+    """Số phiên bản dữ liệu, tăng sau mỗi lần invalidate(); dùng làm một phần của key cache."""
+    return get_cache().get(VERSION_KEY, 0)
+
+
+def get_record_count(filters, compute):
+    """Tổng số hồ sơ cho một bộ lọc (chuỗi querystring), gọi `compute()` khi cache trống."""
+    cache = get_cache()
+    version = get_data_version()
+    digest = hashlib.md5(filters.encode("utf-8")).hexdigest()
+    key = f"health_records:record_count:{version}:{digest}"
+    count = cache.get(key)
+    if count is None:
+        count = compute()
+        cache.set(key, count, timeout=getattr(settings, "HEALTH_STATS_CACHE_TIMEOUT", 3600))
+    return count
+
+
+def get_anthropometric_report(year, compute):
+    """Báo cáo BMI / huyết áp của một năm (`year` None: mọi năm), gọi `compute()` khi cache trống."""
+    cache = get_cache()
+    version = get_data_version()
+    key = f"health_records:anthropometric_report:{version}:{year or 'all'}"
+    report = cache.get(key)
+    if report is None:
+        report = compute()
+        cache.set(key, report, timeout=getattr(settings, "HEALTH_STATS_CACHE_TIMEOUT", 3600))
+    return report
+
+
+def _clear():
+    cache = get_cache()
+    cache.delete_many([STATS_KEY, EMPLOYEE_FILTERS_KEY])
+    _incr(cache, VERSION_KEY)
+
+
+def invalidate():
+    """Xoá dữ liệu đã cache (chạy sau khi transaction hiện hành commit)."""
+    transaction.on_commit(_clear)
+
+
+def get_cache_metrics():
+    cache = get_cache()
+    return {
+        "hits": cache.get(HITS_KEY, 0),
+        "misses": cache.get(MISSES_KEY, 0),
+    }
+
+
+def reset_cache_metrics():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
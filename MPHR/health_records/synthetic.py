@@ -0,0 +1,200 @@
+# health_records/synthetic.py
+"""
+Sinh dữ liệu giả (nhân viên + hồ sơ sức khỏe) và file import tương ứng, để đo hiệu năng /
+kiểm tra query plan. Tên người, khoa/phòng, chức danh và chỉ số đo theo phân bố gần với
+một bệnh viện thật. Các bảng được ghi bằng bulk_create (không phát signal); dùng trên CSDL
+thử nghiệm hoặc qua lệnh `generate_synthetic_data`.
+"""
+import random
+from datetime import date, timedelta
+
+from openpyxl import Workbook
+
+from . import rollup
+from .importers import EMPLOYEE_COLUMNS, HEALTHRECORD_COLUMNS
+from .models import (
+    Department, Employee, ExaminationType, HealthClassification, HealthRecord, compute_bmi, parse_blood_pressure,
+)
+
+DEPARTMENTS = [
+    "Khoa Khám bệnh", "Khoa Nội tổng hợp", "Khoa Ngoại tổng hợp", "Khoa Hồi sức cấp cứu", "Khoa Nhi",
+    "Khoa Phụ sản", "Khoa Xét nghiệm", "Khoa Chẩn đoán hình ảnh", "Khoa Dược", "Khoa Truyền nhiễm",
+    "Khoa Y học cổ truyền", "Khoa Răng Hàm Mặt", "Khoa Tai Mũi Họng", "Khoa Mắt", "Khoa Gây mê hồi sức",
+    "Khoa Kiểm soát nhiễm khuẩn", "Khoa Dinh dưỡng", "Phòng Kế hoạch tổng hợp", "Phòng Tổ chức cán bộ",
+    "Phòng Tài chính kế toán", "Phòng Điều dưỡng", "Phòng Hành chính quản trị", "Phòng Vật tư thiết bị y tế",
+]
+FAMILY_NAMES = [
+    ("Nguyễn", 38), ("Trần", 11), ("Lê", 9), ("Phạm", 7), ("Hoàng", 5), ("Huỳnh", 4), ("Phan", 4), ("Vũ", 4),
+    ("Võ", 4), ("Đặng", 2), ("Bùi", 2), ("Đỗ", 2), ("Hồ", 2), ("Ngô", 2), ("Dương", 1), ("Lý", 1),
+]
+MIDDLE_NAMES = {
+    "Nam": ["Văn", "Văn", "Hữu", "Đức", "Minh", "Quốc", "Thanh", "Công", "Xuân"],
+    "Nữ": ["Thị", "Thị", "Thị", "Ngọc", "Thanh", "Thu", "Kim", "Minh", "Mỹ"],
+}
+GIVEN_NAMES = {
+    "Nam": ["An", "Bình", "Cường", "Dũng", "Đạt", "Hải", "Hiếu", "Hùng", "Huy", "Khánh", "Long", "Minh",
+            "Nam", "Phong", "Phúc", "Quân", "Sơn", "Tài", "Thắng", "Tuấn", "Trung", "Việt"],
+    "Nữ": ["Anh", "Chi", "Dung", "Giang", "Hà", "Hạnh", "Hằng", "Hoa", "Hương", "Lan", "Linh", "Loan",
+           "Mai", "My", "Ngân", "Nhung", "Phương", "Quỳnh", "Thảo", "Trang", "Uyên", "Yến"],
+}
+JOB_TITLES = [("Điều dưỡng", 40), ("Bác sĩ", 22), ("Kỹ thuật viên", 10), ("Hộ sinh", 6), ("Dược sĩ", 5),
+              ("Hộ lý", 7), ("Nhân viên hành chính", 8), ("", 2)]
+POSITIONS = [("", 90), ("Trưởng khoa", 3), ("Phó trưởng khoa", 3), ("Điều dưỡng trưởng", 3), ("Trưởng phòng", 1)]
+CLASSIFICATIONS = [("I", 25), ("II", 45), ("III", 20), ("IV", 7), ("V", 1), (None, 2)]
+CONCLUSIONS = [("", 80), ("Theo dõi huyết áp", 8), ("Theo dõi đường huyết", 5), ("Rối loạn mỡ máu", 4),
+               ("Tái khám sau 6 tháng", 3)]
+VACCINES = ["Cúm", "Viêm gan B", "Cúm; Viêm gan B"]
+CLINICS = ["Bệnh viện Bến Sắn", "Trung tâm Y tế dự phòng", "Phòng khám Đa khoa Hòa Bình"]
+
+
+def _pick(rnd, weighted):
+    values, weights = zip(*weighted)
+    return rnd.choices(values, weights)[0]
+
+
+def random_person(rnd):
+    """(họ tên, giới tính) ngẫu nhiên; khoảng 2/3 nhân viên y tế là nữ."""
+    gender = "Nữ" if rnd.random() < 0.66 else "Nam"
+    name = f"{_pick(rnd, FAMILY_NAMES)} {rnd.choice(MIDDLE_NAMES[gender])} {rnd.choice(GIVEN_NAMES[gender])}"
+    return name, gender
+
+
+def random_measurements(rnd, gender):
+    """(chiều cao cm, cân nặng kg, huyết áp 'tâm thu/tâm trương')."""
+    height = round(rnd.gauss(168 if gender == "Nam" else 156, 6))
+    weight = round(rnd.gauss(22, 3) * (height / 100) ** 2, 1)
+    systolic = min(max(round(rnd.gauss(120, 14)), 90), 190)
+    diastolic = min(max(round(systolic * 0.62 + rnd.gauss(4, 6)), 55), 115)
+    return height, weight, f"{systolic}/{diastolic}"
+
+
+def department_names(n):
+    return [DEPARTMENTS[i] if i < len(DEPARTMENTS) else f"Khoa {i + 1:02d}" for i in range(n)]
+
+
+def generate(n_employees=2000, years=(2023, 2024, 2025), n_departments=20, seed=42, batch_size=1000,
+             code_prefix="SYN"):
+    """Tạo `n_employees` nhân viên, mỗi người một hồ sơ cho mỗi năm. Trả về số hồ sơ đã tạo."""
+    rnd = random.Random(seed)
+    departments = [Department.objects.get_or_create(name=name)[0] for name in department_names(n_departments)]
+    # khoa lớn nhỏ khác nhau
+    department_weights = [1 / (i + 1) ** 0.6 for i in range(len(departments))]
+    classes = {name: HealthClassification.objects.get_or_create(name=name)[0]
+               for name, _ in CLASSIFICATIONS if name}
+    exam_types = [ExaminationType.objects.get_or_create(name=name)[0] for name in ("Định kỳ", "Tuyển dụng")]
+
+    start = Employee.objects.count()
+    people = [random_person(rnd) for _ in range(n_employees)]
+    employees = Employee.objects.bulk_create([
+        Employee(
+            code=f"{code_prefix}{start + i:06d}", full_name=name, gender=gender,
+            birth_year=rnd.randint(1965, 2002),
+            job_title=_pick(rnd, JOB_TITLES), position=_pick(rnd, POSITIONS),
+            department=rnd.choices(departments, department_weights)[0],
+        )
+        for i, (name, gender) in enumerate(people)
+    ], batch_size=batch_size)
+
+    last_year = max(years, default=None)
+    records = []
+    for emp in employees:
+        for year in years:
+            height, weight, blood_pressure = random_measurements(rnd, emp.gender)
+            systolic, diastolic = parse_blood_pressure(blood_pressure)
+            hc_name = _pick(rnd, CLASSIFICATIONS)
+            vaccinated = rnd.random() < 0.4
+            # khám định kỳ tập trung từ tháng 3 đến tháng 6
+            exam_date = date(year, 3, 1) + timedelta(days=rnd.randint(0, 120)) if rnd.random() < 0.95 else None
+            records.append(HealthRecord(
+                employee=emp, year=year, exam_date=exam_date,
+                examination_type=exam_types[0] if rnd.random() < 0.97 else exam_types[1],
+                clinic_name=rnd.choice(CLINICS),
+                height_cm=height, weight_kg=weight, bmi=compute_bmi(height, weight), blood_pressure=blood_pressure,
+                systolic_bp=systolic, diastolic_bp=diastolic,
+                health_classification=classes.get(hc_name),
+                conclusion_text=_pick(rnd, CONCLUSIONS),
+                vaccinated=vaccinated, vaccine_name=rnd.choice(VACCINES) if vaccinated else None,
+                status="pending" if year == last_year and rnd.random() < 0.3 else "done",
+            ))
+            if len(records) >= batch_size * 10:
+                HealthRecord.objects.bulk_create(records, batch_size=batch_size)
+                records = []
+    HealthRecord.objects.bulk_create(records, batch_size=batch_size)
+    # bulk_create không phát signal nên dựng lại rollup
+    rollup.rebuild()
+    return len(employees) * len(years)
+
+
+# ---- file import khớp với dữ liệu đã sinh ----
+def _write_workbook(path, columns, rows):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([names[0] for names in columns.values()])
+    count = 0
+    for row in rows:
+        ws.append([row.get(key) for key in columns])
+        count += 1
+    wb.save(path)
+    return count
+
+
+def write_healthrecord_workbook(path, year, limit=None, seed=7):
+    """
+    File import hồ sơ năm `year` cho các nhân viên hiện có (tối đa `limit` người).
+    Mã nhân viên và phân loại đều khớp CSDL nên mọi dòng đều hợp lệ. Trả về số dòng.
+    """
+    rnd = random.Random(seed)
+    employees = Employee.objects.order_by("pk").values_list("code", "full_name", "gender")
+    if limit is not None:
+        employees = employees[:limit]
+
+    def rows():
+        for code, full_name, gender in employees.iterator(chunk_size=2000):
+            height, weight, blood_pressure = random_measurements(rnd, gender)
+            vaccinated = rnd.random() < 0.4
+            exam_date = date(year, 3, 1) + timedelta(days=rnd.randint(0, 120))
+            yield {
+                "code": code, "full_name": full_name, "year": year,
+                "exam_date": exam_date.strftime("%d/%m/%Y"), "exam_type": "Định kỳ",
+                "clinic": rnd.choice(CLINICS), "height": height, "weight": weight,
+                "blood_pressure": blood_pressure, "health_class": _pick(rnd, CLASSIFICATIONS[:-1]),
+                "conclusion": _pick(rnd, CONCLUSIONS) or None,
+                "vaccine": rnd.choice(VACCINES) if vaccinated else None,
+                "vaccination_date": (exam_date + timedelta(days=rnd.randint(0, 30))).strftime("%d/%m/%Y")
+                if vaccinated else None,
+            }
+
+    return _write_workbook(path, HEALTHRECORD_COLUMNS, rows())
+
+
+def write_employee_workbook(path, limit=None, n_new=0, seed=11, code_prefix="SYN"):
+    """
+    File import nhân viên: `limit` nhân viên hiện có (chức vụ đổi thành "Tổ trưởng", tức
+    là dòng cập nhật) và `n_new` nhân viên mới. Trả về (số dòng, danh sách mã mới).
+    """
+    rnd = random.Random(seed)
+    existing = Employee.objects.select_related("department").order_by("pk")
+    if limit is not None:
+        existing = existing[:limit]
+    start = Employee.objects.count()
+    new_codes = [f"{code_prefix}{start + i:06d}" for i in range(n_new)]
+    # khoa/phòng đã có, để dòng mới không bị báo "chưa có khoa/phòng"
+    department_list = list(Department.objects.values_list("name", flat=True)) or DEPARTMENTS
+
+    def rows():
+        for emp in existing.iterator(chunk_size=2000):
+            yield {
+                "code": emp.code, "full_name": emp.full_name,
+                "department": emp.department.name if emp.department else None,
+                "gender": emp.gender, "job_title": emp.job_title, "position": "Tổ trưởng",
+                "birth_year": emp.birth_year,
+            }
+        for code in new_codes:
+            name, gender = random_person(rnd)
+            yield {
+                "code": code, "full_name": name, "department": rnd.choice(department_list),
+                "gender": gender, "job_title": _pick(rnd, JOB_TITLES), "position": "",
+                "birth_year": rnd.randint(1965, 2002),
+            }
+
+    return _write_workbook(path, EMPLOYEE_COLUMNS, rows()), new_codes
@@ -1,3 +1,1781 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from unittest import mock, skipUnless
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, QuerySet, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+import numpy as np
+import pandas as pd
+
+from . import anthropometrics, jobs, metrics, rollup, search, staging, stats, synthetic
+from .management.commands.check_query_plans import scan_failures
+from .management.commands.check_startup import parse_importtime
+from .forms import HealthRecordForm
+from .exporters import CSV_CONTENT_TYPE, EXPORT_HEADERS, XLSX_CONTENT_TYPE, parquet_available
+from .importers import (
+    HEALTHRECORD_COLUMNS, build_employee_map, build_name_map, parse_blood_pressure_column, parse_date_cell,
+    parse_healthrecord_frame, preview_counts, upsert_employees, upsert_health_records,
+)
+from .pagination import decode_cursor, encode_cursor
+from .readers import estimate_rows, iter_row_chunks, resolve_columns, spool_upload
+from .models import (
+    CONCLUSION_FIT, CONCLUSION_LIMITED, Department, Employee, EmployeeTemp, HealthClassification, HealthRecord,
+    HealthRecordRollup, HealthRecordTemp, ImportJob, compute_bmi, compute_conclusion, parse_blood_pressure,
+)
+from .views import NO_CONCLUSION_LABEL, PREVIEW_PAGE_SIZE
+
+
+# Benchmark chạy lâu (hàng trăm nghìn dòng) chỉ chạy khi đặt MPHR_BENCHMARKS=1
+RUN_BENCHMARKS = bool(os.environ.get("MPHR_BENCHMARKS"))
+# Số dòng cho benchmark so sánh định dạng xuất, vd. MPHR_BENCHMARK_ROWS=10000,100000
+BENCHMARK_EXPORT_ROWS = [
+    int(n) for n in os.environ.get("MPHR_BENCHMARK_ROWS", "10000,100000,1000000").split(",") if n.strip()
+]
+
+
+def make_dataset(n_employees=60, years=(2023, 2024, 2025), seed=42, code_prefix="NV"):
+    """Sinh dữ liệu ngẫu nhiên (có các trường hợp biên về kết luận / phân loại)."""
+    rnd = random.Random(seed)
+    dept, _ = Department.objects.get_or_create(name="Khoa Nội")
+    classes = [
+        HealthClassification.objects.get_or_create(name=name)[0]
+        for name in ["I", "II", "III", "IV", " iv ", "V", "Loại khác"]
+    ]
+    conclusions = [None, "", "   ", "Đủ sức khoẻ làm việc", "Theo dõi huyết áp", " Theo dõi huyết áp "]
+    employees = Employee.objects.bulk_create([
+        Employee(code=f"{code_prefix}{i:04d}", full_name=f"Nhân viên {i}", department=dept,
+                 gender=rnd.choice(["Nam", "Nữ", None]))
+        for i in range(n_employees)
+    ])
+    HealthRecord.objects.bulk_create([
+        HealthRecord(
+            employee=emp, year=year,
+            health_classification=rnd.choice(classes + [None]),
+            conclusion_text=rnd.choice(conclusions),
+        )
+        for emp in employees for year in years
+    ])
+    # bulk_create không phát signal nên dựng lại rollup
+    rollup.rebuild()
+
+
+HEALTHRECORD_IMPORT_HEADER = [
+    "Mã nhân viên", "Họ và tên", "Năm khám", "Ngày khám", "Loại khám", "Cơ sở khám",
+    "Chiều cao (cm)", "Cân nặng (kg)", "Huyết áp (mmHg)", "Phân loại sức khoẻ",
+    "Kết luận (nếu muốn nhập tay)", "Đã tiêm vắc-xin", "Ngày tiêm chủng", "Ghi chú",
+]
+
+
+def make_healthrecord_workbook(n_rows, n_employees=60, seed=7):
+    """File Excel import hồ sơ (dạng SimpleUploadedFile), mã NV lặp lại theo vòng."""
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(HEALTHRECORD_IMPORT_HEADER)
+    for i in range(n_rows):
+        ws.append([
+            f"nv{i % (n_employees + 5):04d}", f"Nhân viên {i}", 2025, f"{1 + i % 28:02d}/03/2025",
+            "Định kỳ", "Bệnh viện Bến Sắn", f"{rnd.randint(150, 185)} cm", f"{rnd.randint(45, 90)},5",
+            "120/80", rnd.choice(["I", "ii", "III", "IV", "VII", None]), None,
+            rnd.choice(["Cúm; Viêm gan B", None]), rnd.choice(["05/04/2025", "không rõ", None]), None,
+        ])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return SimpleUploadedFile("import.xlsx", buffer.getvalue())
+
+
+def legacy_parse_rows(df, employee_map, hc_map):
+    """Vòng lặp theo dòng cũ của healthrecord_import_preview_ajax (dùng làm chuẩn so sánh)."""
+    def get(row, name):
+        value = row.get(name) if name in df.columns else None
+        return None if pd.isna(value) else value
+
+    rows = []
+    for _, row in df.iterrows():
+        code = get(row, 'Mã nhân viên')
+        full_name = get(row, 'Họ và tên')
+        year_raw = get(row, 'Năm khám')
+        raw_exam_date = get(row, 'Ngày khám')
+        height_raw = get(row, 'Chiều cao (cm)')
+        weight_raw = get(row, 'Cân nặng (kg)')
+        health_raw = get(row, 'Phân loại sức khoẻ')
+        vaccine_cell = get(row, 'Đã tiêm vắc-xin')
+        raw_vac_date = get(row, 'Ngày tiêm chủng')
+        texts = {field: get(row, col) for field, col in [
+            ('examination_type_name', 'Loại khám'), ('clinic_name', 'Cơ sở khám'),
+            ('blood_pressure', 'Huyết áp (mmHg)'), ('conclusion_text', 'Kết luận (nếu muốn nhập tay)'),
+            ('note', 'Ghi chú'),
+        ]}
+
+        is_valid = True
+        error_message = None
+        code_clean = str(code).strip() if code else None
+        if not code_clean:
+            is_valid = False
+            error_message = "Thiếu Mã nhân viên"
+        emp_obj = None
+        if code_clean:
+            emp_obj = employee_map.get(code_clean.upper())
+            if not emp_obj:
+                is_valid = False
+                error_message = (error_message or "") + "; Mã nhân viên không tồn tại"
+        exam_date_parsed = None
+        if raw_exam_date is not None and str(raw_exam_date).strip() != '':
+            exam_date_parsed = parse_date_cell(raw_exam_date)
+            if exam_date_parsed is None:
+                is_valid = False
+                error_message = (error_message or "") + "; Ngày khám không hợp lệ"
+        vac_date_parsed = None
+        if raw_vac_date is not None and str(raw_vac_date).strip() != '':
+            vac_date_parsed = parse_date_cell(raw_vac_date)
+            if vac_date_parsed is None:
+                is_valid = False
+                error_message = (error_message or "") + "; Ngày tiêm không hợp lệ"
+        height_val = weight_val = None
+        try:
+            if height_raw is not None and str(height_raw).strip() != '':
+                height_val = float(str(height_raw).replace(',', '.').replace('cm', '').strip())
+        except ValueError:
+            is_valid = False
+            error_message = (error_message or "") + "; Chiều cao không đúng định dạng"
+        try:
+            if weight_raw is not None and str(weight_raw).strip() != '':
+                weight_val = float(str(weight_raw).replace(',', '.').replace('kg', '').strip())
+        except ValueError:
+            is_valid = False
+            error_message = (error_message or "") + "; Cân nặng không đúng định dạng"
+        if health_raw and str(health_raw).strip().upper() not in hc_map:
+            error_message = (error_message or "") + "; Phân loại sức khoẻ chưa có trong danh mục"
+        vaccinated_flag = False
+        vaccine_name_value = None
+        if vaccine_cell and str(vaccine_cell).strip():
+            parts = [p.strip() for p in re.split(r'[;,]', str(vaccine_cell).strip()) if p.strip()]
+            if parts:
+                vaccine_name_value = '; '.join(parts)
+                vaccinated_flag = True
+        if not vaccinated_flag and raw_vac_date and vac_date_parsed:
+            vaccinated_flag = True
+
+        rows.append(dict(
+            employee_code=code_clean,
+            employee_name=(emp_obj.full_name if emp_obj else (str(full_name).strip() if full_name else None)),
+            year=(int(year_raw) if (year_raw is not None and str(year_raw).strip().isdigit())
+                  else (exam_date_parsed.year if exam_date_parsed else None)),
+            exam_date=exam_date_parsed,
+            height_cm=height_val,
+            weight_kg=weight_val,
+            health_classification_name=(str(health_raw).strip() if health_raw else None),
+            vaccinated=vaccinated_flag,
+            vaccine_name=(vaccine_name_value if vaccinated_flag and vaccine_name_value else None),
+            vaccination_date=vac_date_parsed,
+            is_valid=is_valid,
+            error_message=(error_message.strip(' ;') if error_message else None),
+            **{field: (str(value).strip() if value else None) for field, value in texts.items()},
+        ))
+    return rows
+
+
+def make_golden_frame():
+    """Các ô "khó" gặp trong file thực tế: ngày nhiều định dạng, đơn vị đo, ô trống, khoảng trắng..."""
+    header = HEALTHRECORD_IMPORT_HEADER
+    rows = [
+        ["NV0001", "Tên trong file", 2025, datetime(2025, 3, 1), "Định kỳ", " BV Bến Sắn ",
+         "170 cm", "65,5", "120/80", "ii", "", "Cúm; Viêm gan B", "05/04/2025", "  ghi chú  "],
+        [" nv0002 ", None, "2024", "2024-03-02", None, None, 165, "70kg", None, " IV ", "  ", "Cúm,, Viêm gan B ;\tDại ;", None, None],
+        ["NV0003", "A", None, "31/12/2024", "Lần đầu", "", "abc", "60", "130 / 85 mmHg", "VII", "Tự ghi",
+         ";", "2025-01-02", None],
+        ["NV0004", "B", "năm nay", "không rõ", None, None, None, None, None, None, None, None, "13/13/2025", None],
+        ["XX9999", "Không có", 2025, "5/4/2025", None, None, "  ", "", None, "", None, None, datetime(2025, 2, 3), 0],
+        ["NV0005", "C", 2023, " 01/02/2023 ", None, None, "180,25cm", "81.2", None, "III", None, "Dại", "", None],
+        ["NV0006", "D", 2022.0, "02.03.2022", None, None, "1,5,0", "x", None, "I", None, None, "1/2/22", None],
+    ]
+    return pd.DataFrame(rows, columns=header)
+
+
+class ConclusionCountTests(TestCase):
+    def test_home_counts_match_python_property(self):
+        make_dataset()
+        stats.get_cache().clear()
+        expected = Counter(
+            compute_conclusion(r.conclusion_text, r.health_classification.name if r.health_classification else None)
+            or NO_CONCLUSION_LABEL
+            for r in HealthRecord.objects.select_related("health_classification")
+        )
+        context = self.client.get(reverse("home")).context
+        actual = dict(zip(json.loads(context["conclusion_labels"]), json.loads(context["conclusion_counts"])))
+        self.assertEqual(actual, dict(expected))
+
+
+class ConclusionColumnTests(TestCase):
+    def setUp(self):
+        self.employee = Employee.objects.create(code="KL0001", full_name="Nguyễn Văn A")
+        self.hc_ii = HealthClassification.objects.create(name="II")
+        self.hc_v = HealthClassification.objects.create(name="V")
+
+    def test_computed_on_save_and_bulk_create(self):
+        record = HealthRecord.objects.create(employee=self.employee, year=2024, health_classification=self.hc_ii)
+        self.assertEqual(record.conclusion, CONCLUSION_FIT)
+        record.conclusion_text = "  Theo dõi huyết áp "
+        record.save(update_fields=["conclusion_text"])
+        self.assertEqual(HealthRecord.objects.get(pk=record.pk).conclusion, "Theo dõi huyết áp")
+
+        created = HealthRecord.objects.bulk_create([
+            HealthRecord(employee=self.employee, year=2025, health_classification_id=self.hc_v.pk),
+            HealthRecord(employee=self.employee, year=2026, health_classification_id=self.hc_ii.pk,
+                         conclusion_text="   "),
+        ])
+        self.assertEqual([r.conclusion for r in created], ["", ""])
+
+    def test_rename_updates_records_in_one_statement(self):
+        make_dataset(n_employees=10)
+        hc = HealthClassification.objects.get(name="V")
+        hc.name = "iii"
+        with CaptureQueriesContext(connection) as ctx:
+            hc.save()
+        updates = [q["sql"] for q in ctx.captured_queries
+                   if q["sql"].startswith('UPDATE "health_records_healthrecord"')]
+        self.assertEqual(len(updates), 1)
+        for record in HealthRecord.objects.select_related("health_classification"):
+            self.assertEqual(record.conclusion, compute_conclusion(
+                record.conclusion_text, record.health_classification.name if record.health_classification else None))
+        RollupTests.assertRollupConsistent(self)
+
+        self.assertTrue(HealthRecord.objects.filter(health_classification=hc, conclusion=CONCLUSION_FIT).exists())
+
+        hc.delete()
+        orphans = HealthRecord.objects.filter(health_classification=None).exclude(conclusion_text__gt="")
+        self.assertEqual(set(orphans.values_list("conclusion", flat=True)), {""})
+        RollupTests.assertRollupConsistent(self)
+
+    def test_list_filters_on_column(self):
+        HealthRecord.objects.create(employee=self.employee, year=2024, health_classification=self.hc_ii)
+        HealthRecord.objects.create(employee=self.employee, year=2025, health_classification=self.hc_v,
+                                    conclusion_text="Theo dõi huyết áp")
+        response = self.client.get(reverse("healthrecord_list"), {"conclusion": CONCLUSION_FIT})
+        self.assertEqual([r.year for r in response.context["records"]], [2024])
+        self.assertEqual(list(response.context["conclusions"]), ["Theo dõi huyết áp", CONCLUSION_FIT])
+
+
+class DashboardStatsCacheTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+
+    def test_home_is_served_from_cache_until_data_changes(self):
+        make_dataset(n_employees=5)
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response.context["total_records"], 15)
+        self.assertEqual(stats.get_cache_metrics(), {"hits": 1, "misses": 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HealthRecord.objects.first().delete()
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response.context["total_records"], 14)
+        self.assertEqual(stats.get_cache_metrics(), {"hits": 1, "misses": 2})
+
+    def test_cache_alias_is_shared_between_processes(self):
+        from django.core.cache.backends.locmem import LocMemCache
+
+        self.assertNotIsInstance(stats.get_cache(), LocMemCache)
+
+
+class RollupTests(TestCase):
+    def assertRollupConsistent(self):
+        stored = {
+            tuple(getattr(row, field) for _, field in rollup.DIMENSIONS): row.count
+            for row in HealthRecordRollup.objects.all()
+        }
+        self.assertEqual(stored, dict(rollup.group_counts(HealthRecord.objects.all())))
+
+    def test_incremental_updates_match_rebuild(self):
+        make_dataset(n_employees=10)
+        self.assertRollupConsistent()
+
+        record = HealthRecord.objects.first()
+        record.health_classification = HealthClassification.objects.get(name="IV")
+        record.conclusion_text = ""
+        record.vaccinated = not record.vaccinated
+        record.save()
+        self.assertRollupConsistent()
+
+        employee = Employee.objects.first()
+        employee.gender = "Nữ" if employee.gender != "Nữ" else "Nam"
+        employee.department = Department.objects.create(name="Khoa Ngoại")
+        employee.save()
+        self.assertRollupConsistent()
+
+        new_employee = Employee.objects.create(code="NV9999", full_name="Nhân viên mới")
+        HealthRecord.objects.create(employee=new_employee, year=2026, status="done")
+        self.assertRollupConsistent()
+
+        hc = HealthClassification.objects.get(name="V")
+        hc.name = "iii"
+        hc.save()
+        self.assertRollupConsistent()
+
+        HealthClassification.objects.get(name="II").delete()
+        Department.objects.get(name="Khoa Ngoại").delete()
+        Employee.objects.last().delete()
+        HealthRecord.objects.last().delete()
+        self.assertRollupConsistent()
+
+    def test_classification_save_without_rename_skips_records(self):
+        make_dataset(n_employees=10)
+        hc = HealthClassification.objects.get(name="II")
+        # đọc tên cũ + UPDATE chính phân loại; không chụp / cập nhật hồ sơ
+        with self.assertNumQueries(2):
+            hc.save()
+        self.assertRollupConsistent()
+
+    def test_delete_deltas_do_not_list_record_ids(self):
+        make_dataset(n_employees=10)
+        with CaptureQueriesContext(connection) as ctx:
+            HealthClassification.objects.get(name="II").delete()
+        rollup_reads = [q["sql"] for q in ctx.captured_queries if "GROUP BY" in q["sql"]]
+        self.assertEqual(len(rollup_reads), 2)
+        self.assertTrue(all(" IN (" not in sql for sql in rollup_reads))
+        self.assertRollupConsistent()
+
+    def test_one_row_per_group_even_with_null_dimensions(self):
+        key = dict(year=2024, department=None, gender=None, health_classification=None, conclusion="",
+                   vaccinated=False, status="done")
+        HealthRecordRollup.objects.create(count=1, **key)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            HealthRecordRollup.objects.create(count=1, **key)
+
+    def test_concurrent_insert_of_same_group_is_merged(self):
+        key = (2024, None, None, None, "", False, "done")
+        HealthRecordRollup.objects.create(count=2, **dict(zip((f for _, f in rollup.DIMENSIONS), key)))
+        original_update = QuerySet.update
+        missed = []
+
+        def update(queryset, **kwargs):
+            # lần UPDATE đầu không thấy dòng (dòng do transaction khác vừa commit)
+            if not missed:
+                missed.append(True)
+                return 0
+            return original_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, "update", autospec=True, side_effect=update):
+            rollup.apply_delta({}, {key: 3})
+        self.assertEqual(list(HealthRecordRollup.objects.values_list("count", flat=True)), [5])
+
+    def test_home_reads_rollup(self):
+        make_dataset(n_employees=5)
+        stats.get_cache().clear()
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response.context["total_records"], 15)
+        self.assertEqual(sum(json.loads(response.context["conclusion_counts"])), 15)
+
+
+@override_settings(HEALTH_IMPORT_JOBS_ASYNC=False)
+class HealthRecordImportPreviewTests(TestCase):
+    def preview_select_queries(self, n_rows):
+        upload = make_healthrecord_workbook(n_rows)
+        stats.get_cache().clear()  # lần dọn dữ liệu tạm (staging.maybe_purge) chạy ở cả hai lần
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse("healthrecord_import_preview_ajax"), {"file": upload})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "done")
+        return [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+
+    def test_lookup_queries_do_not_grow_with_rows(self):
+        make_dataset(n_employees=60)
+        small = self.preview_select_queries(100)
+        large = self.preview_select_queries(10_000)
+        self.assertEqual(len(small), len(large))
+
+    def test_unknown_codes_and_classifications_are_reported(self):
+        make_dataset(n_employees=60)
+        self.preview_select_queries(200)
+        temps = HealthRecordTemp.objects.all()
+        self.assertTrue(temps.filter(employee_code="nv0064", is_valid=False,
+                                     error_message__contains="Mã nhân viên không tồn tại").exists())
+        self.assertEqual(temps.filter(employee_code="nv0001").first().employee_name, "Nhân viên 1")
+        self.assertFalse(temps.filter(health_classification_name="ii",
+                                      error_message__contains="Phân loại").exists())
+        self.assertTrue(temps.filter(health_classification_name="VII",
+                                     error_message__contains="Phân loại sức khoẻ chưa có").exists())
+
+
+@override_settings(HEALTH_IMPORT_JOBS_ASYNC=False)
+class HealthRecordImportSubmitTests(TestCase):
+    def test_bulk_upsert_counts_and_values(self):
+        make_dataset(n_employees=50, years=(2024,))
+        hc_iv = HealthClassification.objects.get(name="IV")
+        HealthRecordTemp.objects.bulk_create(
+            [HealthRecordTemp(batch_id="b1", employee_code=f"nv{i:04d}", year=year, clinic_name=f"PK {i}",
+                              health_classification_name="iv", vaccinated=False, vaccine_name="Cúm")
+             for i in range(60) for year in (2024, 2025)]
+            # dòng trùng (employee, year) trong cùng batch chỉ tạo một hồ sơ
+            + [HealthRecordTemp(batch_id="b1", employee_code="NV0000", year=2025, clinic_name="Dòng trùng")]
+        )
+        claim_batch(self.client, "b1")
+        url = reverse("healthrecord_import_submit_ajax", args=["b1"])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url)
+        # ngoài INSERT theo lô, cập nhật rollup (theo nhóm) và savepoint, không có truy vấn theo từng dòng
+        import_queries = [
+            q for q in ctx.captured_queries
+            if "healthrecordrollup" not in q["sql"] and "importjob" not in q["sql"]
+            and not q["sql"].startswith(("INSERT", "SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        self.assertLess(len(import_queries), 12)
+
+        data = response.json()
+        self.assertEqual(data["status"], "done")
+        self.assertEqual((data["result"]["created"], data["result"]["updated"]), (50, 50))
+        self.assertEqual(HealthRecord.objects.count(), 100)
+        self.assertFalse(HealthRecordTemp.objects.filter(batch_id="b1").exists())
+
+        record = HealthRecord.objects.get(employee__code="NV0001", year=2024)
+        self.assertEqual((record.clinic_name, record.health_classification, record.vaccine_name, record.conclusion),
+                         ("PK 1", hc_iv, None, CONCLUSION_LIMITED))
+        RollupTests.assertRollupConsistent(self)
+
+
+class HealthRecordFrameParserTests(TestCase):
+    FIELDS = [
+        "employee_code", "employee_name", "year", "exam_date", "examination_type_name", "clinic_name",
+        "height_cm", "weight_kg", "blood_pressure", "health_classification_name", "conclusion_text",
+        "vaccinated", "vaccine_name", "vaccination_date", "note", "is_valid", "error_message",
+    ]
+
+    def setUp(self):
+        make_dataset(n_employees=10)
+        self.employee_map = build_employee_map(f"NV{i:04d}" for i in range(10))
+        self.hc_map = build_name_map(HealthClassification.objects.all())
+
+    def parse(self, df):
+        temps = parse_healthrecord_frame(df, "b1", self.employee_map, self.hc_map)
+        return [{field: getattr(t, field) for field in self.FIELDS} for t in temps]
+
+    def test_matches_row_loop_on_golden_file(self):
+        df = make_golden_frame()
+        self.assertEqual(self.parse(df), legacy_parse_rows(df, self.employee_map, self.hc_map))
+
+    def test_missing_code_is_reported(self):
+        df = pd.DataFrame([[None, "Không mã", 2025]], columns=["Mã nhân viên", "Họ và tên", "Năm khám"])
+        row = self.parse(df)[0]
+        self.assertEqual((row["employee_code"], row["is_valid"], row["error_message"]),
+                         ("", False, "Thiếu Mã nhân viên"))
+
+    @skipUnless(RUN_BENCHMARKS, "đặt MPHR_BENCHMARKS=1 để chạy benchmark")
+    def test_faster_than_row_loop(self):
+        df = pd.concat([make_golden_frame()] * 300, ignore_index=True)
+        start = time.perf_counter()
+        self.parse(df)
+        vectorized = time.perf_counter() - start
+        start = time.perf_counter()
+        legacy_parse_rows(df, self.employee_map, self.hc_map)
+        legacy = time.perf_counter() - start
+        self.assertLess(vectorized, legacy)
+
+
+class BloodPressureTests(TestCase):
+    VALUES = ["120/80", " 130 / 85 mmHg", "HA 145/95", "120", "bình thường", "12/8", "999/80", "", None, 140.0]
+
+    def test_column_parser_matches_scalar(self):
+        col = pd.Series(self.VALUES, dtype=object)
+        systolic, diastolic = parse_blood_pressure_column(col)
+        self.assertEqual(
+            [(None if pd.isna(a) else a, None if pd.isna(b) else b) for a, b in zip(systolic, diastolic)],
+            [parse_blood_pressure(v) for v in self.VALUES],
+        )
+        self.assertEqual(parse_blood_pressure(" 130 / 85 mmHg"), (130, 85))
+        self.assertEqual(parse_blood_pressure("999/80"), (None, None))
+
+    def test_parsed_on_save_and_form(self):
+        employee = Employee.objects.create(code="HA0001", full_name="Trần Thị B")
+        record = HealthRecord.objects.create(employee=employee, year=2025, blood_pressure="150/95")
+        self.assertEqual((record.systolic_bp, record.diastolic_bp), (150, 95))
+        record.blood_pressure = "không đo"
+        record.save(update_fields=["blood_pressure"])
+        record.refresh_from_db()
+        self.assertEqual((record.systolic_bp, record.diastolic_bp), (None, None))
+
+        form = HealthRecordForm(instance=record, data={
+            "employee": employee.pk, "year": 2025, "blood_pressure": "118 / 76", "status": "done",
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        record.refresh_from_db()
+        self.assertEqual((record.systolic_bp, record.diastolic_bp), (118, 76))
+
+    def test_preview_parses_and_warns(self):
+        make_dataset(n_employees=3)
+        df = pd.DataFrame([["NV0000", 2025, "140/90"], ["NV0001", 2025, "cao"]],
+                          columns=["Mã nhân viên", "Năm khám", "Huyết áp (mmHg)"])
+        hc_map = build_name_map(HealthClassification.objects.all())
+        temps = parse_healthrecord_frame(df, "b1", build_employee_map(["NV0000", "NV0001"]), hc_map)
+        self.assertEqual([(t.systolic_bp, t.diastolic_bp) for t in temps], [(140, 90), (None, None)])
+        self.assertEqual([t.is_valid for t in temps], [True, True])
+        self.assertIn("Huyết áp", temps[1].error_message)
+
+    def test_range_filters_in_list_and_export(self):
+        employee = Employee.objects.create(code="HA0001", full_name="Trần Thị B")
+        for year, bp in [(2024, "150/95"), (2025, "145/88"), (2026, "120/80")]:
+            HealthRecord.objects.create(employee=employee, year=year, blood_pressure=bp)
+        HealthRecord.objects.create(employee=Employee.objects.create(code="HA0002", full_name="Lê Văn C"),
+                                    year=2025, blood_pressure="125/92")
+
+        response = self.client.get(reverse("healthrecord_list"), {"year": "2025", "systolic_min": "140"})
+        self.assertEqual([(r.employee.code, r.year) for r in response.context["records"]], [("HA0001", 2025)])
+        self.assertEqual(response.context["total_count"], 1)
+        response = self.client.get(reverse("healthrecord_list"), {"diastolic_min": "90", "systolic_max": "149"})
+        self.assertEqual({r.blood_pressure for r in response.context["records"]}, {"125/92"})
+
+        response = self.client.get(reverse("healthrecord_export"), {"format": "csv", "systolic_min": "140"})
+        df = pd.read_csv(io.BytesIO(b"".join(response.streaming_content)), dtype=str)
+        self.assertEqual(sorted(df["Năm khám"]), ["2024", "2025"])
+
+
+class AnthropometricReportTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+
+    def test_bmi_maintained_on_save_and_import(self):
+        self.assertEqual(compute_bmi(170, 65), Decimal("22.5"))
+        self.assertIsNone(compute_bmi(None, 65))
+        self.assertIsNone(compute_bmi(1.7, 65))  # chiều cao nhập theo mét
+
+        employee = Employee.objects.create(code="BM0001", full_name="Phạm Văn D")
+        record = HealthRecord.objects.create(employee=employee, year=2024, height_cm=160, weight_kg=64)
+        self.assertEqual(record.bmi, Decimal("25.0"))
+        record.weight_kg = 51.2
+        record.save(update_fields=["weight_kg"])
+        record.refresh_from_db()
+        self.assertEqual(record.bmi, Decimal("20.0"))
+
+        upsert_health_records([
+            HealthRecordTemp(batch_id="b1", employee_code="BM0001", year=year, height_cm=Decimal("155.00"),
+                             weight_kg=Decimal("60.00"))
+            for year in (2024, 2025)
+        ])
+        self.assertEqual(set(HealthRecord.objects.values_list("bmi", flat=True)), {Decimal("25.0")})
+
+    def test_report_matches_per_group_computation(self):
+        synthetic.generate(n_employees=200, years=(2024, 2025))
+        # vài hồ sơ thiếu số đo / không có khoa
+        HealthRecord.objects.filter(pk__in=HealthRecord.objects.order_by("pk").values("pk")[:10]).update(
+            bmi=None, systolic_bp=None)
+        Employee.objects.filter(pk__in=Employee.objects.order_by("pk").values("pk")[:5]).update(department=None)
+
+        with self.assertNumQueries(1):
+            report = anthropometrics.build_report()
+
+        groups = {}
+        for dept, year, bmi, systolic in HealthRecord.objects.values_list(
+                "employee__department__name", "year", "bmi", "systolic_bp"):
+            groups.setdefault((dept or anthropometrics.NO_DEPARTMENT_LABEL, year), []).append((bmi, systolic))
+        self.assertEqual(len(report["departments"]), len(groups))
+        for item in report["departments"]:
+            rows = groups[(item["department"], item["year"])]
+            bmi = [float(b) for b, _ in rows if b is not None]
+            systolic = [s for _, s in rows if s is not None]
+            self.assertEqual(item["records"], len(rows))
+            self.assertEqual(item["bmi"]["categories"], {
+                "Thiếu cân": sum(b < 18.5 for b in bmi),
+                "Bình thường": sum(18.5 <= b < 23 for b in bmi),
+                "Thừa cân": sum(23 <= b < 25 for b in bmi),
+                "Béo phì": sum(b >= 25 for b in bmi),
+            })
+            self.assertEqual(sum(item["bmi"]["histogram"]), len(bmi))
+            self.assertEqual(item["systolic"]["hypertension"], sum(s >= 140 for s in systolic))
+            if systolic:
+                self.assertAlmostEqual(item["systolic"]["percentiles"]["p50"], float(np.median(systolic)), places=1)
+        self.assertEqual([y["records"] for y in report["years"]], [200, 200])
+
+    def test_endpoint_is_cached_per_year(self):
+        synthetic.generate(n_employees=30, years=(2024, 2025))
+        url = reverse("anthropometric_report")
+        data = self.client.get(url, {"year": "2025"}).json()
+        self.assertEqual((data["year"], [y["year"] for y in data["years"]]), (2025, [2025]))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url, {"year": "2025"}).json(), data)
+        self.assertFalse(any("health_records_healthrecord" in q["sql"] for q in ctx.captured_queries))
+        self.assertEqual([y["year"] for y in self.client.get(url).json()["years"]], [2024, 2025])
+        self.assertEqual(self.client.get(url, {"year": "abc"}).status_code, 400)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HealthRecord.objects.filter(year=2025).first().delete()
+        self.assertEqual(self.client.get(url, {"year": "2025"}).json()["years"][0]["records"], 29)
+
+
+class HealthRecordExportTests(TestCase):
+    def export_peak_memory(self):
+        tracemalloc.start()
+        try:
+            response = self.client.get(reverse("healthrecord_export"))
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(size, 0)
+        return peak
+
+    def assertBoundedMemory(self, small_employees, large_employees):
+        """Xuất 10 năm hồ sơ với ít rồi nhiều nhân viên; bộ nhớ đỉnh không được tăng theo số dòng."""
+        make_dataset(n_employees=small_employees, years=range(2016, 2026))
+        small = self.export_peak_memory()
+        make_dataset(n_employees=large_employees - small_employees, years=range(2016, 2026), code_prefix="NVB")
+        large = self.export_peak_memory()
+        self.assertLess(large, small * 1.5 + 1_000_000)
+
+    def test_export_content(self):
+        make_dataset(n_employees=3, years=(2025,))
+        record = HealthRecord.objects.select_related("employee").first()
+        response = self.client.get(reverse("healthrecord_export"), {"q": record.employee.code})
+        self.assertEqual(response["Content-Type"], XLSX_CONTENT_TYPE)
+        df = pd.read_excel(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(list(df.columns), EXPORT_HEADERS)
+        self.assertEqual(len(df), 1)
+        self.assertEqual(df.loc[0, "Mã nhân viên"], record.employee.code)
+        self.assertEqual(df.loc[0, "Kết luận"] if pd.notna(df.loc[0, "Kết luận"]) else "", record.conclusion)
+
+    @override_settings(HEALTH_EXPORT_CHUNK_SIZE=100)
+    def test_memory_does_not_grow_with_rows(self):
+        self.assertBoundedMemory(50, 500)
+
+    @skipUnless(RUN_BENCHMARKS, "đặt MPHR_BENCHMARKS=1 để chạy benchmark")
+    def test_memory_bounded_on_200k_rows(self):
+        # mẫu nhỏ (20k dòng) đã lớn hơn một khối iterator mặc định
+        self.assertBoundedMemory(2_000, 20_000)
+
+
+class HealthRecordExportFormatTests(TestCase):
+    def export(self, export_format, **params):
+        return self.client.get(reverse("healthrecord_export"), {"format": export_format, **params})
+
+    def test_csv_content(self):
+        make_dataset(n_employees=3, years=(2025,))
+        record = HealthRecord.objects.select_related("employee").first()
+        response = self.export("csv", q=record.employee.code)
+        self.assertEqual(response["Content-Type"], CSV_CONTENT_TYPE)
+        df = pd.read_csv(io.BytesIO(b"".join(response.streaming_content)), dtype=str, keep_default_na=False)
+        self.assertEqual(list(df.columns), EXPORT_HEADERS)
+        self.assertEqual(len(df), 1)
+        self.assertEqual(df.loc[0, "Mã nhân viên"], record.employee.code)
+        self.assertEqual(df.loc[0, "Kết luận"], record.conclusion)
+        self.assertEqual(df.loc[0, "Đã tiêm vắc-xin"], "Có" if record.vaccinated else "Không")
+
+    @skipUnless(parquet_available(), "cần pyarrow")
+    def test_parquet_typed_columns(self):
+        import pyarrow.parquet as pq
+
+        make_dataset(n_employees=5, years=(2024, 2025))
+        response = self.export("parquet")
+        table = pq.read_table(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(table.column_names, EXPORT_HEADERS)
+        self.assertEqual(table.num_rows, HealthRecord.objects.count())
+        self.assertEqual(str(table.schema.field("Ngày khám").type), "date32[day]")
+        self.assertEqual(str(table.schema.field("Đã tiêm vắc-xin").type), "bool")
+        self.assertEqual(str(table.schema.field("Chiều cao (cm)").type), "decimal128(6, 2)")
+
+    def test_unknown_format_redirects(self):
+        response = self.export("pdf")
+        self.assertRedirects(response, reverse("healthrecord_list"))
+
+    @skipUnless(RUN_BENCHMARKS, "đặt MPHR_BENCHMARKS=1 để chạy benchmark")
+    def test_benchmark_formats(self):
+        """So sánh thời gian và kích thước file giữa XLSX / CSV / Parquet (10 năm hồ sơ mỗi nhân viên)."""
+        formats = ["xlsx", "csv"] + (["parquet"] if parquet_available() else [])
+        created = 0
+        for n_rows in BENCHMARK_EXPORT_ROWS:
+            make_dataset(n_employees=n_rows // 10 - created, years=range(2016, 2026), code_prefix=f"B{n_rows}_")
+            created = n_rows // 10
+            for export_format in formats:
+                start = time.perf_counter()
+                size = sum(len(chunk) for chunk in self.export(export_format).streaming_content)
+                elapsed = time.perf_counter() - start
+                print(f"\n{n_rows:>9} dòng  {export_format:<8} {elapsed:8.2f}s  {size / 1e6:8.2f} MB")
+
+
+class EmployeeListTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+        other = Department.objects.create(name="Khoa Ngoại")
+        rnd = random.Random(3)
+        Employee.objects.bulk_create([
+            Employee(code=f"NV{i:04d}", full_name=f"Nhân viên {rnd.randint(0, 20)}",
+                     department=rnd.choice([other, None]), job_title=rnd.choice(["Bác sĩ", "Điều dưỡng", "", None]))
+            for i in range(130)
+        ])
+
+    def walk(self, **params):
+        """Đi hết các trang bằng cursor `after`, trả về danh sách mã nhân viên và trang cuối."""
+        codes, cursor = [], None
+        while True:
+            query = dict(params, **({"after": cursor} if cursor else {}))
+            response = self.client.get(reverse("employee_list"), query)
+            page = response.context["page"]
+            codes += [emp.code for emp in page]
+            if not page.has_next:
+                return codes, response
+            cursor = page.next_cursor
+
+    def test_keyset_pages_cover_every_employee_in_sort_order(self):
+        for sort, key in [("code", lambda e: (e.code,)),
+                          ("full_name", lambda e: (e.full_name, e.pk)),
+                          ("department", lambda e: (e.department.name if e.department else "", e.pk))]:
+            for direction in ("asc", "desc"):
+                expected = sorted(Employee.objects.select_related("department"), key=key,
+                                  reverse=direction == "desc")
+                codes, _ = self.walk(sort=sort, dir=direction)
+                self.assertEqual(codes, [e.code for e in expected], (sort, direction))
+
+    def test_previous_cursor_returns_previous_page(self):
+        first = self.client.get(reverse("employee_list"), {"sort": "full_name"}).context["page"]
+        second = self.client.get(reverse("employee_list"), {"sort": "full_name", "after": first.next_cursor}).context["page"]
+        back = self.client.get(reverse("employee_list"), {"sort": "full_name", "before": second.previous_cursor}).context["page"]
+        self.assertEqual([e.pk for e in back], [e.pk for e in first])
+        self.assertFalse(back.has_previous)
+
+    def test_query_count_does_not_grow_with_table(self):
+        self.client.get(reverse("employee_list"))
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse("employee_list"))
+        Employee.objects.bulk_create([Employee(code=f"X{i:05d}", full_name="Khác") for i in range(2000)])
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse("employee_list"))
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(response.context["employees"]), 50)
+        # lựa chọn bộ lọc được lấy từ cache, không còn truy vấn distinct(job_title)
+        self.assertFalse(any("DISTINCT" in q["sql"] for q in large.captured_queries))
+
+    def test_filter_options_refresh_after_change(self):
+        response = self.client.get(reverse("employee_list"))
+        self.assertEqual(response.context["job_titles"], ["Bác sĩ", "Điều dưỡng"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Employee.objects.create(code="NEW", full_name="Mới", job_title="Dược sĩ")
+        response = self.client.get(reverse("employee_list"))
+        self.assertIn("Dược sĩ", response.context["job_titles"])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor("not-a-cursor"))
+        self.assertEqual(decode_cursor(encode_cursor("Nhân viên 1", 7)), ("Nhân viên 1", 7))
+        response = self.client.get(reverse("employee_list"), {"after": "%%%"})
+        self.assertEqual(response.context["employees"][0].code, "NV0000")
+
+
+class EmployeeSearchTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+        dept = Department.objects.create(name="Khoa Nội")
+        for code, name in [("NV0012", "Nguyễn Văn An"), ("NV0013", "Trần Thị Bình"),
+                           ("BS0001", "Lê Đức Anh"), ("BS0002", "Nguyễn Vân")]:
+            emp = Employee.objects.create(code=code, full_name=name, department=dept)
+            HealthRecord.objects.create(employee=emp, year=2024)
+
+    def list_codes(self, q):
+        response = self.client.get(reverse("employee_list"), {"q": q})
+        return sorted(emp.code for emp in response.context["employees"])
+
+    def test_fold_removes_diacritics_and_case(self):
+        self.assertEqual(search.fold("  Nguyễn Văn ĐỨC "), "nguyen van duc")
+        self.assertEqual(search.fold("NV-0012"), "nv 0012")
+        self.assertEqual(search.employee_search_key("NV01", "Lê Thị Ánh"), "nv01 le thi anh")
+
+    def test_search_ignores_accents_and_matches_word_prefixes(self):
+        self.assertEqual(self.list_codes("Nguyen Van A"), ["NV0012"])
+        self.assertEqual(self.list_codes("nguyễn vân"), ["BS0002", "NV0012"])
+        self.assertEqual(self.list_codes("duc"), ["BS0001"])
+        self.assertEqual(self.list_codes("Đức"), ["BS0001"])
+        self.assertEqual(self.list_codes("nv001"), ["NV0012", "NV0013"])
+        self.assertEqual(self.list_codes("binh nv0013"), ["NV0013"])
+        self.assertEqual(self.list_codes('"an" OR *'), [])  # cú pháp FTS bị bỏ qua, không lỗi
+
+    def test_search_matches_part_of_code_and_name(self):
+        self.assertEqual(self.list_codes("0012"), ["NV0012"])
+        self.assertEqual(self.list_codes("0001"), ["BS0001"])
+        self.assertEqual(self.list_codes("uyen"), ["BS0002", "NV0012"])
+        self.assertEqual(self.list_codes("th binh"), ["NV0013"])  # từ khoá ngắn vẫn khớp đầu từ
+        self.assertEqual(self.list_codes("hi binh"), [])
+        self.assertEqual([r["code"] for r in search.autocomplete_employees("012")], ["NV0012"])
+
+    def test_index_follows_save_delete_and_bulk_writes(self):
+        emp = Employee.objects.get(code="NV0013")
+        emp.full_name = "Phạm Thị Hoa"
+        emp.save()
+        self.assertEqual(self.list_codes("binh"), [])
+        self.assertEqual(self.list_codes("pham hoa"), ["NV0013"])
+        emp.delete()
+        self.assertEqual(self.list_codes("pham"), [])
+
+        Employee.objects.bulk_create([Employee(code="DD0001", full_name="Võ Thị Điệp")])
+        self.assertEqual(self.list_codes("vo diep"), ["DD0001"])
+        temps = [EmployeeTemp(batch_id="b", code="DD0001", full_name="Võ Thị Hạnh"),
+                 EmployeeTemp(batch_id="b", code="DD0002", full_name="Hồ Văn Út")]
+        upsert_employees(temps)
+        self.assertEqual(self.list_codes("diep"), [])
+        self.assertEqual(self.list_codes("vo hanh"), ["DD0001"])
+        self.assertEqual(self.list_codes("ho ut"), ["DD0002"])
+
+    def test_record_list_and_export_use_search(self):
+        response = self.client.get(reverse("healthrecord_list"), {"q": "nguyen van an"})
+        self.assertEqual([r.employee.code for r in response.context["records"]], ["NV0012"])
+        response = self.client.get(reverse("healthrecord_export"), {"format": "csv", "q": "le duc"})
+        body = b"".join(response.streaming_content).decode("utf-8-sig")
+        self.assertIn("BS0001", body)
+        self.assertNotIn("NV0012", body)
+
+    def test_admin_search_uses_index(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser("admin", "a@example.com", "x"))
+        response = self.client.get(reverse("admin:health_records_employee_changelist"), {"q": "tran binh"})
+        self.assertEqual([e.code for e in response.context["cl"].result_list], ["NV0013"])
+        response = self.client.get(reverse("admin:health_records_healthrecord_changelist"), {"q": "le duc anh"})
+        self.assertEqual([r.employee.code for r in response.context["cl"].result_list], ["BS0001"])
+
+    def test_install_index_restores_dropped_triggers(self):
+        self.assertFalse(search.install_index(connection))
+        with connection.cursor() as cursor:
+            for name in search.FTS_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER {name}")
+        Employee.objects.create(code="KT0001", full_name="Đỗ Minh Khoa")
+        self.assertEqual(self.list_codes("do minh"), [])
+        self.assertTrue(search.install_index(connection))
+        self.assertEqual(self.list_codes("do minh"), ["KT0001"])
+
+    @skipUnless(RUN_BENCHMARKS, "đặt MPHR_BENCHMARKS=1 để chạy benchmark")
+    def test_benchmark_search_100k_employees(self):
+        synthetic.generate(n_employees=100_000, years=(), batch_size=5000)
+        queryset = Employee.objects.only("id", "code", "full_name")
+        for q in ("nguyen thi lan", "syn0099", "le van hung"):
+            list(search.filter_employees(queryset, q)[:50])
+            start = time.perf_counter()
+            rows = list(search.filter_employees(queryset, q)[:50])
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"\ntìm {q!r} trên 100k nhân viên: {len(rows)} dòng, {elapsed:.1f} ms")
+            self.assertLess(elapsed, 10)
+
+def set_exam_dates(seed=5):
+    """Gán ngày khám ngẫu nhiên (có trùng ngày và có NULL) cho mọi hồ sơ."""
+    rnd = random.Random(seed)
+    records = list(HealthRecord.objects.only("id", "year"))
+    for record in records:
+        record.exam_date = rnd.choice([None, date(record.year, rnd.randint(1, 12), rnd.randint(1, 28))])
+    HealthRecord.objects.bulk_update(records, ["exam_date"], batch_size=500)
+
+
+class EmployeeAutocompleteTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+        search.AUTOCOMPLETE_CACHE.clear()
+        dept = Department.objects.create(name="Khoa Nội")
+        for code, name in [("NV0012", "Nguyễn Văn An"), ("NV0013", "Trần Thị Bình"), ("BS0001", "Lê Đức Anh")]:
+            Employee.objects.create(code=code, full_name=name, department=dept)
+
+    def results(self, q, **params):
+        return self.client.get(reverse("employee_autocomplete"), {"q": q, **params}).json()["results"]
+
+    def test_prefix_search_on_code_and_folded_name(self):
+        self.assertEqual([r["code"] for r in self.results("nv001")], ["NV0012", "NV0013"])
+        self.assertEqual(self.results("duc a"), [{
+            "id": Employee.objects.get(code="BS0001").pk, "code": "BS0001", "full_name": "Lê Đức Anh",
+            "department": "Khoa Nội", "text": "Lê Đức Anh (BS0001)",
+        }])
+        self.assertEqual(len(self.results("nv", limit="1")), 1)
+        self.assertEqual(self.results("  "), [])
+
+    def test_results_cached_until_employees_change(self):
+        self.results("tran")
+        with self.assertNumQueries(0):
+            self.assertEqual([r["code"] for r in self.results("tran")], ["NV0013"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Employee.objects.create(code="NV0099", full_name="Trần Văn Cường")
+        self.assertEqual([r["code"] for r in self.results("tran")], ["NV0013", "NV0099"])
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = search.LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+    def test_form_renders_only_selected_employee(self):
+        Employee.objects.bulk_create([Employee(code=f"AC{i:04d}", full_name=f"Nhân viên {i}") for i in range(300)])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("healthrecord_add"))
+        self.assertFalse(any('FROM "health_records_employee"' in q["sql"] for q in ctx.captured_queries))
+        self.assertNotContains(response, "AC0001")
+        self.assertContains(response, reverse("employee_autocomplete"))
+
+        employee = Employee.objects.get(code="AC0042")
+        record = HealthRecord.objects.create(employee=employee, year=2025)
+        response = self.client.get(reverse("healthrecord_edit", args=[record.pk]))
+        self.assertContains(response, f'<option value="{employee.pk}" selected>{employee}</option>', html=True)
+        self.assertNotContains(response, "AC0041")
+
+        form = HealthRecordForm(data={"employee": employee.pk, "year": 2026, "status": "pending"})
+        self.assertTrue(form.is_valid(), form.errors)
+        form = HealthRecordForm(data={"employee": "abc", "year": 2026, "status": "pending"})
+        self.assertFalse(form.is_valid())
+        self.assertIn('<option value="">---------</option>', str(form["employee"]))  # id sai: không lỗi khi render
+
+
+class HealthRecordListTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(reverse("healthrecord_list"), dict(params, **({"after": cursor} if cursor else {})))
+            page = response.context["page"]
+            ids += [r.pk for r in page]
+            if not page.has_next:
+                return ids
+            cursor = page.next_cursor
+
+    def test_keyset_walk_matches_exam_date_ordering(self):
+        make_dataset(n_employees=40)
+        set_exam_dates()
+        records = list(HealthRecord.objects.all())
+        dated = sorted((r for r in records if r.exam_date), key=lambda r: (r.exam_date, r.pk), reverse=True)
+        undated = sorted((r.pk for r in records if not r.exam_date), reverse=True)
+        self.assertEqual(self.walk(), [r.pk for r in dated] + undated)
+
+    def test_walk_backwards_and_keep_filters(self):
+        make_dataset(n_employees=40)
+        set_exam_dates()
+        params = {"year": "2024"}
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(reverse("healthrecord_list"), dict(params, **({"after": cursor} if cursor else {})))
+            page = response.context["page"]
+            self.assertEqual(response.context["querystring"], "year=2024")
+            pages.append([r.pk for r in page])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(sum(map(len, pages)), 40)
+
+        # quay lại từng trang bằng cursor `before`
+        page = response.context["page"]
+        for expected in reversed(pages[:-1]):
+            page = self.client.get(reverse("healthrecord_list"), dict(params, before=page.previous_cursor)).context["page"]
+            self.assertEqual([r.pk for r in page], expected)
+        self.assertFalse(page.has_previous)
+
+    def test_total_count_is_cached(self):
+        make_dataset(n_employees=10)
+        self.assertEqual(self.client.get(reverse("healthrecord_list")).context["total_count"], 30)
+        self.assertEqual(self.client.get(reverse("healthrecord_list"), {"year": "2025"}).context["total_count"], 10)
+        params = {"q": "NV000"}
+        self.assertEqual(self.client.get(reverse("healthrecord_list"), params).context["total_count"], 30)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("healthrecord_list"), params)
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            HealthRecord.objects.filter(employee__code="NV0001").first().delete()
+        self.assertEqual(self.client.get(reverse("healthrecord_list"), params).context["total_count"], 29)
+
+    @skipUnless(RUN_BENCHMARKS, "đặt MPHR_BENCHMARKS=1 để chạy benchmark")
+    def test_benchmark_deep_page(self):
+        """Trang 1 và trang 5.000 (15 hồ sơ/trang) phải tốn thời gian như nhau."""
+        make_dataset(n_employees=8_000, years=range(2016, 2026))
+        set_exam_dates()
+        url = reverse("healthrecord_list")
+        deep = HealthRecord.objects.order_by(F("exam_date").desc(nulls_last=True), "-id")[5_000 * 15]
+        cursor = encode_cursor(deep.exam_date, deep.pk)
+
+        def timed(params, repeat=20):
+            self.client.get(url, params)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                self.client.get(url, params)
+            return (time.perf_counter() - start) / repeat
+
+        first, deep_page = timed({}), timed({"after": cursor})
+        print(f"\ntrang 1: {first * 1000:.1f} ms, trang 5000: {deep_page * 1000:.1f} ms")
+        self.assertLess(deep_page, first * 1.5 + 0.005)
+
+
+def claim_batch(client, *batch_ids):
+    """Gán batch cho phiên của test client (như khi chính client đã preview)."""
+    session = client.session
+    session[staging.SESSION_KEY] = list(batch_ids)
+    session.save()
+
+
+def make_employee_workbook(rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Mã nhân viên", "Họ và tên", "Khoa/Phòng", "Giới tính", "Chức danh nghề nghiệp", "Chức vụ", "Năm sinh"])
+    for row in rows:
+        ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return SimpleUploadedFile("nv.xlsx", buf.getvalue())
+
+
+@override_settings(HEALTH_IMPORT_JOBS_ASYNC=False)
+class ImportJobTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+
+    def test_preview_job_status_returns_preview_html(self):
+        make_dataset(n_employees=60)
+        response = self.client.post(reverse("healthrecord_import_preview_ajax"),
+                                    {"file": make_healthrecord_workbook(50)})
+        job = ImportJob.objects.get(pk=response.json()["job_id"])
+        self.assertEqual((job.kind, job.status, job.total_rows, job.processed_rows),
+                         ("healthrecord_preview", "done", 50, 50))
+        self.assertEqual(job.result["total"], 50)
+
+        data = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual(data["processed"], 50)
+        self.assertIn(job.batch_id, data["html"])
+
+    def test_failed_job_reports_error(self):
+        upload = SimpleUploadedFile("hong.xlsx", b"khong phai file excel")
+        with self.assertLogs("health_records.jobs", "ERROR"):
+            data = self.client.post(reverse("healthrecord_import_preview_ajax"), {"file": upload}).json()
+        self.assertEqual(data["status"], "failed")
+        self.assertTrue(data["error"])
+
+    @override_settings(HEALTH_IMPORT_CHUNK_SIZE=10)
+    def test_cancel_during_submit_rolls_back(self):
+        make_dataset(n_employees=50, years=(2024,))
+        HealthRecordTemp.objects.bulk_create([
+            HealthRecordTemp(batch_id="b2", employee_code=f"NV{i:04d}", year=2025) for i in range(50)
+        ])
+        claim_batch(self.client, "b2")
+        # người dùng bấm huỷ sau khi đã ghi được 2 khối
+        with mock.patch.object(jobs, "is_cancel_requested", side_effect=[False, False, False, True]):
+            data = self.client.post(reverse("healthrecord_import_submit_ajax", args=["b2"])).json()
+        self.assertEqual((data["status"], data["processed"]), ("cancelled", 20))
+        self.assertFalse(HealthRecord.objects.filter(year=2025).exists())
+        self.assertFalse(HealthRecordTemp.objects.filter(batch_id="b2").exists())
+        RollupTests.assertRollupConsistent(self)
+
+    @override_settings(HEALTH_IMPORT_CHUNK_SIZE=10)
+    def test_cancel_after_last_progress_report_rolls_back(self):
+        make_dataset(n_employees=50, years=(2024,))
+        HealthRecordTemp.objects.bulk_create([
+            HealthRecordTemp(batch_id="b4", employee_code=f"NV{i:04d}", year=2025) for i in range(50)
+        ])
+        claim_batch(self.client, "b4")
+        # bắt đầu tác vụ + 6 lần báo tiến độ đều chưa huỷ; huỷ tới ngay trước khi commit
+        with mock.patch.object(jobs, "is_cancel_requested", side_effect=[False] * 7 + [True]):
+            data = self.client.post(reverse("healthrecord_import_submit_ajax", args=["b4"])).json()
+        self.assertEqual((data["status"], data["processed"]), ("cancelled", 50))
+        self.assertFalse(HealthRecord.objects.filter(year=2025).exists())
+        RollupTests.assertRollupConsistent(self)
+
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual(jobs.check_shared_cache(None), [])
+        with override_settings(HEALTH_STATS_CACHE_ALIAS="default", HEALTH_IMPORT_JOBS_ASYNC=True):
+            self.assertEqual([w.id for w in jobs.check_shared_cache(None)], ["health_records.W001"])
+
+    def test_upload_removed_when_cancelled_before_start(self):
+        fd, path = tempfile.mkstemp(prefix="mphr-import-")
+        os.close(fd)
+        work = mock.Mock()
+        with mock.patch.object(jobs, "is_cancel_requested", return_value=True):
+            job = jobs.submit("employee_preview", "c1", work, path, cleanup=[path])
+        self.assertEqual(job.status, "cancelled")
+        work.assert_not_called()
+        self.assertFalse(os.path.exists(path))
+
+    def test_preview_removes_upload(self):
+        make_dataset(n_employees=5)
+        paths = []
+
+        def tracking_spool(upload):
+            paths.append(spool_upload(upload))
+            return paths[-1]
+
+        with mock.patch("health_records.readers.spool_upload", side_effect=tracking_spool):
+            self.client.post(reverse("healthrecord_import_preview_ajax"), {"file": make_healthrecord_workbook(5)})
+        self.assertEqual(len(paths), 1)
+        self.assertFalse(os.path.exists(paths[0]))
+
+    def test_cancel_view_flags_running_job(self):
+        job = ImportJob.objects.create(kind="healthrecord_submit", batch_id="b3", status="running")
+        HealthRecordTemp.objects.create(batch_id="b3", employee_code="NV0001")
+        claim_batch(self.client, "b3", "other")
+        data = self.client.post(reverse("healthrecord_import_cancel_ajax", args=["b3"])).json()
+        self.assertEqual(data["cancelled_jobs"], 1)
+        self.assertTrue(jobs.is_cancel_requested(job))
+        # tác vụ đang chạy sẽ tự dọn batch tạm
+        self.assertTrue(HealthRecordTemp.objects.filter(batch_id="b3").exists())
+
+        data = self.client.post(reverse("healthrecord_import_cancel_ajax", args=["other"])).json()
+        self.assertEqual(data["cancelled_jobs"], 0)
+
+    def test_employee_preview_and_submit(self):
+        Department.objects.create(name="Khoa Nội")
+        upload = make_employee_workbook([
+            ["NV1", "Nguyễn Văn A", " khoa nội ", "nam", "Bác sĩ", None, 1980],
+            ["NV2", "Trần Thị B", "Khoa Mới", "Nữ", None, None, None],
+        ])
+        data = self.client.post(reverse("employee_import_preview_ajax"), {"file": upload}).json()
+        self.assertEqual(data["status"], "done")
+        self.assertEqual((data["result"]["valid_count"], data["result"]["invalid_count"]), (1, 1))
+
+        data = self.client.post(reverse("employee_import_submit_ajax", args=[data["batch_id"]])).json()
+        self.assertEqual((data["status"], data["result"]), ("done", {"created": 1, "updated": 0, "unchanged": 0}))
+        employee = Employee.objects.get(code="NV1")
+        self.assertEqual((employee.department.name, employee.gender), ("Khoa Nội", "Nam"))
+        self.assertFalse(EmployeeTemp.objects.exists())
+
+
+class ImportPreviewPagingTests(TestCase):
+    def setUp(self):
+        # 250 dòng, dòng lỗi nằm rải rác giữa file
+        HealthRecordTemp.objects.bulk_create([
+            HealthRecordTemp(batch_id="p1", employee_code=f"NV{i:04d}", is_valid=i % 50 != 7,
+                             error_message="" if i % 50 != 7 else "Mã nhân viên không tồn tại")
+            for i in range(250)
+        ])
+        self.job = ImportJob.objects.create(kind="healthrecord_preview", batch_id="p1", status="done")
+        claim_batch(self.client, "p1", "e1")
+
+    def codes(self, html):
+        return re.findall(r"<td class=\"text-center\">(NV\d{4})</td>", html)
+
+    def test_first_page_shows_invalid_rows_first(self):
+        html = self.client.get(reverse("import_job_status", args=[self.job.pk])).json()["html"]
+        self.assertEqual(len(self.codes(html)), PREVIEW_PAGE_SIZE)
+        self.assertEqual(self.codes(html)[:5], ["NV0007", "NV0057", "NV0107", "NV0157", "NV0207"])
+        self.assertEqual(html.count('<tr class="invalid-row">'), 5)
+        self.assertIn("Tổng: 250", html)
+        self.assertIn('data-action="preview-more"', html)
+
+    def test_rows_endpoint_pages_through_batch(self):
+        url = reverse("healthrecord_import_preview_rows", args=["p1"])
+        seen, after = [], None
+        while True:
+            data = self.client.get(url, {"after": after} if after else {}).json()
+            self.assertEqual(data["count"], len(self.codes(data["html"])))
+            seen += self.codes(data["html"])
+            after = data["next_cursor"]
+            if not after:
+                break
+        self.assertEqual(len(seen), 250)
+        self.assertEqual(sorted(seen), [f"NV{i:04d}" for i in range(250)])
+
+    def test_counters_use_single_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            counts = preview_counts(HealthRecordTemp, "p1")
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(counts, {"total": 250, "valid_count": 245, "invalid_count": 5})
+
+    def test_small_batch_has_no_load_more_button(self):
+        EmployeeTemp.objects.create(batch_id="e1", code="NV1", full_name="A", is_valid=True)
+        job = ImportJob.objects.create(kind="employee_preview", batch_id="e1", status="done")
+        html = self.client.get(reverse("import_job_status", args=[job.pk])).json()["html"]
+        self.assertIn("NV1", html)
+        self.assertNotIn('id="preview-more"', html)
+        data = self.client.get(reverse("employee_import_preview_rows", args=["e1"])).json()
+        self.assertEqual((data["count"], data["next_cursor"]), (1, None))
+
+
+@override_settings(HEALTH_IMPORT_JOBS_ASYNC=False, HEALTH_STAGING_TTL=3600)
+class ImportStagingTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+
+    def preview(self, client, code):
+        upload = make_employee_workbook([[code, "Nguyễn Văn A", None, "Nam", None, None, 1980]])
+        return client.post(reverse("employee_import_preview_ajax"), {"file": upload}).json()["batch_id"]
+
+    def test_concurrent_previews_keep_their_own_batches(self):
+        other = self.client_class()
+        mine, theirs = self.preview(self.client, "NV1"), self.preview(other, "NV2")
+        self.assertEqual(EmployeeTemp.objects.filter(batch_id__in=[mine, theirs]).count(), 2)
+
+        # không lưu / huỷ được batch của phiên khác
+        for name in ("employee_import_submit_ajax", "employee_import_cancel_ajax"):
+            self.assertEqual(self.client.post(reverse(name, args=[theirs])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("employee_import_preview_rows", args=[theirs])).status_code, 404)
+
+        self.assertEqual(other.post(reverse("employee_import_submit_ajax", args=[theirs])).json()["status"], "done")
+        self.assertEqual(list(Employee.objects.values_list("code", flat=True)), ["NV2"])
+        self.assertTrue(EmployeeTemp.objects.filter(batch_id=mine).exists())
+
+    def stage(self, batch_id, age):
+        created = timezone.now() - age
+        HealthRecordTemp.objects.create(batch_id=batch_id, employee_code="NV1", created_at=created)
+        EmployeeTemp.objects.create(batch_id=batch_id, code="NV1", full_name="A", created_at=created)
+
+    def test_purge_removes_only_expired_idle_batches(self):
+        self.stage("cu", timedelta(hours=2))
+        self.stage("moi", timedelta(minutes=5))
+        self.stage("dang-luu", timedelta(hours=2))
+        ImportJob.objects.create(kind="healthrecord_submit", batch_id="dang-luu", status="running")
+
+        self.assertEqual(staging.purge_expired(dry_run=True), {"HealthRecordTemp": 1, "EmployeeTemp": 1})
+        self.assertEqual(staging.purge_expired(), {"HealthRecordTemp": 1, "EmployeeTemp": 1})
+        self.assertEqual(set(HealthRecordTemp.objects.values_list("batch_id", flat=True)), {"moi", "dang-luu"})
+        self.assertEqual(staging.table_stats()["EmployeeTemp"]["batches"], 2)
+
+    def test_preview_purges_at_most_once_per_interval(self):
+        self.stage("cu", timedelta(hours=2))
+        self.preview(self.client, "NV1")
+        self.assertFalse(EmployeeTemp.objects.filter(batch_id="cu").exists())
+
+        self.stage("cu-2", timedelta(hours=2))
+        self.preview(self.client, "NV2")
+        self.assertTrue(EmployeeTemp.objects.filter(batch_id="cu-2").exists())
+
+    def test_purge_command_reports_table_size(self):
+        self.stage("cu", timedelta(hours=2))
+        out = io.StringIO()
+        call_command("purge_import_staging", stdout=out)
+        self.assertIn("Đã xoá 1 dòng HealthRecordTemp", out.getvalue())
+        self.assertIn("HealthRecordTemp: 0 dòng, 0 batch", out.getvalue())
+
+
+@skipUnless(parquet_available(), "cần pyarrow")
+@override_settings(HEALTH_IMPORT_JOBS_ASYNC=False, HEALTH_STAGING_BACKEND="parquet")
+class ParquetStagingTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = override_settings(HEALTH_STAGING_DIR=self.tmpdir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        make_dataset(n_employees=60, years=(2024,))
+
+    def preview(self, upload):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.post(reverse("healthrecord_import_preview_ajax"), {"file": upload}).json()
+        # không ghi / đọc dòng tạm nào trong CSDL
+        self.assertFalse([q for q in ctx.captured_queries if "healthrecordtemp" in q["sql"]])
+        return data
+
+    def test_preview_paging_and_submit_match_table_backend(self):
+        data = self.preview(make_healthrecord_workbook(300))
+        self.assertEqual(data["status"], "done")
+        self.assertFalse(HealthRecordTemp.objects.exists())
+        batch_id = data["batch_id"]
+        path = staging.get_store().path(HealthRecordTemp, batch_id)
+        self.assertTrue(os.path.exists(path))
+
+        with override_settings(HEALTH_STAGING_BACKEND="table"):
+            expected = self.client.post(reverse("healthrecord_import_preview_ajax"),
+                                        {"file": make_healthrecord_workbook(300)}).json()["result"]
+        self.assertEqual(data["result"], expected)
+
+        html = self.client.get(data["status_url"]).json()["html"]
+        classes = re.findall(r'<tr class="(valid|invalid)-row">', html)
+        self.assertEqual(len(classes), 100)
+        url = reverse("healthrecord_import_preview_rows", args=[batch_id])
+        after = re.search(r'data-after="([^"]+)"', html).group(1)
+        while after:
+            page = self.client.get(url, {"after": after}).json()
+            classes += re.findall(r'<tr class="(valid|invalid)-row">', page["html"])
+            after = page["next_cursor"]
+        # dòng lỗi trước, đủ 300 dòng
+        self.assertEqual(classes, ["invalid"] * expected["invalid_count"] + ["valid"] * expected["valid_count"])
+
+        result = self.client.post(reverse("healthrecord_import_submit_ajax", args=[batch_id])).json()
+        self.assertEqual(result["status"], "done")
+        self.assertEqual(result["result"]["created"] + result["result"]["updated"],
+                         HealthRecord.objects.filter(year=2025).count())
+        self.assertTrue(HealthRecord.objects.filter(year=2025, height_cm__isnull=False).exists())
+        self.assertFalse(os.path.exists(path))
+        RollupTests.assertRollupConsistent(self)
+
+    def test_cancel_and_purge_remove_files(self):
+        batch_id = self.preview(make_healthrecord_workbook(20))["batch_id"]
+        self.client.post(reverse("healthrecord_import_cancel_ajax", args=[batch_id]))
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+        batch_id = self.preview(make_healthrecord_workbook(20))["batch_id"]
+        path = staging.get_store().path(HealthRecordTemp, batch_id)
+        self.assertEqual(staging.table_stats()["HealthRecordTemp"]["rows"], 20)
+        old = time.time() - 2 * 86400
+        os.utime(path, (old, old))
+        self.assertEqual(staging.purge_expired()["HealthRecordTemp"], 20)
+        self.assertFalse(os.path.exists(path))
+
+    @skipUnless(RUN_BENCHMARKS, "benchmark: đặt MPHR_BENCHMARKS=1")
+    def test_benchmark_backends(self):
+        content = make_healthrecord_workbook(20_000).read()
+
+        def timed(backend):
+            with override_settings(HEALTH_STAGING_BACKEND=backend):
+                start = time.perf_counter()
+                data = self.client.post(reverse("healthrecord_import_preview_ajax"),
+                                        {"file": SimpleUploadedFile("import.xlsx", content)}).json()
+                self.client.get(data["status_url"])
+                self.client.post(reverse("healthrecord_import_cancel_ajax", args=[data["batch_id"]]))
+                return time.perf_counter() - start
+
+        table, parquet = timed("table"), timed("parquet")
+        print(f"\npreview + huỷ 20k dòng: bảng tạm {table:.2f} s, parquet {parquet:.2f} s")
+        self.assertLess(parquet, table)
+
+    def test_employee_preview_and_submit(self):
+        upload = make_employee_workbook([
+            ["NV9001", "Nguyễn Văn A", None, "nam", "Bác sĩ", None, 1980],
+            [None, "Thiếu mã", None, None, None, None, None],
+        ])
+        data = self.client.post(reverse("employee_import_preview_ajax"), {"file": upload}).json()
+        self.assertEqual((data["result"]["valid_count"], data["result"]["invalid_count"]), (1, 1))
+        self.assertFalse(EmployeeTemp.objects.exists())
+        data = self.client.post(reverse("employee_import_submit_ajax", args=[data["batch_id"]])).json()
+        self.assertEqual(data["result"], {"created": 1, "updated": 0, "unchanged": 0})
+        self.assertEqual(Employee.objects.get(code="NV9001").birth_year, 1980)
+
+
+@override_settings(HEALTH_IMPORT_JOBS_ASYNC=False)
+class EmployeeImportTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+
+    def run_import(self, rows, create_departments=False):
+        data = self.client.post(reverse("employee_import_preview_ajax"), {
+            "file": make_employee_workbook(rows), "create_departments": "1" if create_departments else "",
+        }).json()
+        return self.client.post(reverse("employee_import_submit_ajax", args=[data["batch_id"]])).json()
+
+    def roster(self, n, department="Khoa {}", title="Bác sĩ"):
+        return [[f"NV{i:05d}", f"Nhân viên {i}", department.format(i % 20), "nam" if i % 2 else "nữ", title, None,
+                 1960 + i % 40] for i in range(n)]
+
+    def test_missing_departments_created_in_one_statement(self):
+        Department.objects.create(name="Khoa 1")
+        rows = self.roster(60)
+        preview = self.client.post(reverse("employee_import_preview_ajax"),
+                                   {"file": make_employee_workbook(rows)}).json()
+        self.assertEqual(preview["result"]["invalid_count"], 57)
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.run_import(rows, create_departments=True)
+        self.assertEqual(data["result"], {"created": 60, "updated": 0, "unchanged": 0})
+        inserts = [q for q in ctx.captured_queries
+                   if q["sql"].startswith("INSERT") and '"health_records_department"' in q["sql"]]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Department.objects.count(), 20)
+        self.assertEqual(Employee.objects.get(code="NV00021").department.name, "Khoa 1")
+
+    def test_counts_created_updated_unchanged_and_rollup(self):
+        make_dataset(n_employees=30, years=(2024,))
+        # chức danh / chức vụ NULL trong DB và ô trống trong file coi là không đổi
+        Employee.objects.update(job_title=None, position=None)
+        Department.objects.create(name="Khoa Mới")
+        existing = list(Employee.objects.order_by("code").values_list(
+            "code", "full_name", "department__name", "gender", "job_title", "position", "birth_year"))
+        rows = [list(row) for row in existing]
+        rows[0][2] = "Khoa Mới"              # đổi khoa -> hồ sơ đổi nhóm rollup
+        rows[1][4] = "Điều dưỡng trưởng"     # chỉ đổi chức danh
+        rows.append(["NV99999", "Người mới", None, "Nam", None, None, None])
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.run_import(rows)
+        self.assertEqual(data["result"], {"created": 1, "updated": 2, "unchanged": 28})
+        self.assertFalse([q for q in ctx.captured_queries
+                          if q["sql"].startswith('UPDATE "health_records_employee"')
+                          or 'SELECT' in q["sql"] and '"health_records_employee"."code" = ' in q["sql"]])
+        self.assertEqual(Employee.objects.get(code=rows[0][0]).department.name, "Khoa Mới")
+        self.assertEqual(Employee.objects.get(code=rows[1][0]).job_title, "Điều dưỡng trưởng")
+        RollupTests.assertRollupConsistent(self)
+
+        # chạy lại cùng file: không ghi gì
+        data = self.run_import(rows)
+        self.assertEqual(data["result"], {"created": 0, "updated": 0, "unchanged": 31})
+
+    def test_submit_keeps_create_departments_choice_from_preview(self):
+        department = Department.objects.create(name="Khoa 0")
+        data = self.client.post(reverse("employee_import_preview_ajax"), {
+            "file": make_employee_workbook(self.roster(1)),
+        }).json()
+        self.assertEqual(data["result"]["valid_count"], 1)
+        # Khoa/Phòng bị xoá giữa lúc xem trước và lúc lưu: không được tạo lại ngầm
+        department.delete()
+        self.client.post(reverse("employee_import_submit_ajax", args=[data["batch_id"]]))
+        self.assertFalse(Department.objects.exists())
+        self.assertIsNone(Employee.objects.get(code="NV00000").department)
+
+    @override_settings(HEALTH_IMPORT_CHUNK_SIZE=100)
+    def test_query_count_grows_with_chunks_not_rows(self):
+        def submit_queries(n):
+            Employee.objects.all().delete()
+            with CaptureQueriesContext(connection) as ctx:
+                self.run_import(self.roster(n), create_departments=True)
+            return len(ctx.captured_queries)
+
+        small, large = submit_queries(100), submit_queries(1000)
+        self.assertLess(large - small, 40)
+
+    @skipUnless(RUN_BENCHMARKS, "benchmark: đặt MPHR_BENCHMARKS=1")
+    def test_benchmark_20k_roster(self):
+        rows = self.roster(20_000)
+        start = time.perf_counter()
+        created = self.run_import(rows, create_departments=True)["result"]
+        first = time.perf_counter() - start
+        rows = [row[:4] + ["Điều dưỡng" if i % 10 == 0 else row[4]] + row[5:] for i, row in enumerate(rows)]
+        start = time.perf_counter()
+        resync = self.run_import(rows)["result"]
+        second = time.perf_counter() - start
+        print(f"\nimport 20k nhân viên: lần đầu {first:.2f} s {created}, đồng bộ lại {second:.2f} s {resync}")
+        self.assertEqual(resync, {"created": 0, "updated": 2000, "unchanged": 18000})
+
+
+@override_settings(HEALTH_IMPORT_JOBS_ASYNC=False, HEALTH_METRICS_TOKEN="s3cret")
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+        metrics.reset()
+        make_dataset(n_employees=5)
+
+    def scrape(self, **headers):
+        headers.setdefault("HTTP_AUTHORIZATION", "Bearer s3cret")
+        response = self.client.get(reverse("metrics"), **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return response.content.decode()
+
+    def sample(self, text, line_prefix):
+        values = [line.rsplit(" ", 1)[1] for line in text.splitlines() if line.startswith(line_prefix + " ")]
+        self.assertEqual(len(values), 1, line_prefix)
+        return float(values[0])
+
+    def test_request_latency_and_sql_are_recorded_per_view(self):
+        self.client.get(reverse("employee_list"))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("employee_list"))
+        self.client.get("/khong-ton-tai/")
+        text = self.scrape()
+
+        self.assertEqual(self.sample(text, 'mphr_http_requests_total{method="GET",status="200",view="employee_list"}'), 2)
+        self.assertEqual(self.sample(text, 'mphr_http_requests_total{method="GET",status="404",view="unmatched"}'), 1)
+        self.assertEqual(self.sample(text, 'mphr_http_request_duration_seconds_count{view="employee_list"}'), 2)
+        self.assertEqual(self.sample(text, 'mphr_http_request_duration_seconds_bucket{view="employee_list",le="+Inf"}'), 2)
+        # lần đầu tính bộ lọc rồi lưu cache, lần sau đọc cache: tổng = lần đầu + lần sau
+        sql_sum = self.sample(text, 'mphr_http_request_sql_queries_sum{view="employee_list"}')
+        self.assertGreaterEqual(sql_sum, 2 * len(queries))
+        self.assertGreater(self.sample(text, 'mphr_http_request_sql_seconds_total{view="employee_list"}'), 0)
+        self.assertIn("# TYPE mphr_http_request_duration_seconds histogram", text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        for value in (0.003, 0.02, 0.02, 7):
+            metrics.observe("mphr_http_request_duration_seconds", {"view": "x"}, value)
+        text = metrics.render()
+        prefix = 'mphr_http_request_duration_seconds_bucket{view="x",le='
+        self.assertEqual(self.sample(text, prefix + '"0.005"}'), 1)
+        self.assertEqual(self.sample(text, prefix + '"0.025"}'), 3)
+        self.assertEqual(self.sample(text, prefix + '"5"}'), 3)
+        self.assertEqual(self.sample(text, prefix + '"+Inf"}'), 4)
+        self.assertAlmostEqual(self.sample(text, 'mphr_http_request_duration_seconds_sum{view="x"}'), 7.043)
+
+    def test_import_throughput_and_staging_size(self):
+        def work(job):
+            jobs.report_progress(job, 1200, total=1200)
+            return {}
+
+        jobs.submit("employee_preview", "m1", work)
+        EmployeeTemp.objects.create(batch_id="m1", code="NV1", full_name="A")
+        text = self.scrape()
+        self.assertEqual(self.sample(text, 'mphr_import_jobs_total{kind="employee_preview",status="done"}'), 1)
+        self.assertEqual(self.sample(text, 'mphr_import_rows_total{kind="employee_preview"}'), 1200)
+        self.assertGreater(self.sample(text, 'mphr_import_rows_per_second{kind="employee_preview"}'), 0)
+        self.assertEqual(self.sample(text, 'mphr_staging_rows{table="EmployeeTemp"}'), 1)
+        self.assertEqual(self.sample(text, 'mphr_staging_batches{table="HealthRecordTemp"}'), 0)
+
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer sai").status_code, 401)
+        self.scrape()
+
+    def test_closed_without_token_unless_debug(self):
+        with override_settings(HEALTH_METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+            with override_settings(DEBUG=True):
+                self.scrape(HTTP_AUTHORIZATION="")
+
+    @override_settings(HEALTH_SLOW_REQUEST_MS=0)
+    def test_slow_request_log_includes_sql(self):
+        with self.assertLogs("health_records.slow_requests", "WARNING") as logs:
+            self.client.get(reverse("healthrecord_list"), {"year": "2024"})
+        self.assertIn("healthrecord_list", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    def test_slow_request_log_is_off_by_default(self):
+        with self.assertNoLogs("health_records.slow_requests", "WARNING"):
+            self.client.get(reverse("healthrecord_list"))
+
+@override_settings(HEALTH_IMPORT_JOBS_ASYNC=False)
+class SyntheticDataTests(TestCase):
+    def test_command_seeds_data_and_matching_workbooks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            out = io.StringIO()
+            call_command("generate_synthetic_data", "--employees", "40", "--departments", "5",
+                         "--years", "2024,2025", "--workbooks", directory, "--workbook-new-employees", "3",
+                         stdout=out)
+            self.assertEqual(Employee.objects.count(), 40)
+            self.assertEqual(HealthRecord.objects.count(), 80)
+            self.assertEqual(Department.objects.count(), 5)
+            self.assertEqual(HealthRecordRollup.objects.aggregate(n=Sum("count"))["n"], 80)
+            emp = Employee.objects.first()
+            self.assertEqual(len(emp.full_name.split()), 3)
+            self.assertEqual(emp.search_key, search.employee_search_key(emp.code, emp.full_name))
+
+            for url_name, filename, rows in [("employee_import_preview_ajax", "nhan_vien.xlsx", 43),
+                                             ("healthrecord_import_preview_ajax", "ho_so_2026.xlsx", 40)]:
+                with open(os.path.join(directory, filename), "rb") as f:
+                    data = self.client.post(reverse(url_name), {"file": f}).json()
+                temp_model = EmployeeTemp if url_name.startswith("employee") else HealthRecordTemp
+                self.assertEqual(preview_counts(temp_model, data["batch_id"]),
+                                 {"total": rows, "valid_count": rows, "invalid_count": 0}, filename)
+
+    def test_invalid_years_are_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command("generate_synthetic_data", "--employees", "1", "--years", "2024,abc", stdout=io.StringIO())
+
+
+class BenchmarkRunnerTests(TestCase):
+    def test_report_covers_every_scenario_and_compares(self):
+        from .management.commands.run_benchmarks import SCENARIOS
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            args = ["run_benchmarks", "--use-existing", "--sizes", "30", "--years", "2025",
+                    "--repeat", "1", "--import-rows", "10", "--output", path]
+            call_command(*args, stdout=io.StringIO())
+            with open(path, encoding="utf-8") as f:
+                report = json.load(f)
+            run, = report["runs"]
+            self.assertEqual((run["employees"], run["records"]), (30, 30))
+            self.assertEqual(list(run["scenarios"]), list(SCENARIOS))
+            for name, result in run["scenarios"].items():
+                self.assertGreater(result["seconds"], 0, name)
+                self.assertGreater(result["queries"], 0, name)
+            # dữ liệu import thử đã được dọn sau khi đo
+            self.assertEqual((Employee.objects.count(), HealthRecord.objects.count()), (30, 30))
+
+            out = io.StringIO()
+            call_command(*args[:-1], os.path.join(directory, "second.json"), "--compare", path, stdout=out)
+            self.assertIn("So với báo cáo", out.getvalue())
+            self.assertIn("healthrecord_import_submit", out.getvalue())
+
+class StartupTests(TestCase):
+    def test_startup_does_not_load_heavy_libraries(self):
+        out = io.StringIO()
+        call_command("check_startup", "--runs", "1", "--budget-ms", "60000", stdout=out)
+        self.assertIn("Thời gian khởi động trong ngưỡng.", out.getvalue())
+        self.assertIn("health_records.views", out.getvalue())
+
+    def test_over_budget_fails(self):
+        with self.assertRaises(CommandError):
+            call_command("check_startup", "--runs", "1", "--budget-ms", "1", stdout=io.StringIO())
+
+    def test_parse_importtime_keeps_top_level_imports(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |     numpy.core\n"
+            "import time:       300 |      45000 | pandas\n"
+            "import time:        80 |         80 | json\n"
+        )
+        self.assertEqual(parse_importtime(stderr), [(45000, "pandas"), (80, "json")])
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        stats.get_cache().clear()
+        synthetic.generate(n_employees=300)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def test_canonical_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command("check_query_plans", "--use-existing", stdout=out)
+        self.assertIn("Mọi truy vấn đều dùng index.", out.getvalue())
+
+    def test_missing_index_is_reported(self):
+        with connection.cursor() as cursor:
+            for index in HealthRecord._meta.indexes:
+                if index.fields[0] == "year":
+                    cursor.execute(f'DROP INDEX "{index.name}"')
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command("check_query_plans", "--use-existing", stdout=out)
+        self.assertIn("SCAN health_records_healthrecord", out.getvalue())
+
+    def test_scan_failures_ignores_small_tables_and_index_scans(self):
+        plan = [
+            "SCAN health_records_healthrecord USING INDEX health_reco_exam_da_18db2d_idx",
+            "SCAN health_records_healthrecord USING COVERING INDEX health_reco_conclus_1597f5_idx",
+            "SCAN health_records_healthrecordrollup",
+            "SCAN CONSTANT ROW",
+            "SCAN health_records_employee",
+        ]
+        self.assertEqual(scan_failures(plan, "SELECT ... LIMIT 16"), ["SCAN health_records_employee"])
+        # không có LIMIT: đọc hết index cũng là quét toàn bảng
+        self.assertEqual(scan_failures(plan, "SELECT ..."), [plan[0], "SCAN health_records_employee"])
+
+
+class ImportJobThreadTests(TransactionTestCase):
+    def test_job_runs_in_worker_thread(self):
+        make_dataset(n_employees=60, years=(2024,))
+        # SQLite in-memory (shared cache) của test báo "table is locked" nếu đọc khi luồng nền
+        # đang ghi, nên chờ luồng nền chạy xong rồi mới hỏi trạng thái
+        finished = threading.Event()
+        run = jobs._run
+        threads = []
+
+        def run_and_signal(*args):
+            threads.append(threading.current_thread().name)
+            try:
+                run(*args)
+            finally:
+                finished.set()
+
+        with mock.patch.object(jobs, "_run", run_and_signal):
+            response = self.client.post(reverse("healthrecord_import_preview_ajax"),
+                                        {"file": make_healthrecord_workbook(30)})
+            self.assertEqual(response.status_code, 202)
+            self.assertIn(response.json()["status"], jobs.ACTIVE_STATUSES)
+            self.assertTrue(finished.wait(30))
+        data = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual(data["status"], "done", data["error"])
+        self.assertTrue(threads[0].startswith("health-import"))
+        self.assertEqual(HealthRecordTemp.objects.filter(batch_id=data["batch_id"]).count(), 30)
+
+
+def write_upload(upload, suffix):
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as out:
+        out.write(upload.read())
+    return path
+
+
+TEMP_FIELDS = ["employee_code", "employee_name", "year", "exam_date", "height_cm", "weight_kg",
+               "health_classification_name", "vaccinated", "vaccine_name", "vaccination_date",
+               "is_valid", "error_message"]
+
+
+class StreamingReaderTests(TestCase):
+    def setUp(self):
+        make_dataset(n_employees=60, years=(2024,))
+        self.employee_map = build_employee_map()
+        self.hc_map = build_name_map(HealthClassification.objects.all())
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def path_for(self, upload, suffix=".xlsx"):
+        path = write_upload(upload, suffix)
+        self.paths.append(path)
+        return path
+
+    def parse_chunks(self, path, chunk_size):
+        temps = []
+        for df in iter_row_chunks(path, HEALTHRECORD_COLUMNS, chunk_size=chunk_size):
+            self.assertLessEqual(len(df), chunk_size)
+            temps += parse_healthrecord_frame(df, "b", self.employee_map, self.hc_map)
+        return [tuple(getattr(t, f) for f in TEMP_FIELDS) for t in temps]
+
+    def test_chunks_match_read_excel(self):
+        path = self.path_for(make_healthrecord_workbook(250))
+        expected = [tuple(getattr(t, f) for f in TEMP_FIELDS)
+                    for t in parse_healthrecord_frame(pd.read_excel(path), "b", self.employee_map, self.hc_map)]
+        self.assertEqual(self.parse_chunks(path, 40), expected)
+
+    def test_csv_matches_excel(self):
+        xlsx = self.path_for(make_healthrecord_workbook(120))
+        csv_path = self.path_for(SimpleUploadedFile("x.csv", b""), ".csv")
+        pd.read_excel(xlsx, dtype=str).to_csv(csv_path, index=False)
+        self.assertEqual(self.parse_chunks(csv_path, 50), self.parse_chunks(xlsx, 50))
+
+    def test_header_resolved_once_and_typed_cells(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["  mã nhân viên ", "Năm khám", "Ngày khám", "Kết luận"])
+        ws.append(["NV0001", 2024.0, datetime(2024, 3, 5), "Theo dõi"])
+        ws.append([None, None, None, None])
+        ws.append(["NV0002", 2024, "06/03/2024", None])
+        buf = io.BytesIO()
+        wb.save(buf)
+        path = self.path_for(SimpleUploadedFile("h.xlsx", buf.getvalue()))
+        self.assertEqual(estimate_rows(path), 3)
+        chunks = list(iter_row_chunks(path, HEALTHRECORD_COLUMNS))
+        self.assertEqual(len(chunks), 1)
+        df = chunks[0]
+        self.assertEqual(list(df.columns), ["Mã nhân viên", "Năm khám", "Ngày khám", "Kết luận (nếu muốn nhập tay)"])
+        self.assertEqual(len(df), 2)  # dòng trống bị bỏ qua
+        temps = parse_healthrecord_frame(df, "b", self.employee_map, self.hc_map)
+        self.assertEqual([(t.year, t.exam_date, t.conclusion_text) for t in temps],
+                         [(2024, date(2024, 3, 5), "Theo dõi"), (2024, date(2024, 3, 6), None)])
+
+    def test_resolve_columns_keeps_unknown_headers(self):
+        self.assertEqual(resolve_columns(["Ma nhan vien", "Cột lạ", None], HEALTHRECORD_COLUMNS),
+                         ["Mã nhân viên", "Cột lạ", ""])
+
+    @override_settings(HEALTH_IMPORT_JOBS_ASYNC=False, HEALTH_IMPORT_CHUNK_SIZE=50)
+    def test_first_errors_visible_before_file_is_read(self):
+        seen = []
+
+        def poll_status(job):
+            # gọi tại mỗi lần báo tiến độ: hỏi trạng thái như trình duyệt
+            seen.append(self.client.get(reverse("import_job_status", args=[job.pk])).json())
+            return False
+
+        # chạy đồng bộ nên session chỉ được lưu khi request preview kết thúc: gán batch trước
+        claim_batch(self.client, "s1")
+        with mock.patch.object(jobs, "is_cancel_requested", side_effect=poll_status), \
+                mock.patch.object(staging, "new_batch_id", return_value="s1"):
+            self.client.post(reverse("healthrecord_import_preview_ajax"), {"file": make_healthrecord_workbook(300)})
+        running = [d for d in seen if d["status"] == "running" and d["errors"]]
+        self.assertTrue(running)
+        self.assertLess(running[0]["processed"], 300)
+
+    def read_peak(self, path, read):
+        tracemalloc.start()
+        try:
+            rows = read(path)
+            return rows, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def stream_rows(self, path):
+        return sum(len(df) for df in iter_row_chunks(path, HEALTHRECORD_COLUMNS, chunk_size=500))
+
+    def test_memory_does_not_grow_with_rows(self):
+        small_path = self.path_for(make_healthrecord_workbook(2_000))
+        large_path = self.path_for(make_healthrecord_workbook(10_000))
+        (small_rows, small), (large_rows, large) = (self.read_peak(small_path, self.stream_rows),
+                                                    self.read_peak(large_path, self.stream_rows))
+        self.assertEqual((small_rows, large_rows), (2_000, 10_000))
+        self.assertLess(large, small * 1.5 + 1_000_000)
+
+    @skipUnless(RUN_BENCHMARKS, "đặt MPHR_BENCHMARKS=1 để chạy benchmark")
+    def test_memory_on_100k_rows(self):
+        """
+        100k dòng: so với pd.read_excel cả file. Phần còn tăng theo số dòng là bảng
+        shared strings của xlsx (openpyxl nạp một bản của mỗi chuỗi khác nhau khi mở file).
+        """
+        path = self.path_for(make_healthrecord_workbook(100_000))
+        rows, streamed = self.read_peak(path, self.stream_rows)
+        _, full = self.read_peak(path, lambda p: len(pd.read_excel(p)))
+        print(f"\n100k dòng: đọc theo khối {streamed / 1e6:.1f} MB, pd.read_excel {full / 1e6:.1f} MB")
+        self.assertEqual(rows, 100_000)
+        self.assertLess(streamed, full / 4)
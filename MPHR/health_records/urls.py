@@ -29,6 +29,7 @@ urlpatterns = [
     path("employees/add/", views.employee_add, name="employee_add"),
     path("employees/<int:pk>/edit/", views.employee_edit, name="employee_edit"),
     path("employees/<int:pk>/delete/", views.employee_delete, name="employee_delete"),
+    path("employees/autocomplete/", views.employee_autocomplete, name="employee_autocomplete"),
 
     # --- Hồ sơ sức khỏe ---
     path("records/", views.healthrecord_list, name="healthrecord_list"),
@@ -37,8 +38,10 @@ urlpatterns = [
     path("records/<int:pk>/delete/", views.healthrecord_delete, name="healthrecord_delete"),
     path("records/<int:pk>/", views.healthrecord_detail, name="healthrecord_detail"),
     path('records/export/', views.export_healthrecords_xlsx, name='healthrecord_export'),
+    path('records/anthropometrics/', views.anthropometric_report, name='anthropometric_report'),
     # preview / submit / cancel cho HealthRecord import (AJAX)
     path('records/import/preview/', views.healthrecord_import_preview_ajax, name='healthrecord_import_preview_ajax'),
+    path('records/import/preview/<str:batch_id>/rows/', views.healthrecord_import_preview_rows, name='healthrecord_import_preview_rows'),
     path('records/import/submit/<str:batch_id>/', views.healthrecord_import_submit_ajax, name='healthrecord_import_submit_ajax'),
     path('records/import/cancel/<str:batch_id>/', views.healthrecord_import_cancel_ajax, name='healthrecord_import_cancel_ajax'),
 
@@ -50,7 +53,13 @@ urlpatterns = [
     path("employees/import/sample/", views.download_sample_employee, name="download_sample_employee"),
     # preview / submit / cancel cho Employee import (AJAX)
     path("employees/import/preview/", views.employee_import_preview_ajax, name="employee_import_preview_ajax"),
+    path("employees/import/preview/<str:batch_id>/rows/", views.employee_import_preview_rows, name="employee_import_preview_rows"),
     path("employees/import/submit/<str:batch_id>/", views.employee_import_submit_ajax, name="employee_import_submit_ajax"),
     path("employees/import/cancel/<str:batch_id>/", views.employee_import_cancel_ajax, name="employee_import_cancel_ajax"),
+    # tiến độ tác vụ import chạy nền (AJAX polling)
+    path("import/jobs/<int:pk>/", views.import_job_status, name="import_job_status"),
+
+    # số liệu hiệu năng cho Prometheus
+    path("metrics", views.metrics_view, name="metrics"),
 
 ]
@@ -1,70 +1,83 @@
 # health_records/views.py
-from datetime import datetime
-import pandas as pd
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from .models import (
     Department, ExaminationType, HealthClassification,
-    Employee, HealthRecord, EmployeeTemp
+    Employee, HealthRecord, EmployeeTemp, HealthRecordRollup, ImportJob
 )
 from .forms import HealthRecordForm
-import os, io, re
+# readers / importers / exporters kéo theo pandas, numpy, openpyxl: chỉ import trong các view
+# import / xuất file để tiến trình web và manage.py khởi động nhanh (xem lệnh check_startup)
+from . import metrics
+from . import search
+from . import jobs as import_jobs
+from . import staging
+from .pagination import keyset_paginate
+from . import stats as dashboard_stats
+import os
 from django.conf import settings
 from django.http import FileResponse, HttpResponse
-from django.db.models import Count
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
 import json
-from collections import Counter
-import uuid
-from django.db import transaction
 from django.template.loader import render_to_string
 from django.http import JsonResponse
-import traceback
 from django.db.models import Q
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from .models import HealthRecordTemp
-from django.utils import timezone
+from django.urls import reverse
 from urllib.parse import urlencode
 
+NO_CONCLUSION_LABEL = "Không có kết luận"
+
 # ========== TRANG CHỦ VÀ BÁO CÁO ==========
 def home(request):
-    from .views import get_health_report_data
-    stats = get_health_report_data()
+    stats = dashboard_stats.get_dashboard_stats(compute_home_stats)
+    return render(request, 'health_records/home.html', stats)
 
+def compute_home_stats():
+    stats = get_health_report_data()
     stats.update({
-        'total_records': HealthRecord.objects.count(),
+        'total_records': HealthRecordRollup.objects.aggregate(total=Coalesce(Sum('count'), 0))['total'],
         'total_departments': Department.objects.count(),
         'total_examtypes': ExaminationType.objects.count(),
     })
-    return render(request, 'health_records/home.html', stats)
+    return stats
 
-def get_health_report_data():
-    """Hàm xử lý và trả về dữ liệu thống kê hồ sơ sức khoẻ"""
+def get_health_report_data(year=None):
+    """Hàm xử lý và trả về dữ liệu thống kê hồ sơ sức khoẻ (đọc từ bảng rollup)"""
+    rollup_qs = HealthRecordRollup.objects.all()
+    if year:
+        rollup_qs = rollup_qs.filter(year=year)
 
     # 1. Theo phân loại sức khoẻ
     hc_qs = (
-        HealthRecord.objects
+        rollup_qs
         .values('health_classification__name')
-        .annotate(count=Count('id'))
+        .annotate(total=Sum('count'))
         .order_by('health_classification__name')
     )
     health_labels = [item['health_classification__name'] or "Chưa phân loại" for item in hc_qs]
-    health_counts = [item['count'] for item in hc_qs]
-
-    # 2. Theo kết luận (dùng Counter để đảm bảo tính chính xác của property `conclusion`)
-    records = HealthRecord.objects.all()
-    conclusion_counter = Counter((r.conclusion or "").strip() or "Không có kết luận" for r in records)
-    conclusion_labels = list(conclusion_counter.keys())
-    conclusion_counts = list(conclusion_counter.values())
+    health_counts = [item['total'] for item in hc_qs]
+
+    # 2. Theo kết luận (bucket lấy từ cột `HealthRecord.conclusion`)
+    conclusion_qs = (
+        rollup_qs
+        .values('conclusion')
+        .annotate(total=Sum('count'))
+        .order_by('-total', 'conclusion')
+    )
+    conclusion_labels = [item['conclusion'] or NO_CONCLUSION_LABEL for item in conclusion_qs]
+    conclusion_counts = [item['total'] for item in conclusion_qs]
 
     # 3. Theo giới tính
     gender_qs = (
-        HealthRecord.objects
-        .values('employee__gender')
-        .annotate(count=Count('id'))
-        .order_by('employee__gender')
+        rollup_qs
+        .values('gender')
+        .annotate(total=Sum('count'))
+        .order_by('gender')
     )
-    gender_labels = [item['employee__gender'] or "Không rõ" for item in gender_qs]
-    gender_counts = [item['count'] for item in gender_qs]
+    gender_labels = [item['gender'] or "Không rõ" for item in gender_qs]
+    gender_counts = [item['total'] for item in gender_qs]
 
     # Trả về dữ liệu đã sẵn sàng render hoặc chuyển sang JSON
     return {
@@ -76,8 +89,45 @@ def get_health_report_data():
         'gender_counts': json.dumps(gender_counts),
     }
 
+def anthropometric_report(request):
+    """
+    JSON phân bố BMI và huyết áp tâm thu theo khoa/phòng và năm (histogram, phân vị,
+    số người theo nhóm BMI). `?year=` giới hạn một năm; kết quả được cache theo năm.
+    """
+    from . import anthropometrics
+
+    year = (request.GET.get('year') or '').strip()
+    if year and not year.isdigit():
+        return JsonResponse({'error': 'Năm không hợp lệ.'}, status=400)
+    year = int(year) if year else None
+    report = dashboard_stats.get_anthropometric_report(year, lambda: anthropometrics.build_report(year))
+    return JsonResponse({'year': year, **report})
+
 # ========== NHÂN VIÊN ==========
 
+# Khoá sắp xếp (tham số ?sort=) -> cột dùng cho phân trang keyset
+EMPLOYEE_SORT_FIELDS = {
+    "code": "code",
+    "full_name": "full_name",
+    "department": "sort_department",
+}
+EMPLOYEE_PAGE_SIZE = 50
+# Chỉ nạp các cột mà template danh sách nhân viên hiển thị
+EMPLOYEE_LIST_FIELDS = (
+    "code", "full_name", "gender", "birth_year", "job_title", "position", "department__name",
+)
+
+
+def compute_employee_filter_options():
+    return {
+        "departments": list(Department.objects.order_by("name").values("id", "name")),
+        "job_titles": list(
+            Employee.objects.exclude(job_title__isnull=True).exclude(job_title__exact="")
+            .order_by("job_title").values_list("job_title", flat=True).distinct()
+        ),
+    }
+
+
 def employee_list(request):
     # --- Lấy các tham số lọc / tìm kiếm / sắp xếp ---
     search_query = request.GET.get("q", "").strip()
@@ -85,16 +135,19 @@ def employee_list(request):
     job_title = request.GET.get("job_title", "")
     sort = request.GET.get("sort", "code")
     direction = request.GET.get("dir", "asc")
+    if sort not in EMPLOYEE_SORT_FIELDS:
+        sort = "code"
 
     # --- Query cơ bản ---
-    employees = Employee.objects.select_related("department").all()
+    employees = (
+        Employee.objects.select_related("department")
+        .only(*EMPLOYEE_LIST_FIELDS)
+        .annotate(sort_department=Coalesce("department__name", Value("")))
+    )
 
     # --- Lọc theo từ khóa ---
     if search_query:
-        employees = employees.filter(
-            Q(code__icontains=search_query) |
-            Q(full_name__icontains=search_query)
-        )
+        employees = search.filter_employees(employees, search_query)
 
     # --- Lọc theo khoa/phòng ---
     if department_id:
@@ -104,21 +157,30 @@ def employee_list(request):
     if job_title:
         employees = employees.filter(job_title__icontains=job_title)
 
-    # --- Sắp xếp ---
-    if sort == "code":
-        employees = employees.order_by("code" if direction == "asc" else "-code")
-    elif sort == "full_name":
-        employees = employees.order_by("full_name" if direction == "asc" else "-full_name")
-    elif sort == "department":
-        employees = employees.order_by("department__name" if direction == "asc" else "-department__name")
+    # --- Sắp xếp + phân trang keyset ---
+    page = keyset_paginate(
+        employees,
+        EMPLOYEE_SORT_FIELDS[sort],
+        descending=direction == "desc",
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+        page_size=EMPLOYEE_PAGE_SIZE,
+    )
+
+    # giữ bộ lọc + sắp xếp khi chuyển trang
+    params = request.GET.copy()
+    for key in ("after", "before"):
+        params.pop(key, None)
+    querystring = urlencode({k: v for k, v in params.items() if v != ""})
 
-    departments = Department.objects.all().order_by("name")
-    job_titles = Employee.objects.values_list("job_title", flat=True).distinct().exclude(job_title__exact="")
+    filter_options = dashboard_stats.get_employee_filter_options(compute_employee_filter_options)
 
     context = {
-        "employees": employees,
-        "departments": departments,
-        "job_titles": job_titles,
+        "employees": page.object_list,
+        "page": page,
+        "querystring": querystring,
+        "departments": filter_options["departments"],
+        "job_titles": filter_options["job_titles"],
         "search_query": search_query,
         "selected_department": department_id,
         "selected_job_title": job_title,
@@ -129,6 +191,18 @@ def employee_list(request):
 
 
 
+# Số kết quả tối đa một lần gọi autocomplete (?limit=)
+EMPLOYEE_AUTOCOMPLETE_MAX = 50
+
+
+def employee_autocomplete(request):
+    """JSON cho ô chọn nhân viên: tìm theo tiền tố mã / họ tên bỏ dấu (xem search.py)."""
+    limit = (request.GET.get('limit') or '').strip()
+    limit = int(limit) if limit.isdigit() else search.AUTOCOMPLETE_LIMIT
+    limit = max(1, min(limit, EMPLOYEE_AUTOCOMPLETE_MAX))
+    return JsonResponse({'results': search.autocomplete_employees(request.GET.get('q', ''), limit)})
+
+
 def employee_add(request):
     departments = Department.objects.all()
     if request.method == 'POST':
@@ -317,11 +391,32 @@ def healthclasses_delete(request, pk):
 
 # ========== HỒ SƠ SỨC KHỎE ==========
 
+HEALTHRECORD_PAGE_SIZE = 15
+
+# Lọc huyết áp theo khoảng: tham số GET -> lookup trên cột số (có index theo năm)
+BLOOD_PRESSURE_FILTERS = {
+    'systolic_min': 'systolic_bp__gte',
+    'systolic_max': 'systolic_bp__lte',
+    'diastolic_min': 'diastolic_bp__gte',
+    'diastolic_max': 'diastolic_bp__lte',
+}
+
+
+def blood_pressure_filters(params):
+    """{lookup: số nguyên} từ các tham số khoảng huyết áp hợp lệ (bỏ qua ô trống / không phải số)."""
+    lookups = {}
+    for param, lookup in BLOOD_PRESSURE_FILTERS.items():
+        value = (params.get(param) or '').strip()
+        if value.isdigit():
+            lookups[lookup] = int(value)
+    return lookups
+
+
 def healthrecord_list(request):
     # Base queryset
     qs = HealthRecord.objects.select_related(
         'employee', 'employee__department', 'health_classification'
-    ).all().order_by('-exam_date', '-id')
+    )
 
     # ----- READ FILTERS -----
     q = (request.GET.get('q') or '').strip()
@@ -329,13 +424,11 @@ def healthrecord_list(request):
     classification = (request.GET.get('classification') or request.GET.get('filter_hc') or '').strip()
     conclusion = (request.GET.get('conclusion') or request.GET.get('filter_conclusion') or '').strip()
     vaccinated = (request.GET.get('vaccinated') or '').strip()
+    bp_lookups = blood_pressure_filters(request.GET)
 
     # ----- APPLY FILTERS -----
     if q:
-        qs = qs.filter(
-            Q(employee__code__icontains=q) |
-            Q(employee__full_name__icontains=q)
-        )
+        qs = search.filter_employees(qs, q, prefix='employee__')
 
     if year:
         try:
@@ -355,7 +448,7 @@ def healthrecord_list(request):
 
     # Kết luận
     if conclusion:
-        qs = qs.filter(conclusion_text__icontains=conclusion.strip())
+        qs = qs.filter(conclusion=conclusion)
 
     # Vaccine
     if vaccinated != '':
@@ -364,55 +457,43 @@ def healthrecord_list(request):
         elif vaccinated.lower() in ['0','no','n','false','chưa']:
             qs = qs.filter(vaccinated=False)
 
-    # ----- PAGINATION -----
-    paginator = Paginator(qs, 15)
-    page_param = request.GET.get('page')
-
-    try:
-        page_number = int(page_param) if page_param else 1
-    except:
-        page_number = 1
+    # Huyết áp (khoảng tâm thu / tâm trương)
+    if bp_lookups:
+        qs = qs.filter(**bp_lookups)
 
-    try:
-        page_obj = paginator.page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+    # ----- PAGINATION (keyset theo exam_date, id) -----
+    page = keyset_paginate(
+        qs, 'exam_date', descending=True, nullable=True,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+        page_size=HEALTHRECORD_PAGE_SIZE,
+    )
 
     # ----- QUERYSTRING (KEEP FILTERS FOR PAGINATION) -----
     params = request.GET.copy()
-    if 'page' in params:
-        params.pop('page')
+    for key in ('page', 'after', 'before'):
+        params.pop(key, None)
 
     querystring = urlencode({k: v for k, v in params.items() if v != ''})
 
+    # Tổng số hồ sơ: không lọc / chỉ lọc năm thì đọc từ rollup, còn lại COUNT một lần rồi cache
+    if not (q or classification or conclusion or vaccinated or bp_lookups) and (not year or year.isdigit()):
+        rollup_rows = HealthRecordRollup.objects.filter(year=int(year)) if year else HealthRecordRollup.objects.all()
+        total_count = rollup_rows.aggregate(total=Coalesce(Sum('count'), 0))['total']
+    else:
+        total_count = dashboard_stats.get_record_count(querystring, qs.count)
+
     # ----- EXTRA LISTS FOR TEMPLATE -----
-    years = HealthRecord.objects.order_by('-year').values_list('year', flat=True).distinct()
+    years = HealthRecordRollup.objects.order_by('-year').values_list('year', flat=True).distinct()
     health_classes = HealthClassification.objects.all()
-    raw_conclusions = HealthRecord.objects \
-    .exclude(conclusion_text__isnull=True) \
-    .exclude(conclusion_text__exact='') \
-    .values_list('conclusion_text', flat=True)
-
-    # normalize: strip and remove empty, preserve order and dedupe
-    normalized = []
-    for c in raw_conclusions:
-        try:
-            s = str(c).strip()
-        except:
-            s = None
-        if s:
-            normalized.append(s)
-
-    # dedupe preserving order
-    conclusions = list(dict.fromkeys(normalized))
+    # DISTINCT trên cột conclusion (đã bỏ khoảng trắng) đọc thẳng từ index
+    conclusions = HealthRecord.objects.exclude(conclusion='') \
+        .order_by('conclusion').values_list('conclusion', flat=True).distinct()
 
     # ----- CONTEXT -----
     context = {
-        'page_obj': page_obj,
-        'records': page_obj.object_list,
-        'paginator': paginator,
+        'page': page,
+        'records': page.object_list,
+        'total_count': total_count,
         'querystring': querystring,
 
         # Current filters
@@ -421,6 +502,7 @@ def healthrecord_list(request):
         'filter_hc': classification,
         'filter_conclusion': conclusion,
         'filter_vaccinated': vaccinated,
+        **{f'filter_{param}': request.GET.get(param, '') for param in BLOOD_PRESSURE_FILTERS},
 
         # Data for dropdowns
         'years': years,
@@ -465,70 +547,23 @@ def healthrecord_delete(request, pk):
 # ========== IMPORT EXCEL ==========
 def healthrecord_import(request):
     if request.method == 'POST' and request.FILES.get('file'):
-        file = request.FILES['file']
+        from .importers import import_healthrecord_file
+        from .readers import spool_upload
+
+        path = spool_upload(request.FILES['file'])
         try:
-            df = pd.read_excel(file)
+            created_count, missing_employees = import_healthrecord_file(path)
         except Exception as e:
             messages.error(request, f"Lỗi đọc file Excel: {e}")
             return redirect('healthrecord_import')
-
-        missing_employees = []
-        created_count = 0
-        for idx, row in df.iterrows():
-            emp_code = str(row.get('Mã nhân viên') or '').strip()
-            if not emp_code:
-                missing_employees.append(f'(dòng {idx+2}: thiếu mã)')
-                continue
-            try:
-                employee = Employee.objects.get(code=emp_code)
-            except Employee.DoesNotExist:
-                missing_employees.append(emp_code)
-                continue
-
-            examination_type = ExaminationType.objects.filter(name=row.get('Loại khám')).first()
-            classification = HealthClassification.objects.filter(name=row.get('Phân loại sức khoẻ')).first()
-
-            # parse boolean vaccinated
-            vaccinated_raw = row.get('Đã tiêm vắc-xin')
-            vaccinated = False
-            if pd.notna(vaccinated_raw):
-                if str(vaccinated_raw).strip().lower() in ['x','có','co','yes','1','true']:
-                    vaccinated = True
-
-            # parse dates safely
-            exam_date = row.get('Ngày khám')
-            vac_date = row.get('Ngày tiêm chủng') or row.get('vaccination_date') or None
-
-            try:
-                rec, created = HealthRecord.objects.update_or_create(
-                    employee=employee,
-                    year=int(row.get('Năm khám')),
-                    defaults={
-                        'exam_date': exam_date if not pd.isna(exam_date) else None,
-                        'examination_type': examination_type,
-                        'clinic_name': row.get('Cơ sở khám'),
-                        'height_cm': row.get('Chiều cao (cm)') if not pd.isna(row.get('Chiều cao (cm)')) else None,
-                        'weight_kg': row.get('Cân nặng (kg)') if not pd.isna(row.get('Cân nặng (kg)')) else None,
-                        'blood_pressure': row.get('Huyết áp (mmHg)'),
-                        'health_classification': classification,
-                        'conclusion_text': row.get('Kết luận (nếu muốn nhập tay)'),
-                        'vaccinated': vaccinated,
-                        'vaccine_name': row.get('Tên vắc-xin'),
-                        'vaccination_date': vac_date if (pd.notna(vac_date) if pd.notna(vac_date) else False) else None,
-                        'note': row.get('Ghi chú'),
-                    }
-                )
-                if created:
-                    created_count += 1
-            except Exception as e:
-                # log but continue
-                traceback.print_exc()
-                missing_employees.append(f"{emp_code} (lỗi: {e})")
+        finally:
+            os.remove(path)
 
         if missing_employees:
-            messages.warning(request, f"Một số mã nhân viên không tồn tại hoặc lỗi: {', '.join(map(str, missing_employees)[:30])}")
+            messages.warning(request, f"Một số mã nhân viên không tồn tại hoặc lỗi: {', '.join(map(str, missing_employees[:30]))}")
         if created_count:
             messages.success(request, f"Đã tạo/ cập nhật {created_count} hồ sơ.")
+        dashboard_stats.invalidate()
         return redirect('healthrecord_list')
 
     return render(request, 'health_records/healthrecord_import.html', {'title': 'Import hồ sơ sức khỏe từ Excel'})
@@ -538,10 +573,20 @@ def download_sample_healthrecord(request):
     return FileResponse(open(file_path, 'rb'), as_attachment=True, filename='mau_import_hssk.xlsx')
 
 # ------------------------
-# export health records (xlsx) theo filter hiện hành
+# export health records (xlsx / csv / parquet) theo filter hiện hành
 # ------------------------
 def export_healthrecords_xlsx(request):
-    qs = HealthRecord.objects.select_related('employee', 'employee__department', 'health_classification')
+    from . import exporters
+
+    export_format = (request.GET.get('format') or 'xlsx').strip().lower()
+    if export_format not in exporters.EXPORT_FORMATS:
+        messages.error(request, f"Định dạng xuất không hỗ trợ: {export_format}")
+        return redirect('healthrecord_list')
+    if export_format == 'parquet' and not exporters.parquet_available():
+        messages.error(request, "Xuất Parquet cần cài thư viện pyarrow.")
+        return redirect('healthrecord_list')
+
+    qs = HealthRecord.objects.all()
 
     # áp cùng filter như list
     q = request.GET.get('q', '').strip()
@@ -551,7 +596,7 @@ def export_healthrecords_xlsx(request):
     status = request.GET.get('status', '').strip()
 
     if q:
-        qs = qs.filter(Q(employee__code__icontains=q) | Q(employee__full_name__icontains=q))
+        qs = search.filter_employees(qs, q, prefix='employee__')
     if year:
         try:
             year_int = int(year)
@@ -564,90 +609,112 @@ def export_healthrecords_xlsx(request):
         qs = qs.filter(health_classification_id=hc_id)
     if status:
         qs = qs.filter(status=status)
+    bp_lookups = blood_pressure_filters(request.GET)
+    if bp_lookups:
+        qs = qs.filter(**bp_lookups)
+
+    if export_format == 'csv':
+        return exporters.csv_response(qs)
+    if export_format == 'parquet':
+        return exporters.parquet_response(qs)
+    return exporters.xlsx_response(qs)
+
+# ------------------------------
+# Tác vụ import chạy nền: trả trạng thái cho trình duyệt hỏi lại
+# ------------------------------
+PREVIEW_ERROR_SAMPLE = 10
+
+PREVIEW_PAGE_SIZE = 100
+
+PREVIEW_TEMPLATES = {
+    'healthrecord_preview': (HealthRecordTemp, 'health_records/_healthrecord_preview_table.html'),
+    'employee_preview': (EmployeeTemp, 'health_records/_employee_preview_table.html'),
+}
+
+PREVIEW_ROW_TEMPLATES = {
+    HealthRecordTemp: 'health_records/_healthrecord_preview_rows.html',
+    EmployeeTemp: 'health_records/_employee_preview_rows.html',
+}
+
+
+def preview_rows_page(temp_model, batch_id, after=None):
+    """Một trang dòng tạm của batch: dòng lỗi (is_valid=False) trước, sau đó theo thứ tự trong file."""
+    return staging.get_store().page(temp_model, batch_id, after=after, page_size=PREVIEW_PAGE_SIZE)
+
+
+def render_preview(job):
+    # chỉ render bộ đếm + trang đầu; batch 100k dòng không còn sinh ra vài MB HTML
+    temp_model, template = PREVIEW_TEMPLATES[job.kind]
+    counts = staging.get_store().counts(temp_model, job.batch_id)
+    page = preview_rows_page(temp_model, job.batch_id)
+    return render_to_string(template, {
+        'temps': page.object_list,
+        'next_cursor': page.next_cursor,
+        'batch_id': job.batch_id,
+        'all_valid': counts['invalid_count'] == 0,
+        **counts,
+    })
+
+
+def batch_not_found():
+    # batch không tồn tại hoặc thuộc phiên làm việc khác
+    return JsonResponse({'error': 'Không tìm thấy batch import.'}, status=404)
+
+
+def preview_rows(request, temp_model, batch_id):
+    if not staging.owns(request, batch_id):
+        return batch_not_found()
+    page = preview_rows_page(temp_model, batch_id, request.GET.get('after'))
+    return JsonResponse({
+        'html': render_to_string(PREVIEW_ROW_TEMPLATES[temp_model], {'temps': page.object_list}),
+        'count': len(page),
+        'next_cursor': page.next_cursor,
+    })
+
+
+def healthrecord_import_preview_rows(request, batch_id):
+    """Trang tiếp theo của bảng preview hồ sơ (`?after=<cursor>`)."""
+    return preview_rows(request, HealthRecordTemp, batch_id)
+
+
+def employee_import_preview_rows(request, batch_id):
+    """Trang tiếp theo của bảng preview nhân viên (`?after=<cursor>`)."""
+    return preview_rows(request, EmployeeTemp, batch_id)
+
+
+def job_payload(job):
+    processed, total = import_jobs.get_progress(job)
+    data = {
+        'job_id': job.pk,
+        'batch_id': job.batch_id,
+        'kind': job.kind,
+        'status': job.status,
+        'processed': processed,
+        'total': total,
+        'error': job.error_message,
+        'result': job.result,
+        'status_url': reverse('import_job_status', args=[job.pk]),
+    }
+    if job.kind in PREVIEW_TEMPLATES:
+        if job.status == 'done':
+            data['html'] = render_preview(job)
+        elif job.status == 'running':
+            # file được lưu theo khối: hiện các lỗi đầu tiên khi chưa đọc xong
+            temp_model = PREVIEW_TEMPLATES[job.kind][0]
+            data['errors'] = [
+                {'code': code, 'error': error}
+                for code, error in staging.get_store().invalid_sample(temp_model, job.batch_id, PREVIEW_ERROR_SAMPLE)
+            ]
+    return data
+
+
+def import_job_status(request, pk):
+    """Tiến độ tác vụ import (JSON) — trang import hỏi lại mỗi giây."""
+    job = get_object_or_404(ImportJob, pk=pk)
+    if not staging.owns(request, job.batch_id):
+        return batch_not_found()
+    return JsonResponse(job_payload(job))
 
-    # tạo DataFrame
-    rows = []
-    for r in qs.order_by('-year', 'employee__full_name'):
-        rows.append({
-            'Mã nhân viên': r.employee.code,
-            'Họ và tên': r.employee.full_name,
-            'Khoa/Phòng': r.employee.department.name if r.employee.department else '',
-            'Năm khám': r.year,
-            'Ngày khám': r.exam_date,
-            'Loại khám': r.examination_type.name if r.examination_type else '',
-            'Cơ sở khám': r.clinic_name or '',
-            'Chiều cao (cm)': r.height_cm,
-            'Cân nặng (kg)': r.weight_kg,
-            'Huyết áp (mmHg)': r.blood_pressure,
-            'Phân loại sức khỏe': r.health_classification.name if r.health_classification else '',
-            'Kết luận': r.conclusion,
-            'Đã tiêm vắc-xin': 'Có' if r.vaccinated else 'Không',
-            'Tên vắc-xin': r.vaccine_name or '',
-            'Ngày tiêm': r.vaccination_date,
-            'Trạng thái': r.status,
-            'Ghi chú': r.note or '',
-        })
-
-    df = pd.DataFrame(rows)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='HealthRecords')
-    output.seek(0)
-    filename = f"health_records_{datetime.date.today().isoformat()}.xlsx"
-    response = HttpResponse(output.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
-
-# 1) AJAX preview import (tạo batch + lưu HealthRecordTemp)
-def parse_date_cell(raw):
-    """Trả về datetime.date hoặc None. Hỗ trợ pd.Timestamp, Excel serial, và nhiều format string."""
-    if raw is None or (isinstance(raw, float) and pd.isna(raw)):
-        return None
-    if isinstance(raw, (pd.Timestamp, datetime)):
-        try:
-            return raw.date()
-        except:
-            pass
-    try:
-        ts = pd.to_datetime(raw, errors='coerce', dayfirst=True)
-        if pd.notna(ts):
-            return ts.date()
-    except:
-        pass
-    s = str(raw).strip()
-    # remove surrounding quotes
-    if (s.startswith('"') and s.endswith('"')) or (s.startswith("'") and s.endswith("'")):
-        s = s[1:-1].strip()
-    # normalize separators
-    s2 = re.sub(r'[.\-]', '/', s)
-    for fmt in ("%d/%m/%Y", "%d/%m/%y", "%Y/%m/%d", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y"):
-        try:
-            return datetime.strptime(s2, fmt).date()
-        except:
-            pass
-    return None
-
-# ---- helper: find best matching column name in df ----
-def find_column(df, candidates):
-    cols = list(df.columns)
-    # exact
-    for c in candidates:
-        if c in cols:
-            return c
-    # case-insensitive direct
-    lc = {col.lower().strip(): col for col in cols}
-    for c in candidates:
-        key = c.lower().strip()
-        if key in lc:
-            return lc[key]
-    # substring match (normalize spaces)
-    cols_norm = {col.replace(" ", "").lower(): col for col in cols}
-    for c in candidates:
-        k = c.replace(" ", "").lower()
-        for kn, orig in cols_norm.items():
-            if k in kn or kn in k:
-                return orig
-    return None
 
 # ------------------------------
 # Preview import (AJAX) - single-column vaccine
@@ -655,162 +722,19 @@ def find_column(df, candidates):
 def healthrecord_import_preview_ajax(request):
     """
     Preview import hồ sơ sức khỏe — báo lỗi chi tiết giống employee_import_preview_ajax.
+    File được đọc trong nền; trả về 202 + `status_url` để hỏi tiến độ.
     """
     if request.method == 'POST' and request.FILES.get('file'):
         try:
-            file = request.FILES['file']
-            df = pd.read_excel(file, engine='openpyxl')
-            batch_id = str(uuid.uuid4())[:8]
-
-            # Xoá batch tạm cùng batch_id trước (an toàn hơn là xóa tất cả)
-            HealthRecordTemp.objects.filter(batch_id=batch_id).delete()
-            temp_objects = []
-
-            for _, row in df.iterrows():
-                # --- đọc các cột phổ biến (chỉnh nếu file header khác) ---
-                code = row.get('Mã nhân viên') if 'Mã nhân viên' in df.columns else row.get('Mã NV') if 'Mã NV' in df.columns else row.get('Ma nhan vien') if 'Ma nhan vien' in df.columns else None
-                full_name = row.get('Họ và tên') if 'Họ và tên' in df.columns else row.get('Ho va ten') if 'Ho va ten' in df.columns else None
-                year_raw = row.get('Năm khám') if 'Năm khám' in df.columns else None
-                raw_exam_date = row.get('Ngày khám') if 'Ngày khám' in df.columns else None
-                exam_type_raw = row.get('Loại khám') if 'Loại khám' in df.columns else None
-                clinic_raw = row.get('Cơ sở khám') if 'Cơ sở khám' in df.columns else None
-                height_raw = row.get('Chiều cao (cm)') if 'Chiều cao (cm)' in df.columns else None
-                weight_raw = row.get('Cân nặng (kg)') if 'Cân nặng (kg)' in df.columns else None
-                bp_raw = row.get('Huyết áp (mmHg)') if 'Huyết áp (mmHg)' in df.columns else None
-                health_raw = row.get('Phân loại sức khoẻ') if 'Phân loại sức khoẻ' in df.columns else None
-                conclusion_raw = row.get('Kết luận (nếu muốn nhập tay)') if 'Kết luận (nếu muốn nhập tay)' in df.columns else None
-                vaccine_cell = row.get('Đã tiêm vắc-xin') if 'Đã tiêm vắc-xin' in df.columns else None
-                raw_vac_date = row.get('Ngày tiêm chủng') if 'Ngày tiêm chủng' in df.columns else None
-                note_raw = row.get('Ghi chú') if 'Ghi chú' in df.columns else None
-
-                # normalize
-                if pd.isna(code): code = None
-                if pd.isna(full_name): full_name = None
-                if pd.isna(year_raw): year_raw = None
-                if pd.isna(raw_exam_date): raw_exam_date = None
-                if pd.isna(exam_type_raw): exam_type_raw = None
-                if pd.isna(clinic_raw): clinic_raw = None
-                if pd.isna(height_raw): height_raw = None
-                if pd.isna(weight_raw): weight_raw = None
-                if pd.isna(bp_raw): bp_raw = None
-                if pd.isna(health_raw): health_raw = None
-                if pd.isna(conclusion_raw): conclusion_raw = None
-                if pd.isna(vaccine_cell): vaccine_cell = None
-                if pd.isna(raw_vac_date): raw_vac_date = None
-                if pd.isna(note_raw): note_raw = None
-
-                # VALIDATION & PARSE
-                is_valid = True
-                error_message = None
-
-                # mã NV bắt buộc
-                code_clean = str(code).strip() if code else None
-                if not code_clean:
-                    is_valid = False
-                    error_message = "Thiếu Mã nhân viên"
-
-                # kiểm tra tồn tại Employee
-                emp_obj = None
-                if code_clean:
-                    emp_obj = Employee.objects.filter(code__iexact=code_clean).first()
-                    if not emp_obj:
-                        is_valid = False
-                        error_message = (error_message or "") + ("; Mã nhân viên không tồn tại")
-
-                # parse ngày khám
-                exam_date_parsed = None
-                if raw_exam_date is not None and str(raw_exam_date).strip() != '':
-                    exam_date_parsed = parse_date_cell(raw_exam_date)
-                    if exam_date_parsed is None:
-                        is_valid = False
-                        error_message = (error_message or "") + ("; Ngày khám không hợp lệ")
-
-                # parse ngày tiêm
-                vac_date_parsed = None
-                if raw_vac_date is not None and str(raw_vac_date).strip() != '':
-                    vac_date_parsed = parse_date_cell(raw_vac_date)
-                    if vac_date_parsed is None:
-                        is_valid = False
-                        error_message = (error_message or "") + ("; Ngày tiêm không hợp lệ")
-
-                # parse numeric height/weight
-                height_val = None
-                weight_val = None
-                try:
-                    if height_raw is not None and str(height_raw).strip() != '':
-                        height_val = float(str(height_raw).replace(',', '.').replace('cm','').strip())
-                except:
-                    is_valid = False
-                    error_message = (error_message or "") + ("; Chiều cao không đúng định dạng")
-                try:
-                    if weight_raw is not None and str(weight_raw).strip() != '':
-                        weight_val = float(str(weight_raw).replace(',', '.').replace('kg','').strip())
-                except:
-                    is_valid = False
-                    error_message = (error_message or "") + ("; Cân nặng không đúng định dạng")
-
-                # phân loại sức khỏe: kiểm tra trong danh mục (nếu bạn muốn bắt buộc)
-                hc_obj = None
-                if health_raw:
-                    hc_obj = HealthClassification.objects.filter(name__iexact=str(health_raw).strip()).first()
-                    if not hc_obj:
-                        # chỉ cảnh báo (không bắt buộc) -> ghi vào error_message để bạn thấy
-                        error_message = (error_message or "") + ("; Phân loại sức khoẻ chưa có trong danh mục")
-
-                # vaccine single-column logic (nếu tên vắc-xin có trong ô => vaccinated True)
-                vaccinated_flag = False
-                vaccine_name_value = None
-                if vaccine_cell and str(vaccine_cell).strip():
-                    s = str(vaccine_cell).strip()
-                    parts = [p.strip() for p in re.split(r'[;,]', s) if p.strip()]
-                    if parts:
-                        vaccine_name_value = '; '.join(parts)
-                        vaccinated_flag = True
-                # infer vaccinated from vac_date if name absent
-                if not vaccinated_flag and raw_vac_date and vac_date_parsed:
-                    vaccinated_flag = True
-
-                # tạo object tạm (trùng tên field với model HealthRecordTemp)
-                temp_objects.append(HealthRecordTemp(
-                    batch_id=batch_id,
-                    employee_code=code_clean,
-                    employee_name=(emp_obj.full_name if emp_obj else (str(full_name).strip() if full_name else None)),
-                    year=(int(year_raw) if (year_raw is not None and str(year_raw).strip().isdigit()) else (exam_date_parsed.year if exam_date_parsed else None)),
-                    exam_date=exam_date_parsed,
-                    examination_type_name=(str(exam_type_raw).strip() if exam_type_raw else None),
-                    clinic_name=(str(clinic_raw).strip() if clinic_raw else None),
-                    height_cm=height_val,
-                    weight_kg=weight_val,
-                    blood_pressure=(str(bp_raw).strip() if bp_raw else None),
-                    health_classification_name=(str(health_raw).strip() if health_raw else None),
-                    conclusion_text=(str(conclusion_raw).strip() if conclusion_raw else None),
-                    vaccinated=bool(vaccinated_flag),
-                    vaccine_name=(vaccine_name_value if vaccinated_flag and vaccine_name_value else None),
-                    vaccination_date=vac_date_parsed,
-                    note=(str(note_raw).strip() if note_raw else None),
-                    is_valid=is_valid,
-                    error_message=(error_message.strip(' ;') if error_message else None),
-                ))
-
-            # lưu tạm và render partial preview
-            HealthRecordTemp.objects.bulk_create(temp_objects)
-            temps = HealthRecordTemp.objects.filter(batch_id=batch_id).order_by('employee_code')
-
-            total = temps.count()
-            valid_count = temps.filter(is_valid=True).count()
-            invalid_count = temps.filter(is_valid=False).count()
-            all_valid = invalid_count == 0
-
-            html = render_to_string('health_records/_healthrecord_preview_table.html', {
-                'temps': temps,
-                'batch_id': batch_id,
-                'total': total,
-                'valid_count': valid_count,
-                'invalid_count': invalid_count,
-                'all_valid': all_valid,
-            })
-
-            return JsonResponse({'html': html})
+            batch_id = staging.new_batch_id()
+            staging.claim(request, batch_id)
+            from .importers import preview_healthrecords
+            from .readers import spool_upload
+
+            path = spool_upload(request.FILES['file'])
+            job = import_jobs.submit('healthrecord_preview', batch_id, preview_healthrecords, path, batch_id,
+                                     cleanup=[path])
+            return JsonResponse(job_payload(job), status=202)
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -819,54 +743,21 @@ def healthrecord_import_preview_ajax(request):
     return JsonResponse({'error': 'Không có file được tải lên.'}, status=400)
 
 # ------------------------------
-# Submit batch (AJAX) — lưu HealthRecord từ HealthRecordTemp
+# Submit batch (AJAX) — lưu HealthRecord từ HealthRecordTemp (chạy nền)
 # ------------------------------
-@transaction.atomic
 def healthrecord_import_submit_ajax(request, batch_id):
     if request.method != 'POST':
         return JsonResponse({'error':'Phải gọi POST'}, status=405)
-    try:
-        temps = HealthRecordTemp.objects.filter(batch_id=batch_id, is_valid=True)
-        if not temps.exists():
-            return JsonResponse({'error':'Không có dữ liệu hợp lệ để lưu.'}, status=400)
-
-        created = 0
-        for t in temps:
-            try:
-                emp = Employee.objects.get(code__iexact=t.employee_code)
-            except Employee.DoesNotExist:
-                continue
-
-            exam_type = ExaminationType.objects.filter(name__iexact=(t.examination_type_name or "").strip()).first()
-            hc = HealthClassification.objects.filter(name__iexact=(t.health_classification_name or "").strip()).first()
-
-            rec, was_created = HealthRecord.objects.update_or_create(
-                employee=emp,
-                year=t.year or (t.exam_date.year if t.exam_date else timezone.now().year),
-                defaults={
-                    'exam_date': t.exam_date,
-                    'examination_type': exam_type,
-                    'clinic_name': t.clinic_name,
-                    'height_cm': t.height_cm,
-                    'weight_kg': t.weight_kg,
-                    'blood_pressure': t.blood_pressure,
-                    'health_classification': hc,
-                    'conclusion_text': t.conclusion_text,
-                    'vaccinated': t.vaccinated,
-                    'vaccine_name': t.vaccine_name if t.vaccinated else None,
-                    'vaccination_date': t.vaccination_date,
-                    'note': t.note,
-                }
-            )
-            if was_created:
-                created += 1
+    if not staging.owns(request, batch_id):
+        return batch_not_found()
+    if not staging.get_store().has_valid(HealthRecordTemp, batch_id):
+        return JsonResponse({'error':'Không có dữ liệu hợp lệ để lưu.'}, status=400)
+    if import_jobs.has_active_job(batch_id, ['healthrecord_submit']):
+        return JsonResponse({'error': 'Batch này đang được lưu.'}, status=409)
+    from .importers import commit_healthrecords
 
-        HealthRecordTemp.objects.filter(batch_id=batch_id).delete()
-        return JsonResponse({'success': True, 'created': created})
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return JsonResponse({'error': f'Lỗi khi lưu: {e}'}, status=500)
+    job = import_jobs.submit('healthrecord_submit', batch_id, commit_healthrecords, batch_id)
+    return JsonResponse(job_payload(job), status=202)
 
 # ------------------------------
 # Cancel batch (AJAX)
@@ -874,8 +765,14 @@ def healthrecord_import_submit_ajax(request, batch_id):
 def healthrecord_import_cancel_ajax(request, batch_id):
     if request.method not in ('POST','GET'):
         return JsonResponse({'error':'Method not allowed'}, status=405)
-    HealthRecordTemp.objects.filter(batch_id=batch_id).delete()
-    return JsonResponse({'success': True})
+    if not staging.owns(request, batch_id):
+        return batch_not_found()
+    # tác vụ đang chạy tự dọn dữ liệu tạm khi dừng
+    cancelled = import_jobs.cancel(batch_id)
+    if not cancelled:
+        staging.get_store().delete(HealthRecordTemp, batch_id)
+    staging.release(request, batch_id)
+    return JsonResponse({'success': True, 'cancelled_jobs': cancelled})
 # ----------------- END: Paste-ready block -----------------
 
 
@@ -888,124 +785,74 @@ def employee_import(request):
         'title': 'Import danh sách nhân viên'
     })
 
-# 1️⃣ AJAX import preview (có log lỗi chi tiết)
+# 1️⃣ AJAX import preview (có log lỗi chi tiết) — đọc file trong nền
 def employee_import_preview_ajax(request):
     if request.method == 'POST' and request.FILES.get('file'):
         try:
-            file = request.FILES['file']
-            df = pd.read_excel(file)
-            batch_id = str(uuid.uuid4())[:8]
-
-            EmployeeTemp.objects.all().delete()
-            temp_objects = []
-
-            for _, row in df.iterrows():
-                code = row.get('Mã nhân viên')
-                full_name = row.get('Họ và tên')
-                dept_name = row.get('Khoa/Phòng')
-                gender = row.get('Giới tính')
-                job_title = row.get('Chức danh nghề nghiệp')
-                position = row.get('Chức vụ')
-                birth_year = row.get('Năm sinh')
-
-                if pd.isna(code): code = None
-                if pd.isna(full_name): full_name = None
-                if pd.isna(dept_name): dept_name = None
-                if pd.isna(gender): gender = None
-                if pd.isna(job_title): job_title = None
-                if pd.isna(position): position = None
-                if pd.isna(birth_year): birth_year = None
-
-                is_valid = True
-                error_message = None
-
-                if not code or not full_name:
-                    is_valid = False
-                    error_message = "Thiếu mã nhân viên hoặc họ tên"
-                else:
-                    if dept_name:
-                        dept = Department.objects.filter(name__iexact=dept_name.strip()).first()
-                        if not dept:
-                            is_valid = False
-                            error_message = f"Khoa/Phòng '{dept_name}' chưa tồn tại"
-
-                temp_objects.append(EmployeeTemp(
-                    batch_id=batch_id,
-                    code=str(code).strip() if code else None,
-                    full_name=str(full_name).strip() if full_name else None,
-                    birth_year=int(birth_year) if birth_year else None,
-                    gender=str(gender).capitalize() if gender else None,
-                    job_title=job_title,
-                    position=position,
-                    department_name=dept_name,
-                    is_valid=is_valid,
-                    error_message=error_message,
-                ))
-
-            EmployeeTemp.objects.bulk_create(temp_objects)
-            temps = EmployeeTemp.objects.filter(batch_id=batch_id).order_by('code')
-
-            total = temps.count()
-            valid_count = temps.filter(is_valid=True).count()
-            invalid_count = temps.filter(is_valid=False).count()
-            all_valid = invalid_count == 0
-
-            html = render_to_string('health_records/_employee_preview_table.html', {
-                'temps': temps,
-                'batch_id': batch_id,
-                'total': total,
-                'valid_count': valid_count,
-                'invalid_count': invalid_count,
-                'all_valid': all_valid,
-            })
-
-            return JsonResponse({'html': html})
+            batch_id = staging.new_batch_id()
+            staging.claim(request, batch_id)
+            from .importers import preview_employees
+            from .readers import spool_upload
+
+            path = spool_upload(request.FILES['file'])
+            create_departments = request.POST.get('create_departments') in ('1', 'on', 'true')
+            job = import_jobs.submit('employee_preview', batch_id, preview_employees, path, batch_id,
+                                     create_departments, cleanup=[path])
+            return JsonResponse(job_payload(job), status=202)
         except Exception as e:
             return JsonResponse({'error': f"Lỗi xử lý file: {e}"}, status=500)
 
     return JsonResponse({'error': 'Không có file được tải lên.'}, status=400)
 
-# 2️⃣ Lưu chính thức
-@transaction.atomic
+# 2️⃣ Lưu chính thức (chạy nền)
 def employee_import_submit_ajax(request, batch_id):
-    try:
-        temps = EmployeeTemp.objects.filter(batch_id=batch_id, is_valid=True)
-        if not temps.exists():
-            return JsonResponse({'error': 'Không có dữ liệu hợp lệ để lưu.'}, status=400)
-
-        for temp in temps:
-            dept_name = (temp.department_name or "").strip()
-            dept = Department.objects.filter(name__iexact=dept_name).first() if dept_name else None
-
-            Employee.objects.update_or_create(
-                code=str(temp.code).strip(),
-                defaults={
-                    'full_name': (temp.full_name or "").strip(),
-                    'birth_year': temp.birth_year or None,
-                    'gender': temp.gender or None,
-                    'job_title': temp.job_title or "",
-                    'position': temp.position or "",
-                    'department': dept,
-                }
-            )
-
-        # Dọn batch tạm sau khi lưu xong
-        EmployeeTemp.objects.filter(batch_id=batch_id).delete()
-        return JsonResponse({'success': True})
-
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return JsonResponse({'error': f'Lỗi khi lưu dữ liệu: {e}'}, status=500)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Phải gọi POST'}, status=405)
+    if not staging.owns(request, batch_id):
+        return batch_not_found()
+    if not staging.get_store().has_valid(EmployeeTemp, batch_id):
+        return JsonResponse({'error': 'Không có dữ liệu hợp lệ để lưu.'}, status=400)
+    if import_jobs.has_active_job(batch_id, ['employee_submit']):
+        return JsonResponse({'error': 'Batch này đang được lưu.'}, status=409)
+    from .importers import commit_employees
+
+    # dùng lại lựa chọn "tạo Khoa/Phòng mới" của lần xem trước batch này
+    preview = ImportJob.objects.filter(batch_id=batch_id, kind='employee_preview', status='done').first()
+    create_departments = bool(preview and preview.result.get('create_departments'))
+    job = import_jobs.submit('employee_submit', batch_id, commit_employees, batch_id, create_departments)
+    return JsonResponse(job_payload(job), status=202)
 
 
 # 3️⃣ Huỷ batch
 def employee_import_cancel_ajax(request, batch_id):
-    EmployeeTemp.objects.filter(batch_id=batch_id).delete()
-    return JsonResponse({'success': True})
+    if not staging.owns(request, batch_id):
+        return batch_not_found()
+    # tác vụ đang chạy tự dọn dữ liệu tạm khi dừng
+    cancelled = import_jobs.cancel(batch_id)
+    if not cancelled:
+        staging.get_store().delete(EmployeeTemp, batch_id)
+    staging.release(request, batch_id)
+    return JsonResponse({'success': True, 'cancelled_jobs': cancelled})
 
 
 def download_sample_employee(request):
     file_path = os.path.join(settings.BASE_DIR, 'static', 'samples', 'mau_import_nv.xlsx')
     return FileResponse(open(file_path, 'rb'), as_attachment=True, filename='mau_import_nv.xlsx')
 
+
+# ========== SỐ LIỆU HIỆU NĂNG (Prometheus) ==========
+def metrics_view(request):
+    """
+    Số liệu dạng text cho Prometheus. Cần header Bearer khớp HEALTH_METRICS_TOKEN;
+    chưa đặt token thì chỉ mở khi DEBUG, còn lại trả 404.
+    """
+    token = getattr(settings, 'HEALTH_METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=404)
+    elif request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    for name, info in staging.table_stats().items():
+        metrics.set_gauge('mphr_staging_rows', {'table': name}, info['rows'])
+        metrics.set_gauge('mphr_staging_batches', {'table': name}, info['batches'])
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')